@@ -0,0 +1,115 @@
+"""Benchmark for browser request blocking profiles.
+
+Serves a local fixture site whose pages reference slow images, fonts
+and media files, then renders the pages with and without a blocking
+profile and reports the average time per page.
+
+Example:
+    Command-line usage::
+
+        $ python -m benchmarks.blocking --chromedriver_path chromedriver --profile media
+"""
+
+import threading
+import time
+from argparse import ArgumentParser
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+import netwatch.scraper as scraper
+
+ASSETS = {
+    "png": "image/png",
+    "woff2": "font/woff2",
+    "mp4": "video/mp4",
+}
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _FixtureHandler(SimpleHTTPRequestHandler):
+    assets = 20
+    delay = 0.2
+
+    def do_GET(self):
+        extension = self.path.rsplit(".", 1)[-1]
+        if extension in ASSETS:
+            time.sleep(self.delay)
+            self._respond(ASSETS[extension], b"\0" * 50000)
+            return
+
+        tags = []
+        for i in range(self.assets):
+            tags.append('<img src="/img{}.png">'.format(i))
+            tags.append(
+                "<style>@font-face {{font-family: f{0}; src: url(/font{0}.woff2);}}"
+                " .f{0} {{font-family: f{0};}}</style>"
+                '<span class="f{0}">text</span>'.format(i)
+            )
+        tags.append('<video src="/video.mp4" autoplay muted></video>')
+        body = '<html><body>{}<div id="content">{}</div></body></html>'.format(
+            "".join(tags), self.path)
+        self._respond("text/html", body.encode())
+
+    def _respond(self, content_type, body):
+        self.send_response(200)
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run(pool, url, pages, profile):
+    site_data = [
+        scraper.SiteData(
+            id=str(i),
+            link="{}/page{}".format(url, i),
+            selector="#content",
+            wait_for="network_idle",
+            block_profile=profile,
+        )
+        for i in range(pages)
+    ]
+    start = time.time()
+    scraper.fetch_browser_html(site_data, pool)
+    elapsed = time.time() - start
+    if any(data.status != "ok" for data in site_data):
+        print("Warning: some pages did not load")
+    return elapsed / pages
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--chromedriver_path", default="chromedriver")
+    parser.add_argument("--profile", default="all",
+                        help="Blocking profile to compare against no blocking")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--assets", type=int, default=20,
+                        help="Images and fonts on each fixture page")
+    parser.add_argument("--delay", type=float, default=0.2,
+                        help="Seconds the fixture site takes to serve an asset")
+    args = parser.parse_args()
+
+    _FixtureHandler.assets = args.assets
+    _FixtureHandler.delay = args.delay
+    server = _ThreadingHTTPServer(("localhost", 0), _FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://localhost:{}".format(server.server_port)
+
+    pool = scraper.DriverPool(args.chromedriver_path, size=1)
+    try:
+        run(pool, url, 1, "none")  # warm up the driver
+        for profile in ["none", args.profile]:
+            times = [run(pool, url, args.pages, profile)
+                     for _ in range(args.rounds)]
+            print("{:>10}: {:.3f}s per page (best {:.3f}s)".format(
+                profile, sum(times) / len(times), min(times)))
+    finally:
+        pool.close()
+        server.shutdown()
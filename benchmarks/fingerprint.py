@@ -0,0 +1,84 @@
+"""Benchmark for SimHash page fingerprints.
+
+Generates a corpus of realistic listing pages, then reports the
+throughput of fingerprinting them and the similarity estimated for
+edits of increasing size, which helps choosing an Alert's
+similarity_threshold. Run it with and without numpy installed to
+compare the vectorized and pure Python implementations.
+
+Example:
+    Command-line usage::
+
+        $ python -m benchmarks.fingerprint --pages 50 --items 500
+"""
+
+import random
+import time
+from argparse import ArgumentParser
+
+import netwatch.content as content
+
+WORDS = [
+    "price", "sale", "new", "shipping", "review", "stock", "order", "color",
+    "size", "brand", "model", "rating", "deal", "limited", "offer", "today",
+] + ["item{}".format(i) for i in range(2000)]
+
+
+def render_item(rng):
+    return (
+        '<li class="product" data-sku="{0}"><a href="/p/{0}">{1}</a>'
+        '<span class="price">${2}.{3:02d}</span><p>{4}</p></li>'.format(
+            rng.randrange(100000),
+            " ".join(rng.choice(WORDS) for _ in range(4)),
+            rng.randrange(1, 500),
+            rng.randrange(100),
+            " ".join(rng.choice(WORDS) for _ in range(20)),
+        )
+    )
+
+
+def render_page(rng, items):
+    return "<html><body><ul>\n{}\n</ul></body></html>".format(
+        "\n".join(render_item(rng) for _ in range(items)))
+
+
+def edit_page(rng, page, fraction):
+    rows = page.split("\n")
+    items = range(1, len(rows) - 1)
+    for i in rng.sample(items, max(1, int(len(items) * fraction))):
+        rows[i] = render_item(rng)
+    return "\n".join(rows)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--items", type=int, default=500,
+                        help="Products listed on each page")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    pages = [render_page(rng, args.items) for _ in range(args.pages)]
+    megabytes = sum(len(page) for page in pages) / 1e6
+
+    start = time.time()
+    fingerprints = [content.fingerprint_html(page) for page in pages]
+    elapsed = time.time() - start
+    print("Corpus: {} pages, {:.1f} MB, numpy {}".format(
+        args.pages, megabytes,
+        "enabled" if content.numpy is not None else "not installed"))
+    print("Fingerprints: {:.1f} MB/s, {:.1f} ms per page".format(
+        megabytes / elapsed, elapsed / args.pages * 1000))
+
+    for fraction in [0, 0.01, 0.05, 0.2, 0.5, 1]:
+        similarities = [
+            content.similarity(
+                fingerprint,
+                content.fingerprint_html(
+                    edit_page(rng, page, fraction)
+                    if fraction else page),
+            )
+            for page, fingerprint in zip(pages, fingerprints)
+        ]
+        print("{:>4.0%} of items edited: similarity {:.3f} (min {:.3f})".format(
+            fraction, sum(similarities) / len(similarities), min(similarities)))
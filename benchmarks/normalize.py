@@ -0,0 +1,90 @@
+"""Benchmark for content normalization.
+
+Generates a synthetic corpus of large pages full of rotating tokens,
+timestamps and ad slots, then reports the throughput of hashing the
+raw HTML against normalizing and hashing it, and checks that the
+normalized hashes are stable across two renders of each page.
+
+Example:
+    Command-line usage::
+
+        $ python -m benchmarks.normalize --pages 200 --size 200000
+"""
+
+import random
+import time
+from argparse import ArgumentParser
+from secrets import token_hex
+
+import netwatch.content as content
+
+RULES = {
+    "strip_attributes": ["nonce", "data-csrf*"],
+    "drop_selectors": ["script", ".ad-slot", "input[name=csrf_token]"],
+    "drop_comments": True,
+    "regex": [[r"\d{2}:\d{2}:\d{2}", ""]],
+    "collapse_whitespace": True,
+}
+
+
+def render_page(seed, size):
+    rng = random.Random(seed)
+    parts = [
+        "<!DOCTYPE html><html><head>",
+        '<script nonce="{}">var t = {};</script>'.format(
+            token_hex(8), time.time()),
+        "</head><body>",
+        '<form data-csrf-token="{0}"><input name="csrf_token" value="{0}">'
+        "</form>".format(token_hex(16)),
+    ]
+    length = 0
+    while length < size:
+        words = " ".join(
+            rng.choice(["alpha", "beta", "gamma", "delta"]) for _ in range(30))
+        part = (
+            '<div class="item" id="item{0}">\n    <p>{1}</p>\n'
+            "    <span>Updated {2}</span>\n"
+            '    <div class="ad-slot"><img src="/ad/{3}.png"></div>'
+            "<!-- {3} -->\n</div>\n".format(
+                length, words, time.strftime("%H:%M:%S"), token_hex(4))
+        )
+        parts.append(part)
+        length += len(part)
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def measure(pages, function):
+    start = time.time()
+    hashes = [function(page) for page in pages]
+    return time.time() - start, hashes
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--size", type=int, default=200000,
+                        help="Approximate size of each page in characters")
+    args = parser.parse_args()
+
+    first = [render_page(i, args.size) for i in range(args.pages)]
+    second = [render_page(i, args.size) for i in range(args.pages)]
+    megabytes = sum(len(page) for page in first) / 1e6
+
+    raw_time, raw_first = measure(first, content.hash_html)
+    _, raw_second = measure(second, content.hash_html)
+    normalized_time, normalized_first = measure(
+        first, lambda page: content.hash_html(
+            content.normalize_html(page, RULES)))
+    _, normalized_second = measure(
+        second, lambda page: content.hash_html(
+            content.normalize_html(page, RULES)))
+
+    print("Corpus: {} pages, {:.1f} MB".format(args.pages, megabytes))
+    print("       raw: {:.1f} MB/s, {} of {} pages stable".format(
+        megabytes / raw_time,
+        sum(a == b for a, b in zip(raw_first, raw_second)), args.pages))
+    print("normalized: {:.1f} MB/s, {} of {} pages stable".format(
+        megabytes / normalized_time,
+        sum(a == b for a, b in zip(normalized_first, normalized_second)),
+        args.pages))
@@ -10,4 +10,8 @@ import netwatch.messenger as messenger
 import netwatch.scraper as scraper
 import netwatch.store as store
 import netwatch.common as common
+import netwatch.content as content
+import netwatch.backend as backend
+import netwatch.snapshots as snapshots
+import netwatch.metrics as metrics
 from netwatch.main import run
\ No newline at end of file
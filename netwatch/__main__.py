@@ -1,5 +1,6 @@
 from argparse import ArgumentParser
 from netwatch.main import run
+import netwatch.common
 import netwatch.messenger
 import netwatch.scraper
 import netwatch.ui
@@ -34,9 +35,23 @@ if __name__ == "__main__":
 
     parser.add_argument("--scraper", action="store_true",
                         help="Flag for using the scraper module")
-    parser.add_argument("--link", help="Link to page to be scraped")
+    parser.add_argument(
+        "--link", nargs="+", help="Link(s) to page(s) to be scraped")
     parser.add_argument(
         "--selector", help="CSS selector for portion of page to be scraped")
+    parser.add_argument(
+        "--fetch_mode",
+        help="http, browser or auto",
+        choices=netwatch.scraper.FETCH_MODES,
+        default="auto",
+    )
+    parser.add_argument(
+        "--chromedriver_path", help="Path to chromedriver", default="chromedriver")
+    parser.add_argument(
+        "--rate_limit",
+        type=float,
+        help="Page loads per second for each host. Defaults to the configured rate_limit",
+    )
 
     parser.add_argument("--gui", action="store_true",
                         help="Starts the NetWatch GUI on its own")
@@ -63,13 +78,20 @@ if __name__ == "__main__":
                 body_type="text/plain"
             )
     elif args.scraper:
-        data = netwatch.scraper.fetch_site_html(netwatch.scraper.SiteData(
-            id="",
-            link=args.link,
-            selector=args.selector
-        ))[0]
-
-        print("{} - {} - {}".format(args.link, args.selector, data.html))
+        limits = netwatch.common.rate_limit_options()
+        if args.rate_limit:
+            limits["rate"] = args.rate_limit
+        netwatch.scraper.get_rate_limiter(**limits)
+        for data in netwatch.scraper.iter_site_html([
+            netwatch.scraper.SiteData(
+                id="",
+                link=link,
+                selector=args.selector or "",
+                fetch_mode=args.fetch_mode,
+            ) for link in args.link
+        ], chromedriver_path=args.chromedriver_path):
+            print("{} - {} - {}".format(data.link, args.selector, data.html))
+        netwatch.scraper.close_driver_pool()
     elif args.gui:
         netwatch.ui.GUI()
     else:
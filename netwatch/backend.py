@@ -0,0 +1,332 @@
+"""Module for running the fetch, extract and hash stage of checks.
+
+Checks run either on threads of the current process (the `thread`
+backend) or spread over a pool of worker processes (the `process`
+backend), which lets the CPU-bound parsing and hashing use every
+core. Worker processes keep their own webdriver pools between
+batches and only send compact results back: the HTML of a page is
+dropped unless its hash differs from the page's previous hash. The
+workers take their page load tokens from one RateLimiter kept in a
+manager process, so a host's rate limit holds across workers and
+across concurrent batches. When a
+worker batch fails, its SiteData get the status "error", and a pool
+whose worker died is replaced on the next call.
+
+Attributes:
+    BACKENDS (List[str]): Valid backend names.
+"""
+
+import concurrent.futures
+import multiprocessing.util
+import os
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.managers import BaseManager
+from threading import Lock
+from urllib.parse import urlparse
+
+import netwatch.content
+import netwatch.scraper
+
+BACKENDS = ["thread", "process"]
+
+_process_pool = None
+_process_pool_workers = None
+_process_pool_lock = Lock()
+_limiter_manager = None
+_rate_limiter = None
+
+
+class _LimiterManager(BaseManager):
+    pass
+
+
+_LimiterManager.register(
+    "RateLimiter", netwatch.scraper.RateLimiter,
+    exposed=["configure", "reserve"])
+
+
+def check_sites(
+    site_data, backend="thread", workers=None, pool_options={}, fetch_options={},
+    limiter_options=None, stop_event=None,
+):
+    """Fetches and hashes SiteData.
+
+    Args:
+        site_data (List[SiteData]): SiteData to be checked.
+        backend (str): Optional; One of BACKENDS.
+        workers (int): Optional; Number of worker processes for the
+            `process` backend. Defaults to the number of CPUs.
+        pool_options (Dict): Optional; Keyword arguments for
+            netwatch.scraper.get_driver_pool.
+        fetch_options (Dict): Optional; Keyword arguments for
+            netwatch.scraper.iter_site_html.
+        limiter_options (Dict): Optional; Keyword arguments for
+            netwatch.scraper.get_rate_limiter, applied to the shared
+            rate limiter of the process doing the fetches.
+        stop_event (threading.Event): Optional; Event that cancels the
+            check once set. SiteData that are not done yet are left
+            out of the results.
+
+    Returns:
+        List[SiteData]: Checked SiteData, in the order they were given.
+    """
+
+    for _ in iter_check_sites(
+        site_data, backend, workers, pool_options, fetch_options,
+        limiter_options, stop_event,
+    ):
+        pass
+    return site_data
+
+
+def iter_check_sites(
+    site_data, backend="thread", workers=None, pool_options={}, fetch_options={},
+    limiter_options=None, stop_event=None, batch=False,
+):
+    """Yields SiteData as soon as each one has been fetched and hashed.
+
+    See check_sites for a description of the arguments. With the
+    `process` backend, results arrive one worker batch at a time, all
+    pages of a host go to the same worker, and every worker takes its
+    tokens from the same rate limiter. Worker processes do not see `stop_event`;
+    once it is set, batches that have not started are cancelled and
+    running batches are no longer waited for.
+
+    With `batch`, lists of every SiteData that is done at the time
+    are yielded instead of one SiteData at a time.
+
+    Yields:
+        SiteData or List[SiteData]: Checked SiteData, in order of
+            completion.
+    """
+
+    if backend == "process":
+        executor = _get_process_pool(workers)
+        try:
+            chunks = _submit_chunks(
+                executor, site_data, pool_options, fetch_options,
+                limiter_options)
+        except BrokenProcessPool:
+            _discard_process_pool(executor)
+            executor = _get_process_pool(workers)
+            chunks = _submit_chunks(
+                executor, site_data, pool_options, fetch_options,
+                limiter_options)
+        pending = set(chunks)
+        while pending:
+            if stop_event is not None and stop_event.is_set():
+                # Batches that have already finished are still returned.
+                for future in pending:
+                    future.cancel()
+                finished = set(
+                    future for future in pending
+                    if future.done() and not future.cancelled()
+                )
+                pending = set()
+            else:
+                finished, pending = concurrent.futures.wait(
+                    pending,
+                    timeout=None if stop_event is None
+                    else netwatch.scraper.POLL_INTERVAL,
+                    return_when=FIRST_COMPLETED,
+                )
+            ready = []
+            for future in finished:
+                try:
+                    results = future.result()
+                except Exception as e:
+                    print("Worker batch failed", e)
+                    if isinstance(e, BrokenProcessPool):
+                        _discard_process_pool(executor)
+                    for data in chunks[future]:
+                        data.status = "error"
+                        data.error = "Worker failed: {}".format(e)
+                        ready.append(data)
+                    continue
+                for data, result in zip(chunks[future], results):
+                    data.__dict__.update(result.__dict__)
+                    ready.append(data)
+            if batch:
+                if ready:
+                    yield ready
+            else:
+                yield from ready
+        return
+
+    pool = netwatch.scraper.get_driver_pool(**pool_options)
+    if limiter_options is not None:
+        netwatch.scraper.get_rate_limiter(**limiter_options)
+    for result in netwatch.scraper.iter_site_html(
+        site_data, pool=pool, stop_event=stop_event, batch=batch,
+        **fetch_options
+    ):
+        if batch:
+            yield [_hash(data) for data in result]
+        else:
+            yield _hash(result)
+
+
+def shutdown(wait=True, timeout=None):
+    """Shuts down the worker processes of the `process` backend.
+
+    Args:
+        wait (bool): Optional; Wait for running batches to finish.
+        timeout (float): Optional; Seconds to wait for running
+            batches before the worker processes are terminated, which
+            kills their webdrivers. None waits as long as they take.
+    """
+
+    global _process_pool, _limiter_manager, _rate_limiter
+    with _process_pool_lock:
+        executor, _process_pool = _process_pool, None
+        manager, _limiter_manager, _rate_limiter = _limiter_manager, None, None
+    if executor is not None:
+        _shutdown_workers(executor, wait, timeout)
+    if manager is not None:
+        manager.shutdown()
+
+
+def _shutdown_workers(executor, wait, timeout):
+    if not wait or timeout is None:
+        executor.shutdown(wait=wait)
+        return
+
+    # The executor has no public handle on its worker processes.
+    processes = list(getattr(executor, "_processes", {}).values())
+    executor.shutdown(wait=False)
+    deadline = time.time() + timeout
+    for process in processes:
+        process.join(max(0, deadline - time.time()))
+    running = [process for process in processes if process.is_alive()]
+    if running:
+        print("Terminating {} worker process(es)".format(len(running)))
+    for process in running:
+        process.terminate()
+    for process in running:
+        process.join(5)
+        if process.is_alive():
+            process.kill()
+
+
+def _hash(data):
+    if data.status == "ok":
+        try:
+            _hash_content(data)
+        except Exception as e:
+            print("Hashing failed for {}".format(data.link), e)
+            data.status = "error"
+            data.error = "Hashing failed: {}".format(e)
+    return data
+
+
+def _hash_content(data):
+    start = time.time()
+    pieces = data.html
+    if data.normalize:
+        pieces = netwatch.content.get_normalizer(
+            data.normalize).normalize_pieces(data.html)
+        data.html = "".join(pieces)
+        data.timings["normalize"] = time.time() - start
+        start = time.time()
+    data.hash_algorithm = netwatch.content.get_hash_algorithm(
+        data.hash_algorithm)
+    data.hash = netwatch.content.hash_html(pieces, data.hash_algorithm)
+    if (
+        data.previous_hash
+        and data.previous_hash_algorithm != data.hash_algorithm
+        # A hash from an algorithm that is unavailable here cannot be
+        # compared, so the content is re-baselined instead.
+        and data.previous_hash_algorithm in netwatch.content.HASH_ALGORITHMS
+        and netwatch.content.hash_html(
+            pieces, data.previous_hash_algorithm) == data.previous_hash
+    ):
+        # Unchanged content hashed with an older algorithm.
+        data.previous_hash = data.hash
+    data.timings["hash"] = time.time() - start
+    if data.hash != data.previous_hash:
+        start = time.time()
+        data.fingerprint = netwatch.content.fingerprint_html(data.html)
+        data.timings["fingerprint"] = time.time() - start
+
+
+def _chunk(site_data, count):
+    """Splits SiteData into chunks that keep each host together."""
+
+    hosts = {}
+    for page in netwatch.scraper.group_site_data(site_data):
+        host = urlparse(page[0].link).netloc.lower()
+        hosts.setdefault(host, []).extend(page)
+    chunks = [[] for _ in range(count)]
+    for host_data in sorted(hosts.values(), key=len, reverse=True):
+        min(chunks, key=len).extend(host_data)
+    return [chunk for chunk in chunks if len(chunk) > 0]
+
+
+def _submit_chunks(
+    executor, site_data, pool_options, fetch_options, limiter_options
+):
+    chunks = {}
+    for chunk in _chunk(site_data, _process_pool_workers):
+        future = executor.submit(
+            _check_chunk, chunk, pool_options, fetch_options, limiter_options)
+        chunks[future] = chunk
+    return chunks
+
+
+def _discard_process_pool(executor):
+    """Drops a broken pool so that the next call starts a new one."""
+
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is executor:
+            _process_pool = None
+    executor.shutdown(wait=False)
+
+
+def _get_process_pool(workers):
+    global _process_pool, _process_pool_workers, _limiter_manager
+    global _rate_limiter
+    workers = workers or os.cpu_count() or 1
+    with _process_pool_lock:
+        if _process_pool is not None and _process_pool_workers != workers:
+            _process_pool.shutdown(wait=False)
+            _process_pool = None
+        if _limiter_manager is None:
+            _limiter_manager = _LimiterManager()
+            _limiter_manager.start()
+            _rate_limiter = _limiter_manager.RateLimiter()
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                workers, initializer=_initialize_worker,
+                initargs=(_rate_limiter,))
+            _process_pool_workers = workers
+        return _process_pool
+
+
+def _initialize_worker(rate_limiter):
+    netwatch.scraper.set_rate_limiter(rate_limiter)
+    # Quit the worker's webdrivers when the worker process exits, and
+    # kill them when it is terminated.
+    multiprocessing.util.Finalize(
+        None, netwatch.scraper.close_driver_pool, exitpriority=10)
+    signal.signal(signal.SIGTERM, _terminate_worker)
+
+
+def _terminate_worker(signum, frame):
+    netwatch.scraper.close_driver_pool(kill=True)
+    os._exit(1)
+
+
+def _check_chunk(site_data, pool_options, fetch_options, limiter_options):
+    for data in iter_check_sites(
+        site_data,
+        pool_options=pool_options,
+        fetch_options=fetch_options,
+        limiter_options=limiter_options,
+    ):
+        if data.hash == data.previous_hash:
+            data.html = None
+    return site_data
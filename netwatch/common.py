@@ -5,51 +5,369 @@ to fetch site data, compare that data against existing data
 in the store, and send notifications if the website has updated.
 """
 
+import threading
+import time
+from concurrent.futures import Future
 from datetime import datetime
-import hashlib
 
 import keyring
 
+import netwatch.backend
+import netwatch.content
 import netwatch.messenger
 import netwatch.scraper
+import netwatch.snapshots
+from netwatch.metrics import metrics
 from netwatch.store import store
 
+_in_flight = {}
+_in_flight_lock = threading.Lock()
 
-def process_alert(alert_ids):
+
+def process_alert(alert_ids, wait=True, stop_event=None):
     """Processes NetWatch Alerts.
 
     Retreives each Alert's hash/diff from the web scraper,
     checks to see if the website has changed, and sends notifications
     to those that have changed.
 
+    Alerts that are already being processed by another call are not
+    fetched again. With `wait`, the call attaches to the running job
+    and reports its result (counted as `coalesced_runs` in
+    netwatch.metrics); otherwise the Alerts are skipped (counted as
+    `skipped_runs`).
+
     Args:
         alert_ids (List[str]): List of alert ids representing
             Alerts to be processed.
+        wait (bool): Optional; Wait for Alerts that are already being
+            processed instead of skipping them.
+        stop_event (threading.Event): Optional; Event that cancels
+            processing once set. Alerts whose websites were already
+            fetched are still saved and notified.
 
     Returns:
-        List[Alert]: List of Alerts that have changed.
+        List[Alert]: List of Alerts that have changed, in the order
+            they finished processing.
     """
 
+    own = {}
+    attached = {}
+    with _in_flight_lock:
+        for alert_id in dict.fromkeys(alert_ids):
+            if alert_id in _in_flight:
+                attached[alert_id] = _in_flight[alert_id]
+            else:
+                own[alert_id] = _in_flight[alert_id] = Future()
+    if attached:
+        metrics.increment(
+            "coalesced_runs" if wait else "skipped_runs", len(attached))
+
+    changed = []
+    try:
+        if own:
+            for alert, _, notified in iter_process_alert(
+                list(own), stop_event
+            ):
+                own[alert.id].set_result((alert, notified))
+                if notified:
+                    changed.append(alert)
+    except Exception as e:
+        for future in own.values():
+            if not future.done():
+                future.set_exception(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            for alert_id, future in own.items():
+                if _in_flight.get(alert_id) is future:
+                    del _in_flight[alert_id]
+        for future in own.values():
+            if not future.done():
+                future.set_result((None, False))
+
+    if wait:
+        for future in attached.values():
+            alert, notified = future.result()
+            if notified:
+                changed.append(alert)
+    return changed
+
+
+def iter_process_alert(alert_ids, stop_event=None):
+    """Processes NetWatch Alerts as each website finishes loading.
+
+    Alerts are hashed, stored and notified as soon as their websites
+    have been fetched, instead of waiting for the slowest website of
+    the batch. The results of every Alert fetched by then are stored
+    with a single Store.apply_results call before they are notified.
+    The time from the start of processing until
+    each Alert is done is recorded in netwatch.metrics.
+
+    Args:
+        alert_ids (List[str]): List of alert ids representing
+            Alerts to be processed.
+        stop_event (threading.Event): Optional; Event that cancels
+            fetching once set. Alerts whose websites are not fetched
+            by then are not yielded.
+
+    Yields:
+        Tuple[Alert, SiteData, bool]: Each processed Alert, its
+            checked website and whether a notification was sent, in
+            order of completion.
+    """
+
+    start = time.time()
     alerts = store.get_alerts(alert_ids)
-    site_data = netwatch.scraper.fetch_site_html([netwatch.scraper.SiteData(
+    alerts = {alert.id: alert for alert in alerts}
+    hash_algorithm = netwatch.content.get_hash_algorithm(
+        store.get_config("hash_algorithm"))
+    snapshots = netwatch.snapshots.get_snapshot_store(**snapshot_options())
+    sender = store.get_config("email_sender")
+
+    for ready in netwatch.backend.iter_check_sites([netwatch.scraper.SiteData(
         id=alert.id,
         link=alert.link,
         selector=alert.selector,
-    ) for alert in alerts], chromedriver_path=store.get_config("chromedriver_path"))
-    changed = []
-    for i in range(len(alerts)):
-        site_data[i].hash = hashlib.md5(site_data[i].html.encode()).hexdigest()
-        if alerts[i].hash != site_data[i].hash:
-            store.update_alert(id=alerts[i].id, hash=site_data[i].hash)
-            store.create_update(
-                text="{} :: {}: {}".format(
-                    datetime.now().isoformat(), alerts[i].name, alerts[i].alert
-                ),
-                link=alerts[i].link,
-            )
-            changed.append(alerts[i])
-    send_notifications(changed, sender=store.get_config("email_sender"))
-    return changed
+        fetch_mode=alert.fetch_mode,
+        etag=alert.etag,
+        last_modified=alert.last_modified,
+        content_length=alert.content_length,
+        wait_for=alert.wait_for,
+        wait_delay=float(alert.wait_delay),
+        timeout=float(alert.timeout),
+        block_profile=alert.block_profile,
+        normalize=alert.normalize,
+        hash_algorithm=hash_algorithm,
+        previous_hash=alert.hash,
+        previous_hash_algorithm=alert.hash_version,
+    ) for alert in alerts.values()],
+        backend=store.get_config("scraper_backend", "thread"),
+        workers=store.get_config("scraper_workers"),
+        pool_options=driver_pool_options(),
+        fetch_options=fetch_options(),
+        limiter_options=rate_limit_options(),
+        stop_event=stop_event,
+        batch=True,
+    ):
+        results = []
+        values = {}
+        updates = []
+        for data in ready:
+            alert = alerts[data.id]
+            alert_values, update, notify = evaluate_result(
+                alert, data, snapshots)
+            if alert_values:
+                values[alert.id] = alert_values
+            if update:
+                updates.append(update)
+            results.append((alert, data, notify))
+        store.apply_results(values, updates)
+
+        for alert, data, notify in results:
+            if notify:
+                notify_start = time.time()
+                try:
+                    send_notifications([alert], sender=sender)
+                    metrics.increment("notifications")
+                except Exception as e:
+                    print("Failed to notify {}: {}".format(alert.id, e))
+                    metrics.increment("notification_errors")
+                data.timings["notify"] = time.time() - notify_start
+            metrics.record_alert(alert.id, time.time() - start, data.timings)
+            yield alert, data, notify
+
+
+def evaluate_result(alert, site_data, snapshots):
+    """Compares a checked website against its Alert.
+
+    Saves a snapshot of changed content but leaves the store as is, so
+    the results of many Alerts can be applied with one
+    Store.apply_results call.
+
+    Args:
+        alert (Alert): The Alert that was checked.
+        site_data (SiteData): The checked website.
+        snapshots (SnapshotStore): Store for snapshots of changed
+            content.
+
+    Returns:
+        Tuple[Dict, Dict, bool]: The Alert attributes to update, the
+            keyword arguments of an Update to create (or None), and
+            whether a notification should be sent.
+    """
+
+    values = {"last_checked": time.time()}
+    if site_data.error != alert.last_error:
+        values["last_error"] = site_data.error
+    if site_data.status == "not_modified":
+        values["unchanged_checks"] = int(alert.unchanged_checks) + 1
+    if site_data.status != "ok":
+        return values, None, False
+    for key in ["etag", "last_modified", "content_length"]:
+        if getattr(site_data, key) != getattr(alert, key):
+            values[key] = getattr(site_data, key)
+    hash = alert.hash
+    if alert.fetch_mode != site_data.fetch_mode:
+        values["fetch_mode"] = site_data.fetch_mode
+    if alert.hash_version != site_data.hash_algorithm:
+        # Unchanged content is re-baselined on the new algorithm
+        # instead of being notified as a change.
+        values["hash_version"] = site_data.hash_algorithm
+        if site_data.previous_hash == site_data.hash:
+            hash = values["hash"] = site_data.hash
+    if (
+        not alert.hash
+        or alert.hash_version not in netwatch.content.HASH_ALGORITHMS
+        or alert.fetch_mode != site_data.fetch_mode
+    ):
+        # There is no comparable hash: the Alert is new or was edited
+        # to watch other content, its hash was computed with an
+        # algorithm that is unavailable here, or the page was fetched
+        # in another mode (HTTP pages serialize differently than
+        # rendered pages). The content is recorded as a baseline
+        # instead of being notified.
+        values["hash"] = site_data.hash
+        values["fingerprint"] = site_data.fingerprint
+        values["unchanged_checks"] = 0
+        snapshots.put(alert.id, site_data.hash, site_data.html)
+        return values, None, False
+    if hash == site_data.hash:
+        values["unchanged_checks"] = int(alert.unchanged_checks) + 1
+        return values, None, False
+
+    minor = is_minor_change(alert, site_data)
+    values["unchanged_checks"] = 0
+    values["hash"] = site_data.hash
+    values["fingerprint"] = site_data.fingerprint
+    snapshots.put(alert.id, site_data.hash, site_data.html)
+    update = {
+        "text": "{} :: {}: {}{}".format(
+            datetime.now().isoformat(),
+            alert.name,
+            alert.alert,
+            " (minor change)" if minor else "",
+        ),
+        "link": alert.link,
+        "alert_id": alert.id,
+        "old_hash": hash,
+        "new_hash": site_data.hash,
+    }
+    return values, update, not minor
+
+
+def is_minor_change(alert, site_data):
+    """Returns True if a change is too small to notify.
+
+    Args:
+        alert (Alert): Alert whose website changed.
+        site_data (SiteData): The website's new content.
+
+    Returns:
+        bool: True if the new content is at least the Alert's
+            similarity_threshold similar to its previous content.
+    """
+
+    if alert.similarity_threshold in (None, "") or not (
+        alert.fingerprint and site_data.fingerprint
+    ):
+        return False
+    return netwatch.content.similarity(
+        alert.fingerprint, site_data.fingerprint
+    ) >= float(alert.similarity_threshold)
+
+
+def get_update_diff(update_id, mode="html"):
+    """Returns the diff of an Update's content.
+
+    Diffs are computed from the Alert's snapshots the first time they
+    are requested and cached on the Update afterwards.
+
+    Args:
+        update_id (str): Id of the Update.
+        mode (str): Optional; One of netwatch.content.DIFF_MODES.
+
+    Returns:
+        str: Unified diff of the Alert's old and new content, or None
+            if the Update or either snapshot does not exist.
+    """
+
+    update = store.get_update(update_id)
+    if update is None:
+        return None
+    if mode in update.diffs:
+        return update.diffs[mode]
+
+    snapshots = netwatch.snapshots.get_snapshot_store(**snapshot_options())
+    old = snapshots.get(update.old_hash) if update.old_hash else ""
+    new = snapshots.get(update.new_hash)
+    if old is None or new is None:
+        return None
+    diff = netwatch.content.diff_html(old, new, mode)
+    store.set_update_diff(update_id, mode, diff)
+    return diff
+
+
+def driver_pool_options():
+    """Returns the webdriver pool settings configured in the store.
+
+    Returns:
+        Dict: Keyword arguments for netwatch.scraper.get_driver_pool.
+    """
+
+    return {
+        "chromedriver_path": store.get_config(
+            "chromedriver_path", netwatch.scraper.DEFAULT_CHROMEDRIVER_PATH),
+        "size": store.get_config("driver_pool_size", 2),
+        "max_pages": store.get_config("driver_max_pages", 100),
+        "max_memory": store.get_config("driver_max_memory"),
+        "tabs": store.get_config("driver_tabs", 1),
+        "block_profile": store.get_config("block_profile"),
+        "heartbeat_timeout": store.get_config("driver_heartbeat_timeout", 60),
+    }
+
+
+def fetch_options():
+    """Returns the fetch engine settings configured in the store.
+
+    Returns:
+        Dict: Keyword arguments for netwatch.scraper.iter_site_html.
+    """
+
+    return {
+        "concurrency": store.get_config("fetch_concurrency", 10),
+        "per_host": store.get_config("fetch_per_host", 2),
+    }
+
+
+def rate_limit_options():
+    """Returns the per-host rate limits configured in the store.
+
+    Returns:
+        Dict: Keyword arguments for netwatch.scraper.get_rate_limiter.
+    """
+
+    return {
+        "rate": store.get_config("rate_limit"),
+        "burst": store.get_config("rate_limit_burst", 1),
+        "host_rates": store.get_config("host_rate_limits", {}),
+    }
+
+
+def snapshot_options():
+    """Returns the snapshot store settings configured in the store.
+
+    Returns:
+        Dict: Keyword arguments for
+            netwatch.snapshots.get_snapshot_store.
+    """
+
+    return {
+        "delta": store.get_config("snapshot_delta", False),
+        "max_chain": store.get_config("snapshot_max_chain", 10),
+        "max_count": store.get_config("snapshot_max_count", 50),
+        "max_bytes": store.get_config("snapshot_max_bytes"),
+    }
 
 
 def send_notifications(alerts, sender="smtp", smtp_addr="smtp.googlemail.com"):
@@ -0,0 +1,497 @@
+"""Module for processing scraped website content.
+
+This module turns the HTML scraped from a website into the values
+NetWatch compares between checks. Before it is hashed, the HTML can
+be normalized with per-Alert rules so that content which changes on
+every request (CSRF tokens, nonces, timestamps, ad slots) does not
+look like an update.
+
+Normalization rules are a Dict with any of the following keys:
+
+    strip_attributes (List[str]): Attribute names to remove from
+        every element. Shell-style wildcards are allowed, e.g.
+        "data-*".
+    drop_selectors (List[str]): Simple CSS selectors (a tag, #id,
+        .class and [attr] or [attr=value] parts, no combinators) of
+        elements that are removed along with their contents.
+    drop_comments (bool): Removes HTML comments.
+    regex (List[List[str]]): [pattern, replacement] pairs applied to
+        text and attribute values.
+    collapse_whitespace (bool): Collapses runs of whitespace into a
+        single space and drops whitespace-only text.
+
+Attributes:
+    HASH_ALGORITHMS (Dict[str, Callable]): Hash object constructors by
+        name. "xxh3" is only available when xxhash is installed.
+    DEFAULT_HASH_ALGORITHM (str): Fastest available hash algorithm.
+    HASH_CHUNK_SIZE (int): Number of characters encoded and hashed at
+        a time.
+    FINGERPRINT_BITS (int): Size of a SimHash fingerprint in bits.
+    SHINGLE_SIZE (int): Number of consecutive tokens in each feature
+        of a fingerprint.
+    DIFF_MODES (List[str]): Valid diff modes. "html" diffs the markup
+        one element per line, "text" diffs only the visible text.
+    VOID_ELEMENTS (frozenset): Elements that have no end tag.
+
+Example:
+    Import usage::
+
+        >>> import content
+        >>> content.normalize_html(
+                '<p nonce="x1">Updated 10:42</p>',
+                {"strip_attributes": ["nonce"], "regex": [["\\d+:\\d+", ""]]},
+            )
+        '<p>Updated </p>'
+"""
+
+import difflib
+import fnmatch
+import hashlib
+import json
+import re
+from functools import lru_cache
+from html import escape
+from html.parser import HTMLParser
+
+try:
+    import numpy
+except ImportError:  # fingerprints are computed in pure Python without numpy
+    numpy = None
+try:
+    import xxhash
+except ImportError:  # the xxh3 hash algorithm is unavailable without xxhash
+    xxhash = None
+
+HASH_ALGORITHMS = {
+    "md5": hashlib.md5,
+    "blake2b": lambda: hashlib.blake2b(digest_size=16),
+}
+if xxhash is not None:
+    HASH_ALGORITHMS["xxh3"] = xxhash.xxh3_128
+DEFAULT_HASH_ALGORITHM = "xxh3" if xxhash is not None else "blake2b"
+HASH_CHUNK_SIZE = 65536
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 3
+DIFF_MODES = ["html", "text"]
+
+VOID_ELEMENTS = frozenset([
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link",
+    "meta", "param", "source", "track", "wbr",
+])
+
+_SELECTOR_PART = re.compile(
+    r"([a-zA-Z][\w-]*|\*)"
+    r"|#([\w-]+)"
+    r"|\.([\w-]+)"
+    r"|\[\s*([\w:-]+)\s*(?:=\s*[\"']?([^\"'\]]*)[\"']?\s*)?\]"
+)
+_WHITESPACE = re.compile(r"\s+")
+_TAG_START = re.compile(r"(?=<)")
+_TOKEN = re.compile(r"\w+")
+_SHINGLE_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK = (1 << 64) - 1
+
+
+def hash_html(html, algorithm="md5"):
+    """Returns a hash of scraped HTML.
+
+    The HTML is encoded and hashed HASH_CHUNK_SIZE characters at a
+    time, so the whole document is never copied into a single bytes
+    object.
+
+    Args:
+        html (str or Iterable[str]): Scraped HTML, or the pieces of
+            it in order.
+        algorithm (str): Optional; One of HASH_ALGORITHMS.
+
+    Returns:
+        str: Hex digest of the HTML.
+    """
+
+    if algorithm not in HASH_ALGORITHMS:
+        raise Exception("Unavailable hash algorithm: {}".format(algorithm))
+    hasher = HASH_ALGORITHMS[algorithm]()
+    for piece in [html] if isinstance(html, str) else html:
+        for start in range(0, len(piece), HASH_CHUNK_SIZE):
+            hasher.update(piece[start:start + HASH_CHUNK_SIZE].encode())
+    return hasher.hexdigest()
+
+
+def get_hash_algorithm(algorithm=None):
+    """Returns a hash algorithm that is available on this host.
+
+    Args:
+        algorithm (str): Optional; Name of the wanted algorithm.
+
+    Returns:
+        str: `algorithm` if it is one of HASH_ALGORITHMS, otherwise
+            DEFAULT_HASH_ALGORITHM.
+    """
+
+    if algorithm in HASH_ALGORITHMS:
+        return algorithm
+    if algorithm:
+        print("Unavailable hash algorithm {}, using {}".format(
+            algorithm, DEFAULT_HASH_ALGORITHM))
+    return DEFAULT_HASH_ALGORITHM
+
+
+def normalize_html(html, rules):
+    """Normalizes HTML with a set of normalization rules.
+
+    Args:
+        html (str): HTML to be normalized.
+        rules (Dict): Normalization rules. See the module docstring.
+
+    Returns:
+        str: Normalized HTML, or `html` itself if there are no rules.
+    """
+
+    if not rules:
+        return html
+    return get_normalizer(rules).normalize(html)
+
+
+def fingerprint_html(html):
+    """Returns a SimHash fingerprint of scraped HTML.
+
+    Similar pages have fingerprints that differ in few bits, so the
+    size of a change can be estimated by comparing fingerprints with
+    `similarity`. The features are the distinct runs of SHINGLE_SIZE
+    words, so markup repeated all over a page does not outweigh its
+    content. Uses numpy to combine the features when it is installed;
+    both ways produce the same fingerprint.
+
+    Args:
+        html (str): Scraped HTML.
+
+    Returns:
+        str: Hex encoded FINGERPRINT_BITS bit fingerprint.
+    """
+
+    tokens = _TOKEN.findall(html.lower())
+    if not tokens:
+        return "0" * (FINGERPRINT_BITS // 4)
+    token_hashes = {}
+    for token in tokens:
+        if token not in token_hashes:
+            token_hashes[token] = int.from_bytes(hashlib.blake2b(
+                token.encode(), digest_size=8).digest(), "little")
+    values = [token_hashes[token] for token in tokens]
+    count = max(1, len(values) - SHINGLE_SIZE + 1)
+
+    # Each shingle's hash combines its tokens' hashes and is mixed with
+    # the splitmix64 finalizer, all modulo 2 ** 64.
+    if numpy is not None:
+        values = numpy.array(values, dtype="<u8")
+        shingles = values[:count].copy()
+        for offset in range(1, min(SHINGLE_SIZE, len(values))):
+            shingles = shingles * numpy.uint64(_SHINGLE_MULTIPLIER) + values[
+                offset:offset + count]
+        shingles ^= shingles >> numpy.uint64(30)
+        shingles *= numpy.uint64(0xBF58476D1CE4E5B9)
+        shingles ^= shingles >> numpy.uint64(27)
+        shingles *= numpy.uint64(0x94D049BB133111EB)
+        shingles ^= shingles >> numpy.uint64(31)
+        shingles = numpy.unique(shingles)
+        count = len(shingles)
+        bits = numpy.unpackbits(
+            shingles.astype("<u8").view(numpy.uint8), bitorder="little"
+        ).reshape(count, FINGERPRINT_BITS)
+        totals = 2 * bits.sum(axis=0, dtype=numpy.int64) - count
+    else:
+        shingles = set()
+        for i in range(count):
+            shingle = values[i]
+            for offset in range(1, min(SHINGLE_SIZE, len(values))):
+                shingle = (
+                    shingle * _SHINGLE_MULTIPLIER + values[i + offset]
+                ) & _MASK
+            shingle ^= shingle >> 30
+            shingle = (shingle * 0xBF58476D1CE4E5B9) & _MASK
+            shingle ^= shingle >> 27
+            shingle = (shingle * 0x94D049BB133111EB) & _MASK
+            shingle ^= shingle >> 31
+            shingles.add(shingle)
+        totals = [-len(shingles)] * FINGERPRINT_BITS
+        for shingle in shingles:
+            for bit in range(FINGERPRINT_BITS):
+                if shingle >> bit & 1:
+                    totals[bit] += 2
+
+    fingerprint = 0
+    for bit in range(FINGERPRINT_BITS):
+        if totals[bit] > 0:
+            fingerprint |= 1 << bit
+    return "{:0{}x}".format(fingerprint, FINGERPRINT_BITS // 4)
+
+
+def similarity(fingerprint, other):
+    """Returns how similar the pages of two fingerprints are.
+
+    Args:
+        fingerprint (str): Fingerprint from fingerprint_html.
+        other (str): Fingerprint from fingerprint_html.
+
+    Returns:
+        float: 1.0 for identical fingerprints down to 0.0 for
+            fingerprints that differ in every bit.
+    """
+
+    distance = bin(int(fingerprint, 16) ^ int(other, 16)).count("1")
+    return 1 - distance / FINGERPRINT_BITS
+
+
+def diff_html(old, new, mode="html"):
+    """Returns a unified diff of two versions of a page.
+
+    Args:
+        old (str): Previous HTML.
+        new (str): Current HTML.
+        mode (str): Optional; One of DIFF_MODES.
+
+    Returns:
+        str: Unified diff from `old` to `new`.
+    """
+
+    if mode not in DIFF_MODES:
+        raise Exception("Invalid diff mode: {}".format(mode))
+    return "\n".join(difflib.unified_diff(
+        _diff_lines(old, mode), _diff_lines(new, mode),
+        "previous", "current", lineterm="",
+    ))
+
+
+def _diff_lines(html, mode):
+    if mode == "text":
+        parser = _TextParser()
+        parser.feed(html)
+        parser.close()
+        return parser.lines
+    return [
+        line.strip() for line in _TAG_START.split(html) if line.strip()
+    ]
+
+
+def get_normalizer(rules):
+    """Returns the compiled Normalizer for a set of rules.
+
+    Normalizers are cached, so rules are only compiled the first
+    time they are seen.
+
+    Args:
+        rules (Dict): Normalization rules. See the module docstring.
+
+    Returns:
+        Normalizer: Compiled normalizer.
+    """
+
+    return _compile(json.dumps(rules, sort_keys=True))
+
+
+@lru_cache(maxsize=1024)
+def _compile(key):
+    return Normalizer(json.loads(key))
+
+
+class Normalizer:
+    """Compiled normalization rules.
+
+    Attributes:
+        strip_attribute (re.Pattern): Matches attribute names to strip,
+            or None.
+        drop_selectors (List[Tuple]): Parsed selectors of elements to
+            drop.
+        drop_comments (bool): Whether comments are removed.
+        substitutions (List[Tuple[re.Pattern, str]]): Compiled regex
+            scrubs.
+        collapse_whitespace (bool): Whether whitespace is collapsed.
+    """
+
+    def __init__(self, rules):
+        unknown = set(rules) - set([
+            "strip_attributes", "drop_selectors", "drop_comments", "regex",
+            "collapse_whitespace",
+        ])
+        if unknown:
+            raise Exception(
+                "Invalid normalization rule(s): {}".format(", ".join(unknown)))
+
+        patterns = [
+            fnmatch.translate(name.lower())
+            for name in rules.get("strip_attributes", [])
+        ]
+        self.strip_attribute = re.compile(
+            "|".join(patterns)) if patterns else None
+        self.drop_selectors = [
+            _parse_selector(selector.strip())
+            for selectors in rules.get("drop_selectors", [])
+            for selector in selectors.split(",")
+        ]
+        self.drop_comments = bool(rules.get("drop_comments", False))
+        self.substitutions = [
+            (re.compile(pattern), replacement)
+            for pattern, replacement in rules.get("regex", [])
+        ]
+        self.collapse_whitespace = bool(
+            rules.get("collapse_whitespace", False))
+
+    def normalize(self, html):
+        """Normalizes HTML in a single parsing pass.
+
+        Args:
+            html (str): HTML to be normalized.
+
+        Returns:
+            str: Normalized HTML.
+        """
+
+        return "".join(self.normalize_pieces(html))
+
+    def normalize_pieces(self, html):
+        """Normalizes HTML into a list of pieces without joining them.
+
+        Args:
+            html (str): HTML to be normalized.
+
+        Returns:
+            List[str]: Pieces of the normalized HTML, in order.
+        """
+
+        parser = _NormalizingParser(self)
+        parser.feed(html)
+        parser.close()
+        return parser.output
+
+    def scrub(self, text):
+        """Applies the regex scrubs and whitespace collapsing to text."""
+
+        for pattern, replacement in self.substitutions:
+            text = pattern.sub(replacement, text)
+        if self.collapse_whitespace:
+            text = _WHITESPACE.sub(" ", text)
+            if text == " ":
+                return ""
+        return text
+
+    def drops(self, tag, attrs):
+        """Returns True if an element matches a drop selector."""
+
+        for selector_tag, selector_id, classes, attributes in self.drop_selectors:
+            if selector_tag not in (None, "*", tag):
+                continue
+            values = dict(attrs)
+            if selector_id is not None and values.get("id") != selector_id:
+                continue
+            if classes and not classes.issubset(
+                    (values.get("class") or "").split()):
+                continue
+            if all(
+                name in values and (value is None or values[name] == value)
+                for name, value in attributes
+            ):
+                return True
+        return False
+
+
+def _parse_selector(selector):
+    tag, selector_id, classes, attributes = None, None, set(), []
+    position = 0
+    while position < len(selector):
+        match = _SELECTOR_PART.match(selector, position)
+        if match is None or (match.group(1) and position > 0):
+            raise Exception(
+                "Unsupported normalization selector: {}".format(selector))
+        if match.group(1):
+            tag = match.group(1).lower()
+        elif match.group(2):
+            selector_id = match.group(2)
+        elif match.group(3):
+            classes.add(match.group(3))
+        else:
+            attributes.append((match.group(4).lower(), match.group(5)))
+        position = match.end()
+    if position == 0:
+        raise Exception("Empty normalization selector")
+    return tag, selector_id, classes, attributes
+
+
+class _NormalizingParser(HTMLParser):
+    def __init__(self, normalizer):
+        super().__init__(convert_charrefs=True)
+        self.normalizer = normalizer
+        self.output = []
+        self.dropping = []  # stack of open tags inside a dropped element
+
+    def handle_starttag(self, tag, attrs):
+        if self.dropping:
+            if tag not in VOID_ELEMENTS:
+                self.dropping.append(tag)
+            return
+        if self.normalizer.drop_selectors and self.normalizer.drops(tag, attrs):
+            if tag not in VOID_ELEMENTS:
+                self.dropping.append(tag)
+            return
+        self.output.append(self._start_tag(tag, attrs, ">"))
+
+    def handle_startendtag(self, tag, attrs):
+        if self.dropping or (
+            self.normalizer.drop_selectors and self.normalizer.drops(tag, attrs)
+        ):
+            return
+        self.output.append(self._start_tag(tag, attrs, "/>"))
+
+    def handle_endtag(self, tag):
+        if self.dropping:
+            if tag in self.dropping:
+                while self.dropping.pop() != tag:
+                    pass
+            return
+        self.output.append("</{}>".format(tag))
+
+    def handle_data(self, data):
+        if not self.dropping:
+            data = self.normalizer.scrub(data)
+            if data:
+                self.output.append(escape(data, quote=False))
+
+    def handle_comment(self, data):
+        if not self.dropping and not self.normalizer.drop_comments:
+            self.output.append("<!--{}-->".format(data))
+
+    def handle_decl(self, decl):
+        self.output.append("<!{}>".format(decl))
+
+    def _start_tag(self, tag, attrs, end):
+        strip = self.normalizer.strip_attribute
+        parts = [tag]
+        for name, value in attrs:
+            if strip is not None and strip.match(name):
+                continue
+            if value is None:
+                parts.append(name)
+            else:
+                parts.append('{}="{}"'.format(
+                    name, escape(self.normalizer.scrub(value))))
+        return "<{}{}".format(" ".join(parts), end)
+
+
+class _TextParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines = []
+        self.hidden = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self.hidden += 1
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style") and self.hidden:
+            self.hidden -= 1
+
+    def handle_data(self, data):
+        if not self.hidden:
+            text = _WHITESPACE.sub(" ", data).strip()
+            if text:
+                self.lines.append(text)
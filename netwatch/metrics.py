@@ -0,0 +1,129 @@
+"""Module for collecting NetWatch performance metrics.
+
+Metrics are kept in memory and can be read over HTTP with
+``GET /metrics``. Timings are summarized per metric name (count,
+total, minimum, maximum and last value) and the latest timings of
+each Alert are kept for a bounded number of Alerts.
+
+Attributes:
+    MAX_ALERTS (int): Number of Alerts whose latest timings are kept.
+    metrics (Metrics): Singleton instance of the metrics collector.
+
+Example:
+    Import usage::
+
+        >>> from netwatch.metrics import metrics
+        >>> metrics.observe("fetch", 0.42)
+        >>> metrics.increment("notifications")
+        >>> metrics.to_json()["timings"]["fetch"]["count"]
+        1
+"""
+
+from collections import OrderedDict
+from threading import Lock
+
+MAX_ALERTS = 1000
+
+
+class Metrics:
+    """Thread-safe collector of timings and counters.
+
+    Attributes:
+        timings (Dict[str, Dict]): Summary of each timing by name.
+        counters (Dict[str, int]): Value of each counter by name.
+        alerts (OrderedDict[str, Dict]): Latest timings of each Alert,
+            least recently checked first.
+        lock (threading.Lock): Lock for accessing the metrics.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+        self.alerts = OrderedDict()
+        self.lock = Lock()
+
+    def observe(self, name, seconds):
+        """Records a timing.
+
+        Args:
+            name (str): Name of the timing.
+            seconds (float): Measured time in seconds.
+        """
+
+        with self.lock:
+            self._observe(name, seconds)
+
+    def increment(self, name, amount=1):
+        """Increments a counter.
+
+        Args:
+            name (str): Name of the counter.
+            amount (int): Optional; Amount to add.
+        """
+
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_alert(self, alert_id, latency, timings):
+        """Records the timings of checking an Alert.
+
+        Args:
+            alert_id (str): Id of the checked Alert.
+            latency (float): Seconds from the start of the check until
+                the Alert was stored and notified.
+            timings (Dict[str, float]): Seconds spent in each stage.
+        """
+
+        with self.lock:
+            self._observe("alert_latency", latency)
+            for name, seconds in timings.items():
+                self._observe(name, seconds)
+            self.alerts.pop(alert_id, None)
+            self.alerts[alert_id] = dict(timings, latency=latency)
+            while len(self.alerts) > MAX_ALERTS:
+                self.alerts.popitem(last=False)
+
+    def reset(self):
+        """Clears all metrics."""
+
+        with self.lock:
+            self.timings = {}
+            self.counters = {}
+            self.alerts = OrderedDict()
+
+    def to_json(self):
+        """Returns the metrics as a Dict"""
+
+        with self.lock:
+            return {
+                "timings": {
+                    name: dict(
+                        summary, average=summary["total"] / summary["count"])
+                    for name, summary in self.timings.items()
+                },
+                "counters": dict(self.counters),
+                "alerts": {
+                    alert_id: dict(timings)
+                    for alert_id, timings in self.alerts.items()
+                },
+            }
+
+    def _observe(self, name, seconds):
+        summary = self.timings.get(name)
+        if summary is None:
+            self.timings[name] = {
+                "count": 1,
+                "total": seconds,
+                "min": seconds,
+                "max": seconds,
+                "last": seconds,
+            }
+            return
+        summary["count"] += 1
+        summary["total"] += seconds
+        summary["min"] = min(summary["min"], seconds)
+        summary["max"] = max(summary["max"], seconds)
+        summary["last"] = seconds
+
+
+metrics = Metrics()
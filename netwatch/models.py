@@ -6,11 +6,27 @@ class Update:
     Attributes:
         text (str): The text to be displayed on the update window.
         link (str): The link to open in browser when an update is clicked.
+        id (str): Optional; Unique hex token key.
+        alert_id (str): Optional; Id of the updated Alert.
+        old_hash (str): Optional; Hash of the Alert's content before
+            the update.
+        new_hash (str): Optional; Hash of the Alert's content after
+            the update.
+        diffs (Dict[str, str]): Optional; Diffs between the old and new
+            content that have been computed, by diff mode.
     """
 
-    def __init__(self, text, link):
+    def __init__(
+        self, text, link, id=None, alert_id=None, old_hash=None, new_hash=None,
+        diffs=None
+    ):
         self.text = text
         self.link = link
+        self.id = id
+        self.alert_id = alert_id
+        self.old_hash = old_hash
+        self.new_hash = new_hash
+        self.diffs = diffs or {}
 
     def format(self):
         """Returns a text-formatted version of an Update"""
@@ -20,7 +36,15 @@ class Update:
     def to_json(self):
         """Returns an Update as a Dict"""
 
-        return {"text": self.text, "link": self.link}
+        return {
+            "text": self.text,
+            "link": self.link,
+            "id": self.id,
+            "alert_id": self.alert_id,
+            "old_hash": self.old_hash,
+            "new_hash": self.new_hash,
+            "diffs": self.diffs,
+        }
 
 
 class Alert:
@@ -39,8 +63,9 @@ class Alert:
             points to.
         selector (str): The HTML selector for the subsection
             of the website this Alert points to.
-        hash (str): A MD5 hash of the contents of this Alert's
-            website.
+        hash (str): A hash of the contents of this Alert's
+            website. None after the Alert was edited to watch other
+            content, until the next check records a new baseline.
         email (bool): Enables or disables email notifications.
         recipient (str): The recipient of the Alert.
         content_type (str): Optional; The email body content
@@ -49,6 +74,57 @@ class Alert:
         frequency (str): Cron formatted frequency representing
             how often this Alert should be processed by the
             scheduler.
+        fetch_mode (str): Optional; How the website is retrieved.
+            Valid values are "http", "browser" or "auto". An
+            "auto" Alert is switched to the mode that works on
+            its first check. Defaults to "browser", so Alerts saved
+            before fetch modes existed keep being rendered.
+        etag (str): Optional; ETag of the website's last
+            successful HTTP fetch.
+        last_modified (str): Optional; Last-Modified date of the
+            website's last successful HTTP fetch.
+        content_length (int): Optional; Content-Length of the
+            website's last successful HTTP fetch.
+        wait_for (str): Optional; When a rendered website is ready
+            to be scraped. Valid values are "selector" (once the
+            selector matches), "network_idle" (once no new
+            resources are loading) or "delay" (wait_delay seconds
+            after the page loaded).
+        wait_delay (float): Optional; Seconds to wait for the
+            "delay" wait rule.
+        timeout (float): Optional; Time budget in seconds for
+            checking the website.
+        block_profile (str): Optional; Name of a blocking profile,
+            or comma separated resource types and URL patterns,
+            that a rendered website is not allowed to request.
+            Defaults to the configured block_profile.
+        normalize (Dict): Optional; Normalization rules applied to
+            the website's HTML before it is hashed. See
+            netwatch.content for the valid rules.
+        fingerprint (str): Optional; SimHash fingerprint of the
+            contents of this Alert's website.
+        similarity_threshold (float): Optional; Changes that leave
+            the website at least this similar (0.0 to 1.0) to its
+            previous contents are recorded without notifying. None
+            notifies every change.
+        hash_version (str): Optional; The algorithm `hash` was
+            computed with. Alerts are migrated to the configured
+            hash_algorithm on their next check.
+        adaptive (bool): Optional; Whether checks of this Alert are
+            spread out while its website does not change. None uses
+            the adaptive_polling configuration.
+        catch_up (str): Optional; What happens to scheduled checks
+            missed while NetWatch was stopped or busy: "skip", "once"
+            (a single check) or "all". None uses the catch_up
+            configuration.
+        jitter (float): Optional; Window in seconds within which the
+            Alert's checks are offset from its cron boundaries. None
+            uses the jitter_window configuration.
+        last_checked (float): Optional; Timestamp of the last check.
+        unchanged_checks (int): Optional; Number of checks since the
+            website last changed.
+        last_error (str): Optional; Why the last check of the
+            website failed, or None if it succeeded.
     """
 
     def __init__(
@@ -64,6 +140,24 @@ class Alert:
         recipient,
         content_type,
         frequency,
+        fetch_mode="browser",
+        etag=None,
+        last_modified=None,
+        content_length=None,
+        wait_for="selector",
+        wait_delay=0,
+        timeout=30,
+        block_profile=None,
+        normalize=None,
+        hash_version="md5",
+        fingerprint=None,
+        similarity_threshold=None,
+        adaptive=None,
+        catch_up=None,
+        jitter=None,
+        last_checked=None,
+        unchanged_checks=0,
+        last_error=None,
     ):
         self.id = id
         self.name = name
@@ -76,6 +170,24 @@ class Alert:
         self.recipient = recipient
         self.content_type = content_type
         self.frequency = frequency
+        self.fetch_mode = fetch_mode
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_length = content_length
+        self.wait_for = wait_for
+        self.wait_delay = wait_delay
+        self.timeout = timeout
+        self.block_profile = block_profile
+        self.normalize = normalize
+        self.hash_version = hash_version
+        self.fingerprint = fingerprint
+        self.similarity_threshold = similarity_threshold
+        self.adaptive = adaptive
+        self.catch_up = catch_up
+        self.jitter = jitter
+        self.last_checked = last_checked
+        self.unchanged_checks = unchanged_checks
+        self.last_error = last_error
 
     def to_json(self):
         """Returns Alert as a Dict"""
@@ -92,4 +204,22 @@ class Alert:
             "recipient": self.recipient,
             "content_type": self.content_type,
             "frequency": self.frequency,
+            "fetch_mode": self.fetch_mode,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "content_length": self.content_length,
+            "wait_for": self.wait_for,
+            "wait_delay": self.wait_delay,
+            "timeout": self.timeout,
+            "block_profile": self.block_profile,
+            "normalize": self.normalize,
+            "hash_version": self.hash_version,
+            "fingerprint": self.fingerprint,
+            "similarity_threshold": self.similarity_threshold,
+            "adaptive": self.adaptive,
+            "catch_up": self.catch_up,
+            "jitter": self.jitter,
+            "last_checked": self.last_checked,
+            "unchanged_checks": self.unchanged_checks,
+            "last_error": self.last_error,
         }
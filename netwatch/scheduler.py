@@ -1,66 +1,387 @@
 """Module for running scheduled NetWatch jobs.
 
 This module processes NetWatch alerts according to their
-frequency.
+frequency. With adaptive polling, an Alert whose website has not
+changed for a while is checked less often than its frequency, up to
+a configured maximum interval, until a change is detected.
+
+Alerts are kept in a priority queue ordered by their next fire time,
+so each wake-up only looks at the Alerts that are due. The queue is
+kept up to date by listening to Alerts being created, updated and
+deleted in the store.
+
+The scheduler sleeps until the exact wall-clock time of the next fire
+instead of a fixed 60 seconds, so it does not drift. A frequency with
+a sixth field fires on seconds, e.g. "* * * * * */15" fires every 15
+seconds. Fires that could not run within the configured misfire_grace
+(because NetWatch was stopped or the clock jumped) are missed; each
+Alert's catch_up policy decides whether missed fires are skipped, run
+once or all run.
+
+Due Alerts are split into work units, one per Alert or one per host
+(the scheduler_sharding configuration), that run in parallel on a
+pool of scheduler_workers threads, so a slow website only holds up
+its own unit.
+
+Alerts that share a frequency are spread out by delaying each one by
+a fixed offset within the jitter_window configuration (or the Alert's
+own jitter). The offset is derived from the Alert's id, so an Alert
+always fires at the same point of its interval and keeps its cadence.
+
+Stopping the scheduler cancels running jobs cooperatively: no new
+pages are loaded, browsers stop waiting for their pages, and Alerts
+that were already fetched are still saved. Jobs are given the
+shutdown_timeout configuration to finish, then webdrivers that are
+still in use are killed.
+
+Attributes:
+    CATCH_UP_POLICIES (List[str]): Valid Alert catch_up policies.
+    SHARDING_MODES (List[str]): Valid scheduler_sharding values.
+    MAX_CATCH_UP (int): Most missed fires counted and run for an Alert
+        at once.
 
 Todo:
-    * Find a way to process alerts in parallel and shut down those processes immediately
+    * Stop batches running in `process` backend workers cooperatively
+      instead of terminating the workers at the shutdown deadline
 """
 
+import hashlib
+import heapq
 import threading
-from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlparse
 
 from croniter import croniter
 
+import netwatch.backend
+import netwatch.scraper
 from netwatch.common import process_alert
+from netwatch.metrics import metrics
 from netwatch.store import store
 
+CATCH_UP_POLICIES = ["skip", "once", "all"]
+SHARDING_MODES = ["alert", "host"]
+MAX_CATCH_UP = 100
+
 
 class Scheduler:
     """A job scheduler for running NetWatch jobs.
 
     Attributes:
         stop_scheduler (threading.Event): Event for stopping the
-            scheduler from another thread.
+            scheduler from another thread. Running jobs are cancelled
+            when it is set.
+        wake_scheduler (threading.Event): Event for waking the
+            scheduler up when the queue changed.
         thread (threading.Thread): Thread for running scheduler handler.
         executor (concurrent.futures.ThreadPoolExecutor): Executor
             for running scheduled NetWatch Alerts in parallel.
+        jobs (Set[concurrent.futures.Future]): Jobs submitted to the
+            executor that have not finished.
+        queue (List[Tuple[float, str]]): Heap of fire times and Alert
+            ids. Entries that do not match `fire_times` are stale and
+            are dropped when they reach the top.
+        fire_times (Dict[str, float]): Next fire time of each Alert.
+        frequencies (Dict[str, str]): Frequency each Alert was
+            scheduled with.
+        jitters (Dict[str, float]): Jitter window each Alert was
+            scheduled with.
+        offsets (Dict[str, float]): Seconds each Alert's fire times
+            are delayed from its cron boundaries.
+        last_fires (Dict[str, float]): Fire time each Alert was last
+            processed on.
+        lock (threading.Lock): Lock for accessing the queue.
     """
 
     def __init__(self):
         self.stop_scheduler = threading.Event()
+        self.wake_scheduler = threading.Event()
         self.thread = threading.Thread(target=self._scheduler_handler, args=())
-        self.executor = ThreadPoolExecutor(3)
+        self.executor = ThreadPoolExecutor(
+            int(store.get_config("scheduler_workers", 3)))
+        self.jobs = set()
+        self.queue = []
+        self.fire_times = {}
+        self.frequencies = {}
+        self.jitters = {}
+        self.offsets = {}
+        self.last_fires = {}
+        self.lock = threading.Lock()
 
     def start(self):
         """Starts the scheduler"""
 
         self.stop_scheduler.clear()
+        store.add_listener(self._alert_changed)
+        now = time.time()
+        for alert in store.get_alerts():
+            # Fires missed while NetWatch was stopped are caught up.
+            self._schedule(alert, min(float(alert.last_checked or now), now))
         self.thread.start()
 
     def stop(self):
-        """Stops the scheduler"""
+        """Stops the scheduler and quits pooled webdrivers and workers
+
+        Running jobs are cancelled and given up to the shutdown_timeout
+        configuration (in seconds) to save the Alerts they have
+        already fetched. Webdrivers still in use after that, including
+        those of cancelled renders and of `process` backend workers,
+        are killed.
+        """
 
+        store.remove_listener(self._alert_changed)
         self.stop_scheduler.set()
+        self.wake_scheduler.set()
         self.thread.join()
-        self.executor.shutdown()
+        deadline = time.time() + float(store.get_config("shutdown_timeout", 10))
+        with self.lock:
+            jobs = list(self.jobs)
+        _, running = wait(jobs, timeout=deadline - time.time())
+        if running:
+            print("Shutdown deadline passed, killing {} job(s)".format(
+                len(running)))
+        self.executor.shutdown(wait=False)
+        netwatch.scraper.close_driver_pool(kill=True)
+        # Worker processes do not see the stop event, so their batches
+        # get what is left of the deadline.
+        netwatch.backend.shutdown(timeout=max(0, deadline - time.time()))
+
+    def next_fire_time(self):
+        """Returns the earliest fire time in the queue, or None."""
+
+        with self.lock:
+            while self.queue and self.fire_times.get(
+                self.queue[0][1]
+            ) != self.queue[0][0]:
+                heapq.heappop(self.queue)
+            return self.queue[0][0] if self.queue else None
 
     def _scheduler_handler(self):
         while not self.stop_scheduler.is_set():
-            jobs = []
+            self.wake_scheduler.clear()
+            jobs = self._pop_due(time.time())
+            for unit in shard_jobs(
+                jobs, store.get_config("scheduler_sharding", "host")
+            ):
+                self._submit(unit)
+
+            next_fire = self.next_fire_time()
+            timeout = 60 if next_fire is None else next_fire - time.time()
+            if timeout > 0:
+                self.wake_scheduler.wait(min(timeout, 60))
+
+    def _submit(self, jobs):
+        job = self.executor.submit(_process_jobs, jobs, self.stop_scheduler)
+        with self.lock:
+            self.jobs.add(job)
+        job.add_done_callback(self._job_done)
+
+    def _job_done(self, job):
+        with self.lock:
+            self.jobs.discard(job)
+
+    def _pop_due(self, now):
+        """Pops due Alerts, schedules their next fire and returns them.
+
+        Returns:
+            List[Alert]: Alerts to be processed, with Alerts repeated
+                once for every missed fire they catch up on.
+        """
+
+        due = {}
+        with self.lock:
+            while self.queue and self.queue[0][0] <= now:
+                fire_time, alert_id = heapq.heappop(self.queue)
+                if self.fire_times.get(alert_id) == fire_time:
+                    due[alert_id] = (
+                        fire_time,
+                        self.frequencies[alert_id],
+                        self.offsets[alert_id],
+                    )
+        if not due:
+            return []
+
+        grace = float(store.get_config("misfire_grace", 30))
+        missed = {}
+        for alert_id, (fire_time, frequency, offset) in due.items():
+            itr = croniter(frequency, fire_time - offset)
+            next_fire = itr.get_next(float) + offset
+            count = 0 if fire_time >= now - grace else 1
+            while next_fire < now - grace and count < MAX_CATCH_UP:
+                count += 1
+                next_fire = itr.get_next(float) + offset
+            if next_fire < now - grace:
+                next_fire = croniter(frequency, now - offset).get_next(
+                    float) + offset
+            with self.lock:
+                if (
+                    self.frequencies.get(alert_id) == frequency
+                    and self.offsets.get(alert_id) == offset
+                ):
+                    self.fire_times[alert_id] = next_fire
+                    heapq.heappush(self.queue, (next_fire, alert_id))
+            if count > 0:
+                missed[alert_id] = count
+        if missed:
+            metrics.increment("missed_fires", sum(missed.values()))
+
+        jobs = []
+        adaptive = store.get_config("adaptive_polling", False)
+        max_interval = float(store.get_config("adaptive_max_interval", 86400))
+        backoff_checks = int(store.get_config("adaptive_backoff_checks", 5))
+        catch_up = store.get_config("catch_up", "once")
+        for alert_id, (fire_time, frequency, offset) in due.items():
+            try:
+                alert = store.get_alerts(alert_id)
+            except KeyError:  # deleted since it was popped
+                continue
+            runs = 1
+            if alert_id in missed:
+                policy = alert.catch_up or catch_up
+                print("Alert {} missed {} fire(s), catch up: {}".format(
+                    alert_id, missed[alert_id], policy))
+                runs = {"skip": 0, "once": 1}.get(policy, missed[alert_id])
+            if runs == 0:
+                continue
+            last_fire = self.last_fires.get(alert_id, alert.last_checked)
+            if (alert.adaptive if alert.adaptive is not None
+                    else adaptive) and last_fire:
+                base = fire_time - offset
+                period = croniter(frequency, base).get_next(float) - base
+                interval = adaptive_interval(
+                    alert, period, max_interval, backoff_checks)
+                # Half a period of slack keeps the check on the first
+                # fire at least `interval` after the previous one, and
+                # allows for the time the previous check took when
+                # only last_checked is known.
+                if fire_time - float(last_fire) < interval - period / 2:
+                    continue
+            with self.lock:
+                if alert_id in self.fire_times:
+                    self.last_fires[alert_id] = fire_time
+            jobs.extend([alert] * runs)
+        return jobs
+
+    def _schedule(self, alert, now):
+        """Queues an Alert at its first fire time after `now`."""
+
+        jitter = alert.jitter
+        if jitter is None:
+            jitter = store.get_config("jitter_window", 0)
+        try:
+            itr = croniter(alert.frequency, now)
+            first = itr.get_next(float)
+            offset = jitter_offset(
+                alert.id, min(float(jitter), itr.get_next(float) - first))
+            next_fire = croniter(alert.frequency, now - offset).get_next(
+                float) + offset
+        except Exception as e:
+            print("Invalid frequency for alert {}: {}".format(alert.id, e))
+            self._unschedule(alert.id)
+            return
+        with self.lock:
+            self.fire_times[alert.id] = next_fire
+            self.frequencies[alert.id] = alert.frequency
+            self.jitters[alert.id] = alert.jitter
+            self.offsets[alert.id] = offset
+            heapq.heappush(self.queue, (next_fire, alert.id))
+        self.wake_scheduler.set()
+
+    def _unschedule(self, alert_id):
+        with self.lock:
+            self.fire_times.pop(alert_id, None)
+            self.frequencies.pop(alert_id, None)
+            self.jitters.pop(alert_id, None)
+            self.offsets.pop(alert_id, None)
+            self.last_fires.pop(alert_id, None)
 
-            for alert in store.get_alerts():
-                time = datetime.now()
-                time = datetime(
-                    time.year, time.month, time.day, time.hour, time.minute
-                )  # no seconds value
-                itr = croniter(alert.frequency, time)
+    def _alert_changed(self, event, alert):
+        if event == "delete":
+            self._unschedule(alert.id)
+        else:
+            with self.lock:
+                scheduled = (
+                    self.frequencies.get(alert.id),
+                    self.jitters.get(alert.id),
+                )
+            if scheduled != (alert.frequency, alert.jitter):
+                self._schedule(alert, time.time())
 
-                if time == itr.get_current(datetime):
-                    jobs.append(alert.id)
 
-            if len(jobs) > 0:
-                self.executor.submit(process_alert, (jobs))
+def jitter_offset(alert_id, window):
+    """Returns the fixed delay of an Alert's fires within a window.
+
+    The delay is derived from a hash of the Alert's id, so it is the
+    same every time and the delays of many Alerts are spread evenly
+    over the window.
+
+    Args:
+        alert_id (str): Id of the Alert.
+        window (float): Window in seconds.
+
+    Returns:
+        float: Delay in seconds, from 0 up to `window`.
+    """
+
+    if window <= 0:
+        return 0.0
+    digest = hashlib.md5(alert_id.encode()).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64 * window
+
+
+def shard_jobs(alerts, sharding="host"):
+    """Splits due Alerts into independent work units.
+
+    Args:
+        alerts (List[Alert]): Due Alerts. Alerts may be repeated.
+        sharding (str): Optional; One of SHARDING_MODES. `alert` makes
+            a unit of every Alert, `host` makes a unit of the Alerts
+            of each host, so they share page loads and rate limits.
+
+    Returns:
+        List[List[str]]: Alert ids of each work unit.
+    """
+
+    units = {}
+    for alert in alerts:
+        if sharding == "alert":
+            key = alert.id
+        else:
+            key = urlparse(alert.link).netloc.lower()
+        units.setdefault(key, []).append(alert.id)
+    return list(units.values())
+
+
+def _process_jobs(jobs, stop_event=None):
+    """Processes due Alerts, repeating Alerts listed more than once."""
+
+    while len(jobs) > 0 and not (stop_event and stop_event.is_set()):
+        batch = list(dict.fromkeys(jobs))
+        for alert_id in batch:
+            jobs.remove(alert_id)
+        # Alerts still being processed from an earlier tick are skipped
+        # instead of being fetched twice.
+        process_alert(batch, False, stop_event)
+
+
+def adaptive_interval(alert, interval, max_interval, backoff_checks=5):
+    """Returns how often a stable Alert should be checked.
+
+    The interval doubles for every `backoff_checks` consecutive
+    checks in which the Alert's website did not change, and returns to
+    the cron interval once a change is detected.
+
+    Args:
+        alert (Alert): The Alert to be checked.
+        interval (float): Seconds between checks according to the
+            Alert's frequency.
+        max_interval (float): Maximum seconds between checks.
+        backoff_checks (int): Optional; Unchanged checks per doubling.
+
+    Returns:
+        float: Seconds between checks of the Alert.
+    """
 
-            self.stop_scheduler.wait(60)
+    doublings = int(alert.unchanged_checks) // max(1, backoff_checks)
+    return min(max(interval, max_interval), interval * 2 ** min(doublings, 32))
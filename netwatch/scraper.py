@@ -1,5 +1,9 @@
 """Module for retrieving HTML from static and dynamic websites.
 
+Static pages are retrieved with plain HTTP requests. Dynamic pages
+are rendered with long-lived Selenium webdrivers that are leased
+from a DriverPool instead of starting a new browser for every call.
+
 Example:
     Command-line usage::
 
@@ -12,25 +16,425 @@ Example:
                     id="fakeid",
                     link="https://google.com",
                     selector="div",
-                )
+                ),
+                chromedriver_path="chromedriver.exe",
             )
 
+Attributes:
+    DEFAULT_CHROMEDRIVER_PATH (str): Default path to chromedriver,
+        which finds it on the PATH.
+    DEFAULT_DRIVER_OPTIONS (List[str]): Default chromedriver options.
+    FETCH_MODES (List[str]): Valid SiteData fetch modes. `http` pages
+        are retrieved with a plain GET request, `browser` pages are
+        rendered with Selenium and `auto` pages try HTTP first.
+    WAIT_RULES (List[str]): Valid SiteData wait rules. A rendered page
+        is ready once its selector matches a parsed document and the
+        page has loaded or the match is not empty and has stopped
+        changing (`selector`), once it has
+        loaded no new resources for NETWORK_IDLE_TIME seconds
+        (`network_idle`) or once its wait_delay has passed after it
+        loaded (`delay`).
+    BLOCKED_RESOURCES (Dict[str, List[str]]): URL patterns blocked
+        for each resource type of a blocking profile. Extension
+        patterns such as "*.png" also block URLs with a query string.
+    BLOCKING_PROFILES (Dict[str, List[str]]): Named blocking profiles.
+        A blocking profile lists resource types and URL patterns that
+        rendered pages are not allowed to request.
+    DEFAULT_TIMEOUT (int): Default time budget of a SiteData in seconds.
+    MAX_RESTART_BACKOFF (int): Longest wait in seconds before starting
+        a driver again after drivers failed to start.
+    RENDER_QUEUE_TIMEOUT (int): Longest wait in seconds for a free
+        driver before a page that needs rendering times out.
+    NETWORK_IDLE_TIME (float): Seconds without new resources before a
+        page is considered idle.
+    POLL_INTERVAL (float): Seconds between checks of loading tabs.
+    HTTP_HEADERS (Dict): Headers sent with plain HTTP requests.
+
 Todo:
     * Add support for other browsers
 """
 
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlparse, urlunparse
+
+import requests
+from bs4 import BeautifulSoup
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import WebDriverException
+
+try:
+    import psutil
+except ImportError:  # memory based recycling is disabled without psutil
+    psutil = None
+
+DEFAULT_CHROMEDRIVER_PATH = "chromedriver"
+DEFAULT_DRIVER_OPTIONS = ["--headless", "--window-size=1920x1080"]
+FETCH_MODES = ["auto", "http", "browser"]
+WAIT_RULES = ["selector", "network_idle", "delay"]
+BLOCKED_RESOURCES = {
+    "image": [
+        "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+        "*.bmp",
+    ],
+    "font": ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"],
+    "media": [
+        "*.mp4", "*.webm", "*.ogg", "*.mp3", "*.wav", "*.m4a", "*.avi",
+        "*.mov",
+    ],
+    "tracker": [
+        "*google-analytics.com*", "*googletagmanager.com*",
+        "*googlesyndication.com*", "*doubleclick.net*",
+        "*connect.facebook.net*", "*scorecardresearch.com*",
+        "*hotjar.com*", "*quantserve.com*", "*adservice.google.*",
+    ],
+}
+BLOCKING_PROFILES = {
+    "none": [],
+    "media": ["image", "font", "media"],
+    "trackers": ["tracker"],
+    "all": ["image", "font", "media", "tracker"],
+}
+DEFAULT_TIMEOUT = 30
+MAX_RESTART_BACKOFF = 60
+RENDER_QUEUE_TIMEOUT = 300
+NETWORK_IDLE_TIME = 0.5
+POLL_INTERVAL = 0.1
+HTTP_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/88.0.4324.150 Safari/537.36"
+    )
+}
+
+_driver_pool = None
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+_fetch_limiter = None
+_fetch_executor = None
+_fetch_lock = threading.Lock()
+_driver_pool_lock = threading.Lock()
 
 
 class SiteData:
-    def __init__(self, id, link, selector="", html=None, hash=None):
+    """A website to be scraped and the results of scraping it.
+
+    Attributes:
+        id (str): Id of the Alert this SiteData belongs to.
+        link (str): Link to the website.
+        selector (str): CSS selector for the scraped portion of the website.
+        html (str): Scraped HTML, or None if nothing was scraped.
+        hash (str): Hash of the scraped HTML.
+        fetch_mode (str): One of FETCH_MODES.
+        status (str): "ok" once HTML was scraped, "not_modified"
+            when the server answered a conditional request with 304,
+            "timeout" when the time budget ran out and "error" when
+            the page could not be fetched.
+        error (str): Why the page could not be fetched, if it could not.
+        etag (str): ETag validator of the last successful HTTP fetch.
+        last_modified (str): Last-Modified validator of the last
+            successful HTTP fetch.
+        content_length (int): Content-Length of the last successful
+            HTTP fetch.
+        wait_for (str): One of WAIT_RULES.
+        wait_delay (float): Seconds to wait after the page loaded when
+            wait_for is `delay`.
+        timeout (float): Time budget in seconds for fetching the page.
+        deadline (float): Time at which the time budget runs out. Set
+            when the HTTP request is sent, and again when the page's
+            tab is navigated, so time spent waiting for a free driver
+            does not count against the budget.
+        block_profile (str or List[str]): Blocking profile for
+            rendering the page. Defaults to the DriverPool's.
+        normalize (Dict): Normalization rules applied to the HTML
+            before it is hashed. See netwatch.content.
+        fingerprint (str): SimHash fingerprint of the page's content.
+            Only computed when `hash` differs from `previous_hash`.
+        hash_algorithm (str): Algorithm `hash` is computed with. One of
+            netwatch.content.HASH_ALGORITHMS.
+        previous_hash (str): Hash of the page's content from the
+            previous check.
+        previous_hash_algorithm (str): Algorithm `previous_hash` was
+            computed with. When it differs from `hash_algorithm` and
+            the content is unchanged, `previous_hash` is replaced by
+            `hash` once the page is hashed.
+        timings (Dict[str, float]): Seconds spent in each stage of
+            checking the page.
+    """
+
+    def __init__(
+        self,
+        id,
+        link,
+        selector="",
+        html=None,
+        hash=None,
+        fetch_mode="browser",
+        etag=None,
+        last_modified=None,
+        content_length=None,
+        wait_for="selector",
+        wait_delay=0,
+        timeout=DEFAULT_TIMEOUT,
+        block_profile=None,
+        normalize=None,
+        hash_algorithm="md5",
+        previous_hash=None,
+        previous_hash_algorithm="md5",
+    ):
         self.id = id
         self.link = link
         self.selector = selector
         self.html = html
         self.hash = hash
+        self.fetch_mode = fetch_mode
+        self.status = None
+        self.error = None
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_length = content_length
+        self.wait_for = wait_for
+        self.wait_delay = wait_delay
+        self.timeout = timeout
+        self.deadline = None
+        self.block_profile = block_profile
+        self.normalize = normalize
+        self.fingerprint = None
+        self.hash_algorithm = hash_algorithm
+        self.previous_hash = previous_hash
+        self.previous_hash_algorithm = previous_hash_algorithm
+        self.timings = {}
+
+
+class _Lease:
+    """A webdriver leased from a DriverPool.
+
+    Attributes:
+        driver (selenium.webdriver): The leased webdriver.
+        pages (int): Number of pages loaded with the driver since
+            it was created.
+    """
+
+    def __init__(self, pool, driver, pages):
+        self.pool = pool
+        self.driver = driver
+        self.pages = pages
+
+    def beat(self):
+        """Tells the pool's watchdog that the driver is responsive."""
+
+        with self.pool._condition:
+            self.pool._beats[self.driver] = time.time()
+
+
+class DriverPool:
+    """A thread-safe pool of reusable Selenium webdrivers.
+
+    Drivers are created lazily up to `size`, health-checked when
+    they are leased, and recycled once they have loaded `max_pages`
+    pages or their browser uses more than `max_memory` megabytes.
+
+    A watchdog thread supervises leased drivers. A driver whose lease
+    has not sent a heartbeat for `heartbeat_timeout` seconds is
+    considered hung and its processes are killed, which makes the
+    blocked webdriver call raise so the lease discards it. When a
+    driver cannot be started, new drivers are not started again until
+    an exponentially growing backoff has passed.
+
+    Attributes:
+        chromedriver_path (str): Path pointing to chromedriver.exe location.
+        driver_options (List[str]): List of options for the chromedriver.
+        size (int): Maximum number of drivers alive at once.
+        max_pages (int): Pages a driver may load before it is recycled.
+        max_memory (int): Optional; Browser memory limit in megabytes.
+            Requires psutil.
+        tabs (int): Number of pages each driver loads at once, each
+            in its own tab.
+        block_profile (str or List[str]): Blocking profile for pages
+            that do not set their own.
+        heartbeat_timeout (float): Seconds a leased driver may go
+            without a heartbeat before it is killed.
+    """
+
+    def __init__(
+        self,
+        chromedriver_path,
+        driver_options=DEFAULT_DRIVER_OPTIONS,
+        size=2,
+        max_pages=100,
+        max_memory=None,
+        tabs=1,
+        block_profile=None,
+        heartbeat_timeout=60,
+    ):
+        self.chromedriver_path = chromedriver_path
+        self.driver_options = list(driver_options)
+        self.size = max(1, int(size))
+        self.max_pages = int(max_pages)
+        self.max_memory = max_memory
+        self.tabs = max(1, int(tabs))
+        self.block_profile = block_profile
+        self.heartbeat_timeout = heartbeat_timeout
+        self.closed = False
+        self._idle = []
+        self._pages = {}
+        self._beats = {}
+        self._alive = 0
+        self._failures = 0
+        self._retry_at = 0
+        self._condition = threading.Condition()
+        self._watchdog = None
+
+    @contextmanager
+    def lease(self):
+        """Leases a driver for the duration of a `with` block.
+
+        The driver is returned to the pool when the block exits and
+        discarded if the block raises.
+
+        Yields:
+            _Lease: The leased driver.
+        """
+
+        driver, pages = self._acquire()
+        lease = _Lease(self, driver, pages)
+        lease.beat()
+        try:
+            yield lease
+        except BaseException:
+            self._discard(lease.driver)
+            raise
+        self._release(lease.driver, lease.pages)
+
+    def close(self, kill=False):
+        """Quits idle drivers and stops leasing new ones.
+
+        Drivers that are currently leased are quit when they are
+        returned to the pool.
+
+        Args:
+            kill (bool): Optional; Also kill the processes of leased
+                drivers, which makes their blocked webdriver calls
+                raise so they are returned right away.
+        """
+
+        with self._condition:
+            self.closed = True
+            idle, self._idle = self._idle, []
+            leased = [driver for driver in self._pages if driver not in idle]
+            self._condition.notify_all()
+        if kill:
+            for driver in leased:
+                kill_driver(driver)
+        for driver in idle:
+            self._discard(driver)
+
+    def _acquire(self):
+        while True:
+            with self._condition:
+                while not self._idle and self._alive >= self.size:
+                    if self.closed:
+                        raise Exception("Driver pool is closed")
+                    self._condition.wait()
+                if self.closed:
+                    raise Exception("Driver pool is closed")
+                driver = self._idle.pop() if self._idle else None
+                if driver is None:
+                    self._alive += 1
+            if driver is None:
+                return self._start_driver(), 0
+            if self._is_healthy(driver):
+                return driver, self._pages[driver]
+            self._discard(driver)
+
+    def _start_driver(self):
+        try:
+            if time.time() < self._retry_at:
+                raise Exception(
+                    "Driver restart backing off after {} failure(s)".format(
+                        self._failures))
+            driver = initialize_driver(
+                self.chromedriver_path, self.driver_options)
+        except BaseException:
+            with self._condition:
+                if time.time() >= self._retry_at:
+                    self._failures += 1
+                    self._retry_at = time.time() + min(
+                        MAX_RESTART_BACKOFF, 2 ** (self._failures - 1))
+                self._alive -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._failures = 0
+            self._pages[driver] = 0
+            if self._watchdog is None:
+                self._watchdog = threading.Thread(
+                    target=self._watchdog_handler, daemon=True)
+                self._watchdog.start()
+        return driver
+
+    def _watchdog_handler(self):
+        while True:
+            with self._condition:
+                if self.closed and self._alive == 0:
+                    self._watchdog = None
+                    return
+                now = time.time()
+                hung = [
+                    driver for driver, beat in self._beats.items()
+                    if now - beat > self.heartbeat_timeout
+                ]
+                for driver in hung:
+                    self._beats.pop(driver)
+            for driver in hung:
+                print("Driver stopped responding, killing it")
+                kill_driver(driver)
+            time.sleep(max(1, self.heartbeat_timeout / 4))
+
+    def _release(self, driver, pages):
+        with self._condition:
+            self._beats.pop(driver, None)
+            self._pages[driver] = pages
+            recycle = self.closed or pages >= self.max_pages
+        if recycle or self._over_memory(driver):
+            self._discard(driver)
+            return
+        with self._condition:
+            self._idle.append(driver)
+            self._condition.notify()
+
+    def _discard(self, driver):
+        quit_driver(driver)
+        with self._condition:
+            self._beats.pop(driver, None)
+            self._pages.pop(driver, None)
+            self._alive -= 1
+            self._condition.notify()
+
+    def _is_healthy(self, driver):
+        try:
+            driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def _over_memory(self, driver):
+        if not self.max_memory or psutil is None:
+            return False
+        try:
+            process = psutil.Process(driver.service.process.pid)
+            rss = sum(
+                p.memory_info().rss
+                for p in [process] + process.children(recursive=True)
+            )
+        except psutil.Error:
+            return False
+        return rss > self.max_memory * 1024 * 1024
 
 
 def initialize_driver(chromedriver_path, driver_options):
@@ -52,48 +456,1120 @@ def initialize_driver(chromedriver_path, driver_options):
         "excludeSwitches", ["enable-logging"])  # disables logging
     driver = webdriver.Chrome(
         options=options, executable_path=chromedriver_path)
-    driver.set_page_load_timeout(30)
+    driver.set_page_load_timeout(DEFAULT_TIMEOUT)
     return driver
 
 
-def fetch_site_html(
-    site_data,
-    chromedriver_path,
-    driver_options=["--headless", "--window-size=1920x1080"],
+def quit_driver(driver):
+    """Quits a webdriver, killing its processes if quitting fails.
+
+    Args:
+        driver (selenium.webdriver): Webdriver to be quit.
+    """
+
+    try:
+        driver.quit()
+    except Exception:
+        kill_driver(driver)
+
+
+def kill_driver(driver):
+    """Kills a webdriver's chromedriver process and its browser.
+
+    The browser processes are only killed when psutil is installed.
+
+    Args:
+        driver (selenium.webdriver): Webdriver to be killed.
+    """
+
+    try:
+        process = driver.service.process
+    except AttributeError:
+        return
+    if psutil is not None:
+        try:
+            for child in psutil.Process(process.pid).children(recursive=True):
+                child.kill()
+        except psutil.Error:
+            pass
+    try:
+        process.kill()
+    except Exception:
+        pass
+
+
+class RateLimiter:
+    """Per-host token buckets limiting how often pages are loaded.
+
+    Every page load, over HTTP or in a browser, takes a token from the
+    bucket of its host. Buckets refill at the host's rate and hold at
+    most `burst` tokens. Loads that find the bucket empty reserve the
+    next token and wait for it, so a host is never loaded faster than
+    its rate no matter how many fetches run at once.
+
+    Attributes:
+        rate (float): Default page loads per second for each host, or
+            None for no limit.
+        burst (int): Page loads a host may receive at once after it
+            has been idle.
+        host_rates (Dict[str, float]): Page loads per second of hosts
+            with their own rate. None means no limit.
+        buckets (Dict[str, Tuple[float, float]]): Tokens left in each
+            host's bucket and when they were counted.
+        lock (threading.Lock): Lock for accessing the buckets.
+    """
+
+    def __init__(self, rate=None, burst=1, host_rates={}):
+        self.rate = rate
+        self.burst = burst
+        self.host_rates = {
+            host.lower(): host_rate for host, host_rate in host_rates.items()
+        }
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def configure(self, rate=None, burst=1, host_rates={}):
+        """Applies new settings to the limiter.
+
+        Args:
+            rate (float): Optional; Default page loads per second for
+                each host, or None for no limit.
+            burst (int): Optional; Page loads a host may receive at once.
+            host_rates (Dict[str, float]): Optional; Page loads per
+                second of hosts with their own rate.
+        """
+
+        with self.lock:
+            self.rate = rate
+            self.burst = burst
+            self.host_rates = {
+                host.lower(): host_rate
+                for host, host_rate in (host_rates or {}).items()
+            }
+
+    def reserve(self, host):
+        """Takes a token for a page load from a host's bucket.
+
+        Args:
+            host (str): Host of the page, e.g. "example.com:8080".
+
+        Returns:
+            float: Seconds to wait before loading the page.
+        """
+
+        host = host.lower()
+        rate = self.host_rates.get(host, self.rate)
+        if not rate:
+            return 0
+        rate = float(rate)
+        burst = max(1, int(self.burst))
+        with self.lock:
+            now = time.monotonic()
+            tokens, counted = self.buckets.get(host, (burst, now))
+            tokens = min(burst, tokens + (now - counted) * rate) - 1
+            self.buckets[host] = (tokens, now)
+        return 0 if tokens >= 0 else -tokens / rate
+
+
+class FetchLimiter:
+    """Limits how many pages are fetched at once across every fetch.
+
+    Slots are counted with a thread-safe counter, so fetches running
+    on different threads and event loops share the same limits.
+    Coroutines waiting for a slot are woken on their own event loop
+    whenever a slot is released.
+
+    Attributes:
+        concurrency (int): Maximum number of pages fetched at once.
+        per_host (int): Maximum number of pages fetched at once from a
+            single host.
+        active (int): Number of pages being fetched.
+        hosts (Dict[str, int]): Number of pages being fetched from
+            each host.
+        lock (threading.Lock): Lock for accessing the counters.
+    """
+
+    def __init__(self, concurrency=10, per_host=2):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.active = 0
+        self.hosts = {}
+        self.lock = threading.Lock()
+        self._waiters = []
+
+    async def acquire(self, host=None):
+        """Waits for a free slot and takes it.
+
+        Args:
+            host (str): Optional; Take one of the host's slots instead
+                of one of the global slots.
+        """
+
+        loop = asyncio.get_event_loop()
+        while True:
+            with self.lock:
+                if host is None and self.active < max(1, self.concurrency):
+                    self.active += 1
+                    return
+                if host is not None and self.hosts.get(host, 0) < max(
+                    1, self.per_host
+                ):
+                    self.hosts[host] = self.hosts.get(host, 0) + 1
+                    return
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, host=None):
+        """Returns a slot taken with acquire.
+
+        Args:
+            host (str): Optional; The host the slot was taken for.
+        """
+
+        with self.lock:
+            if host is None:
+                self.active -= 1
+            else:
+                self.hosts[host] -= 1
+                if self.hosts[host] == 0:
+                    del self.hosts[host]
+            waiters, self._waiters = self._waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_set_done, waiter)
+            except RuntimeError:  # the waiting fetch's loop is closed
+                pass
+
+    def slot(self, host=None):
+        """Returns an async context manager holding a slot.
+
+        Args:
+            host (str): Optional; Take one of the host's slots.
+        """
+
+        return _Slot(self, host)
+
+
+class _Slot:
+    def __init__(self, limiter, host):
+        self.limiter = limiter
+        self.host = host
+
+    async def __aenter__(self):
+        await self.limiter.acquire(self.host)
+
+    async def __aexit__(self, *exc_info):
+        self.limiter.release(self.host)
+
+
+def get_driver_pool(
+    chromedriver_path=DEFAULT_CHROMEDRIVER_PATH,
+    driver_options=DEFAULT_DRIVER_OPTIONS,
+    size=2,
+    max_pages=100,
+    max_memory=None,
+    tabs=1,
+    block_profile=None,
+    heartbeat_timeout=60,
 ):
-    """Processes NetWatch Alerts using the Selenium webdriver.
+    """Returns the shared DriverPool, creating it if needed.
 
-    Retreives the HTML from each Alert's linked website and creates a
-    MD5 hash from that HTML.
+    The shared pool is replaced when it has been closed or when it
+    was created with a different chromedriver path or options.
 
     Args:
-        site_data (List[Dict]): Single/List of SiteData object(s).
-        chromedriver_path (str): Optional; Path to chromdriver.exe.
+        chromedriver_path (str): Optional; Path pointing to chromedriver.
         driver_options (List[str]): Optional; List of driver options.
+        size (int): Optional; Maximum number of drivers alive at once.
+        max_pages (int): Optional; Pages a driver may load before it
+            is recycled.
+        max_memory (int): Optional; Browser memory limit in megabytes.
+        tabs (int): Optional; Number of pages each driver loads at once.
+        block_profile (str or List[str]): Optional; Default blocking
+            profile of the pool.
+        heartbeat_timeout (float): Optional; Seconds a leased driver may
+            go without a heartbeat before it is killed.
+
+    Returns:
+        DriverPool: The shared driver pool.
+    """
+
+    global _driver_pool
+    with _driver_pool_lock:
+        pool = _driver_pool
+        if (
+            pool is None
+            or pool.closed
+            or pool.chromedriver_path != chromedriver_path
+            or pool.driver_options != list(driver_options)
+        ):
+            if pool is not None:
+                pool.close()
+            pool = DriverPool(
+                chromedriver_path,
+                driver_options,
+                size=size,
+                max_pages=max_pages,
+                max_memory=max_memory,
+                tabs=tabs,
+                block_profile=block_profile,
+                heartbeat_timeout=heartbeat_timeout,
+            )
+            _driver_pool = pool
+        else:
+            pool.size = max(1, int(size))
+            pool.max_pages = int(max_pages)
+            pool.max_memory = max_memory
+            pool.tabs = max(1, int(tabs))
+            pool.block_profile = block_profile
+            pool.heartbeat_timeout = heartbeat_timeout
+    return pool
+
+
+def close_driver_pool(kill=False):
+    """Closes the shared DriverPool and quits its drivers.
+
+    Args:
+        kill (bool): Optional; Also kill drivers that are in use.
+    """
+
+    global _driver_pool
+    with _driver_pool_lock:
+        pool, _driver_pool = _driver_pool, None
+    if pool is not None:
+        pool.close(kill)
+
+
+def get_rate_limiter(rate=None, burst=1, host_rates={}):
+    """Returns the RateLimiter shared by every fetch, applying settings.
+
+    Args:
+        rate (float): Optional; Default page loads per second for each
+            host, or None for no limit.
+        burst (int): Optional; Page loads a host may receive at once.
+        host_rates (Dict[str, float]): Optional; Page loads per second
+            of hosts with their own rate.
+
+    Returns:
+        RateLimiter: The shared rate limiter.
+    """
+
+    limiter = _shared_rate_limiter()
+    limiter.configure(rate, burst, host_rates)
+    return limiter
+
+
+def set_rate_limiter(limiter):
+    """Replaces the RateLimiter shared by every fetch.
+
+    Args:
+        limiter (RateLimiter): The new limiter, e.g. a proxy of a
+            limiter that is shared between processes.
+    """
+
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = limiter
+
+
+def get_fetch_limiter(concurrency=10, per_host=2):
+    """Returns the FetchLimiter shared by every fetch, applying settings.
+
+    Args:
+        concurrency (int): Optional; Maximum number of pages fetched
+            at once.
+        per_host (int): Optional; Maximum number of pages fetched at
+            once from a single host.
+
+    Returns:
+        FetchLimiter: The shared fetch limiter.
+    """
+
+    global _fetch_limiter
+    with _fetch_lock:
+        if _fetch_limiter is None:
+            _fetch_limiter = FetchLimiter()
+        limiter = _fetch_limiter
+    with limiter.lock:
+        limiter.concurrency = concurrency
+        limiter.per_host = per_host
+    return limiter
+
+
+def _shared_fetch_executor(size):
+    """Returns the thread pool shared by every fetch.
+
+    The pool is never replaced while fetches may be using it. It grows
+    when a fetch needs more threads than it has and keeps its largest
+    size; idle threads only wait for work.
+    """
+
+    global _fetch_executor
+    with _fetch_lock:
+        if _fetch_executor is None:
+            _fetch_executor = ThreadPoolExecutor(size)
+        elif _fetch_executor._max_workers < size:
+            # Threads are started on demand up to _max_workers.
+            _fetch_executor._max_workers = size
+        return _fetch_executor
+
+
+def _shared_rate_limiter():
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
+
+
+def normalize_url(link):
+    """Normalizes a link so that equivalent links compare equal.
+
+    The scheme and host are lowercased, default ports and fragments
+    are removed and an empty path becomes "/".
+
+    Args:
+        link (str): Link to be normalized.
 
     Returns:
-        List[SiteData]: List of Dicts containing an id corresponding to
-            a NetWatch Alert and its corresponding HTML.
+        str: Normalized link.
+    """
+
+    parsed = urlparse(link.strip())
+    scheme = parsed.scheme.lower()
+    netloc = parsed.netloc.lower()
+    if (scheme, parsed.port) in [("http", 80), ("https", 443)]:
+        netloc = netloc.rsplit(":", 1)[0]
+    return urlunparse(
+        (scheme, netloc, parsed.path or "/", parsed.params, parsed.query, "")
+    )
+
+
+def group_site_data(site_data):
+    """Groups SiteData that can share a single page load.
+
+    SiteData share a page when their normalized links are the same
+    and they are loaded the same way: SiteData in `http` and `auto`
+    mode share one HTTP request, and SiteData in `browser` mode share
+    a rendered page when their blocking profiles are the same.
+
+    Args:
+        site_data (List[SiteData]): SiteData to be grouped.
+
+    Returns:
+        List[List[SiteData]]: Groups of SiteData, in order of first
+            appearance.
+    """
+
+    pages = OrderedDict()
+    for data in site_data:
+        if data.fetch_mode == "browser":
+            key = (
+                normalize_url(data.link), "browser", repr(data.block_profile))
+        else:
+            key = (normalize_url(data.link), "http")
+        pages.setdefault(key, []).append(data)
+    return list(pages.values())
+
+
+def fetch_http_html(site_data, session=None, timeout=30):
+    """Retrieves SiteData HTML with a single plain HTTP GET request.
+
+    Every SiteData must point to the same page. The request is
+    conditional when all of them share validators from a previous
+    fetch. A 304 response sets their status to "not_modified" without
+    reading or parsing a body. Otherwise the response is parsed once
+    without running any JavaScript, each SiteData's selector is
+    applied with BeautifulSoup and their validators are replaced with
+    the response's. SiteData whose selector matched get the status
+    "ok", except in `auto` mode when the matched element has no text,
+    since it may be a placeholder that JavaScript fills in. SiteData
+    whose selector is invalid get the status "error" without
+    affecting the others.
+
+    Args:
+        site_data (List[SiteData]): Single/List of SiteData object(s)
+            pointing to the same page. Their html attribute is set to
+            the selected element's inner HTML.
+        session (requests.Session): Optional; Session used to send
+            the request.
+        timeout (float): Optional; Request timeout in seconds.
     """
 
     if not isinstance(site_data, list):
         site_data = [site_data]
-    driver = initialize_driver(chromedriver_path, driver_options)
+
+    headers = dict(HTTP_HEADERS)
+    validators = set((data.etag, data.last_modified) for data in site_data)
+    if len(validators) == 1:
+        etag, last_modified = validators.pop()
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+    response = (session or requests).get(
+        site_data[0].link, headers=headers, timeout=timeout)
+    if response.status_code == 304:
+        for data in site_data:
+            data.status = "not_modified"
+        return
+    response.raise_for_status()
+    soup = BeautifulSoup(response.content, "html.parser")
 
     for data in site_data:
+        data.etag = response.headers.get("ETag")
+        data.last_modified = response.headers.get("Last-Modified")
+        data.content_length = int(
+            response.headers.get("Content-Length", len(response.content)))
+        if len(data.selector) > 0:
+            try:
+                element = soup.select_one(data.selector)
+            except Exception as e:
+                _fail(data, "error", "Invalid selector: {}".format(e))
+                continue
+            if element is not None and (
+                data.fetch_mode != "auto"
+                or len(element.get_text(strip=True)) > 0
+            ):
+                data.html = element.decode_contents()
+                data.status = "ok"
+        elif soup.body is not None and len(soup.body.get_text(strip=True)) > 0:
+            data.html = str(soup)
+            data.status = "ok"
+
+
+def fetch_site_html(
+    site_data,
+    chromedriver_path=None,
+    driver_options=DEFAULT_DRIVER_OPTIONS,
+    pool=None,
+    concurrency=10,
+    per_host=2,
+    rate_limiter=None,
+    stop_event=None,
+):
+    """Processes NetWatch Alerts using their fetch mode.
+
+    Synchronous wrapper around fetch_site_html_async that waits for
+    every SiteData to be fetched.
+
+    Args:
+        site_data (List[SiteData]): Single/List of SiteData object(s).
+        chromedriver_path (str): Optional; Path to chromdriver.exe. Used
+            when `pool` is not given.
+        driver_options (List[str]): Optional; List of driver options. Used
+            when `pool` is not given.
+        pool (DriverPool): Optional; Pool to lease the driver from.
+            Defaults to the shared driver pool.
+        concurrency (int): Optional; Maximum number of pages fetched
+            at once.
+        per_host (int): Optional; Maximum number of pages fetched at
+            once from a single host.
+        rate_limiter (RateLimiter): Optional; Limiter every page load
+            takes a token from. Defaults to the shared rate limiter.
+        stop_event (threading.Event): Optional; Event that cancels the
+            fetch once set. Pages that have not started are not
+            loaded, rendering stops at the next poll and SiteData that
+            are not done yet are left out of the results.
+
+    Returns:
+        List[SiteData]: List of SiteData objects containing an id
+            corresponding to a NetWatch Alert and its corresponding HTML,
+            in the order they were given.
+    """
+
+    if not isinstance(site_data, list):
+        site_data = [site_data]
+    for _ in iter_site_html(
+        site_data,
+        chromedriver_path=chromedriver_path,
+        driver_options=driver_options,
+        pool=pool,
+        concurrency=concurrency,
+        per_host=per_host,
+        rate_limiter=rate_limiter,
+        stop_event=stop_event,
+    ):
+        pass
+    return site_data
+
+
+def iter_site_html(
+    site_data,
+    chromedriver_path=None,
+    driver_options=DEFAULT_DRIVER_OPTIONS,
+    pool=None,
+    concurrency=10,
+    per_host=2,
+    rate_limiter=None,
+    stop_event=None,
+    batch=False,
+):
+    """Yields SiteData as soon as each one has been fetched.
+
+    Synchronous wrapper around fetch_site_html_async that runs the
+    fetches on a private event loop. See fetch_site_html_async and
+    fetch_site_html for a description of the arguments.
+
+    Yields:
+        SiteData or List[SiteData]: Fetched SiteData, in order of
+            completion.
+    """
+
+    loop = asyncio.new_event_loop()
+    results = fetch_site_html_async(
+        site_data,
+        chromedriver_path=chromedriver_path,
+        driver_options=driver_options,
+        pool=pool,
+        concurrency=concurrency,
+        per_host=per_host,
+        rate_limiter=rate_limiter,
+        stop_event=stop_event,
+        batch=batch,
+    )
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(results.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(results.aclose())
+        loop.close()
+
+
+async def fetch_site_html_async(
+    site_data,
+    chromedriver_path=None,
+    driver_options=DEFAULT_DRIVER_OPTIONS,
+    pool=None,
+    concurrency=10,
+    per_host=2,
+    rate_limiter=None,
+    stop_event=None,
+    batch=False,
+):
+    """Fetches SiteData concurrently using their fetch mode.
+
+    SiteData in `http` mode is retrieved with a plain HTTP request and
+    SiteData in `browser` mode is rendered with a driver leased from
+    `pool`. SiteData in `auto` mode is first retrieved over HTTP and
+    falls back to the browser when its selector does not match the
+    static page; its fetch_mode is set to the mode that worked.
+
+    SiteData pointing to the same page are grouped with
+    group_site_data and the page is loaded once for the whole group.
+    The blocking fetches run on a thread pool, limited to
+    `concurrency` pages at once and `per_host` pages at once for
+    each host, and every page load waits for a token from
+    `rate_limiter`. The limits and the thread pool are shared by all
+    fetches of the process (see get_fetch_limiter), so concurrent
+    calls do not multiply them. Time spent waiting for tokens is
+    recorded in the `rate_limit` timing of each SiteData. A SiteData
+    whose fetch fails gets the status "error". Once `stop_event` is
+    set, SiteData that are already done are still yielded and the
+    others are dropped. See fetch_site_html for a description of the
+    other arguments.
+
+    Args:
+        batch (bool): Optional; Yield lists of every SiteData that is
+            done at the time instead of one SiteData at a time.
+
+    Yields:
+        SiteData or List[SiteData]: Fetched SiteData, in order of
+            completion.
+    """
+
+    if not isinstance(site_data, list):
+        site_data = [site_data]
+    if pool is None:
+        pool = get_driver_pool(
+            chromedriver_path or DEFAULT_CHROMEDRIVER_PATH, driver_options)
+    if rate_limiter is None:
+        rate_limiter = _shared_rate_limiter()
+
+    loop = asyncio.get_event_loop()
+    limiter = get_fetch_limiter(concurrency, per_host)
+    render_queue = asyncio.Queue()
+    done = asyncio.Queue()
+    reported = set()
+    starts = {}
+    executor = _shared_fetch_executor(max(1, concurrency) + pool.size)
+    session = requests.Session()
+
+    def stopped():
+        return stop_event is not None and stop_event.is_set()
+
+    def report(data):
+        if id(data) not in reported:
+            reported.add(id(data))
+            if id(data) in starts:
+                data.timings["fetch"] = time.time() - starts[id(data)]
+            done.put_nowait(data)
+
+    async def throttle(page, host):
+        wait = rate_limiter.reserve(host)
+        if wait > 0:
+            await asyncio.sleep(wait)
+            for data in page:
+                data.timings["rate_limit"] = (
+                    data.timings.get("rate_limit", 0) + wait)
+
+    async def fetch(page):
+        try:
+            await load(page)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Every SiteData is reported, so one failure cannot leave
+            # the others waiting for it.
+            print("Fetch failed for {}".format(page[0].link), e)
+            for data in page:
+                if data.status is None:
+                    _fail(data, "error", str(e))
+                report(data)
+
+    async def load(page):
+        host = urlparse(page[0].link).netloc.lower()
+        async with limiter.slot(host):
+            # Wait for the rate limiter before taking one of the
+            # `concurrency` slots, so other hosts are not held up.
+            await throttle(page, host)
+            async with limiter.slot():
+                if stopped():
+                    return
+                started = time.time()
+                for data in page:
+                    starts[id(data)] = started
+                    data.deadline = started + data.timeout
+                deadline = max(data.deadline for data in page)
+                try:
+                    render = page
+                    if page[0].fetch_mode != "browser":
+                        render = await asyncio.wait_for(
+                            loop.run_in_executor(
+                                executor, _fetch_static, page, session),
+                            deadline - time.time(),
+                        )
+                        for data in page:
+                            if data not in render:
+                                report(data)
+                        if len(render) > 0:
+                            await throttle(render, host)
+                    if len(render) > 0:
+                        # The budget of a rendered page starts when its
+                        # tab is navigated, not while it waits for a
+                        # driver.
+                        for data in render:
+                            data.deadline = None
+                        renders = []
+                        for group in _split_block_profiles(render):
+                            renders.append(loop.create_future())
+                            render_queue.put_nowait((group, renders[-1]))
+                        await asyncio.wait_for(
+                            asyncio.gather(*renders),
+                            RENDER_QUEUE_TIMEOUT
+                            + max(data.timeout for data in render),
+                        )
+                except asyncio.TimeoutError:
+                    pass
+                for data in page:
+                    if data.status is None:
+                        if stopped():
+                            continue
+                        print("Time budget exceeded for {}".format(data.link))
+                        _fail(data, "timeout", "Time budget exceeded")
+                    report(data)
+
+    async def render():
+        while True:
+            batch = [await render_queue.get()]
+            while len(batch) < pool.tabs and not render_queue.empty():
+                batch.append(render_queue.get_nowait())
+            batch = [item for item in batch if not item[1].done()]
+            if len(batch) == 0 or stopped():
+                for _, future in batch:
+                    _set_done(future)
+                continue
+            owners = {id(data): item for item in batch for data in item[0]}
+
+            def rendered(data):
+                report(data)
+                page, future = owners[id(data)]
+                if all(id(member) in reported for member in page):
+                    _set_done(future)
+
+            try:
+                await loop.run_in_executor(
+                    executor,
+                    _render_sites,
+                    [page for page, _ in batch],
+                    pool,
+                    lambda data: loop.call_soon_threadsafe(rendered, data),
+                    stop_event,
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("Render failed", e)
+                for page, _ in batch:
+                    for data in page:
+                        if id(data) not in reported:
+                            _fail(data, "error", str(e))
+                            report(data)
+            finally:
+                for _, future in batch:
+                    _set_done(future)
+
+    pages = group_site_data(site_data)
+    renderers = [asyncio.ensure_future(render()) for _ in range(pool.size)]
+    tasks = [asyncio.ensure_future(fetch(page)) for page in pages]
+    try:
+        remaining = len(site_data)
+        while remaining > 0:
+            data = await _next_result(done, stop_event)
+            if data is None:
+                break
+            if not batch:
+                remaining -= 1
+                yield data
+                continue
+            ready = [data]
+            while not done.empty():
+                ready.append(done.get_nowait())
+            remaining -= len(ready)
+            yield ready
+    finally:
+        for task in tasks + renderers:
+            task.cancel()
+        if tasks or renderers:
+            # Give cancelled tasks a chance to release their slots.
+            await asyncio.wait(tasks + renderers)
+        session.close()
+
+
+async def _next_result(done, stop_event):
+    """Returns the next fetched SiteData, or None once stopped."""
+
+    while stop_event is not None and done.empty():
+        if stop_event.is_set():
+            return None
         try:
-            driver.get(data.link)
-            driver.implicitly_wait(100)
-            if len(data.selector) > 0:
-                data.html = driver.find_element_by_css_selector(
-                    data.selector
-                ).get_attribute("innerHTML")
+            return await asyncio.wait_for(done.get(), POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+    return await done.get()
+
+
+def _fetch_static(page, session):
+    """Fetches a page over HTTP.
+
+    Returns:
+        List[SiteData]: SiteData in `auto` mode that need to be rendered.
+    """
+
+    error = "Selector did not match the page"
+    try:
+        fetch_http_html(page, session=session, timeout=page[0].timeout)
+    except requests.RequestException as e:
+        print("HTTP fetch failed for {}".format(page[0].link), e)
+        error = str(e)
+    except Exception as e:
+        print("Fetch failed for {}".format(page[0].link), e)
+        for data in page:
+            _fail(data, "error", str(e))
+        return []
+
+    render = []
+    for data in page:
+        if data.status in ["ok", "not_modified"]:
+            if data.fetch_mode == "auto":
+                data.fetch_mode = "http"
+        elif data.fetch_mode == "auto":
+            # The browser may still support a selector BeautifulSoup
+            # could not parse.
+            data.status = data.error = None
+            data.html = data.etag = data.last_modified = None
+            data.content_length = None
+            render.append(data)
+        elif data.status is None:
+            _fail(data, "error", error)
+    return render
+
+
+def _split_block_profiles(page):
+    """Splits SiteData falling back to the browser by blocking profile."""
+
+    pages = OrderedDict()
+    for data in page:
+        pages.setdefault(repr(data.block_profile), []).append(data)
+    return list(pages.values())
+
+
+def _fail(data, status, error):
+    data.status = status
+    data.error = error
+
+
+def _set_done(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _render_sites(pages, pool, finished, stop_event=None):
+    """Renders pages, turning any failure into per-SiteData errors."""
+
+    try:
+        fetch_browser_html(
+            pages, pool, finished=finished, stop_event=stop_event)
+    except Exception as e:
+        if stop_event is not None and stop_event.is_set():
+            return
+        print("Browser fetch failed", e)
+        for page in pages:
+            for data in page:
+                if data.status is None:
+                    _fail(data, "error", "Browser failed: {}".format(e))
+                    if finished:
+                        finished(data)
+
+
+def fetch_browser_html(site_data, pool, finished=None, stop_event=None):
+    """Renders SiteData with a Selenium webdriver.
+
+    Each page is loaded once and the selectors of all SiteData in
+    it are applied to the same document. Up to `pool.tabs` pages are
+    loaded at the same time, each in its own tab of the leased driver.
+
+    Args:
+        site_data (List[SiteData] or List[List[SiteData]]): SiteData to
+            be rendered, or pages of SiteData as returned by
+            group_site_data.
+        pool (DriverPool): Pool to lease the driver from.
+        finished (Callable[[SiteData], None]): Optional; Called with
+            each SiteData as soon as it is done.
+        stop_event (threading.Event): Optional; Event that cancels
+            rendering once set. It is checked between pages and on
+            every poll, and the leased driver is discarded.
+
+    Returns:
+        List[SiteData]: The rendered SiteData.
+    """
+
+    pages = [
+        page if isinstance(page, list) else [page] for page in site_data
+    ]
+    with pool.lease() as lease:
+        for i in range(0, len(pages), pool.tabs):
+            batch = pages[i:i + pool.tabs]
+            lease.pages += len(batch)
+            _render_tabs(lease, batch, finished, stop_event)
+    return [data for page in pages for data in page]
+
+
+def blocked_urls(profile):
+    """Returns the URL patterns blocked by a blocking profile.
+
+    Args:
+        profile (str or List[str]): Name of one of BLOCKING_PROFILES,
+            or a list (or comma separated string) of resource types
+            from BLOCKED_RESOURCES and URL patterns.
+
+    Returns:
+        List[str]: URL patterns for Network.setBlockedURLs. Patterns
+            match the whole URL, so an extension pattern such as
+            "*.png" is complemented with "*.png?*".
+    """
+
+    if not profile:
+        return []
+    if isinstance(profile, str):
+        if profile in BLOCKING_PROFILES:
+            profile = BLOCKING_PROFILES[profile]
+        else:
+            profile = [entry.strip() for entry in profile.split(",")]
+
+    urls = []
+    for entry in profile:
+        for url in BLOCKED_RESOURCES.get(entry, [entry] if entry else []):
+            urls.append(url)
+            if url.startswith("*.") and "?" not in url and url[-1] != "*":
+                urls.append(url + "?*")
+    return urls
+
+
+def _open_tabs(driver, count):
+    while len(driver.window_handles) < count:
+        driver.execute_script("window.open('about:blank', '_blank');")
+    return driver.window_handles[:count]
+
+
+def _render_tabs(lease, pages, finished=None, stop_event=None):
+    """Loads each page in its own tab and collects its SiteData's HTML.
+
+    Every tab is navigated before any of them is waited on, so the
+    pages load in parallel. A marker set on the previous document
+    tells a tab that is still showing its old page apart from one
+    that has moved on to the new page. Each tab is then polled until
+    every SiteData in its page has met its wait rule and matched its
+    selector, or has passed its deadline.
+
+    Requests matching the page's blocking profile, or the pool's if
+    it has none, are blocked through the DevTools protocol before the
+    tab is navigated. The lease sends a heartbeat on every poll, and
+    rendering is cancelled with an exception once `stop_event` is set.
+    """
+
+    if stop_event is not None and stop_event.is_set():
+        raise Exception("Rendering cancelled")
+    driver = lease.driver
+    pending = {}
+    for handle, page in zip(_open_tabs(driver, len(pages)), pages):
+        waiting = []
+        for data in page:
+            if data.deadline is None:
+                data.deadline = time.time() + data.timeout
+            if data.status is None and time.time() < data.deadline:
+                waiting.append(data)
             else:
-                data.html = driver.page_source
-        except TimeoutException as e:
-            print("Page load timeout occurred, reloading driver", e)
-            driver.service.process.kill()
-            driver.close()
-            driver = initialize_driver(chromedriver_path, driver_options)
-    driver.close()
-    return site_data
+                if data.status is None:
+                    _fail(data, "timeout", "Time budget exceeded")
+                if finished:
+                    finished(data)
+        if len(waiting) == 0:
+            continue
+
+        driver.switch_to.window(handle)
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {
+            "urls": blocked_urls(
+                page[0].block_profile
+                if page[0].block_profile is not None
+                else lease.pool.block_profile
+            )
+        })
+        driver.execute_script(
+            "window.__netwatch_stale = true;"
+            "window.location.href = arguments[0];",
+            page[0].link,
+        )
+        pending[handle] = {
+            "waiting": waiting,
+            "started": None,
+            "parsed": None,
+            "loaded": None,
+            "resources": -1,
+            "changed": None,
+            "matches": {},
+        }
+
+    while pending:
+        if stop_event is not None and stop_event.is_set():
+            raise Exception("Rendering cancelled")
+        lease.beat()
+        for handle, tab in list(pending.items()):
+            driver.switch_to.window(handle)
+            for data in _poll_tab(driver, tab, time.time()):
+                tab["waiting"].remove(data)
+                if finished:
+                    finished(data)
+            if len(tab["waiting"]) == 0:
+                driver.execute_script(
+                    "window.stop(); window.location.href = 'about:blank';")
+                pending.pop(handle)
+        if pending:
+            time.sleep(POLL_INTERVAL)
+
+
+def _poll_tab(driver, tab, now):
+    """Checks a tab once.
+
+    Returns:
+        List[SiteData]: SiteData that are done, either because their
+            HTML was collected or because their deadline has passed.
+    """
+
+    stale, state, resources = driver.execute_script(
+        "return [!!window.__netwatch_stale, document.readyState,"
+        " performance.getEntriesByType('resource').length];"
+    )
+    if not stale:
+        if tab["started"] is None:
+            tab["started"] = now
+        if tab["parsed"] is None and state != "loading":
+            tab["parsed"] = now
+        if tab["loaded"] is None and state == "complete":
+            tab["loaded"] = tab["changed"] = now
+        if resources != tab["resources"]:
+            tab["resources"], tab["changed"] = resources, now
+
+    finished = []
+    ready = []
+    for data in tab["waiting"]:
+        if data.status is not None:  # the caller has stopped waiting
+            finished.append(data)
+        elif now >= data.deadline:
+            print("Time budget exceeded for {}".format(data.link))
+            _fail(data, "timeout", "Time budget exceeded")
+            finished.append(data)
+        elif _is_ready(data, tab, now):
+            ready.append(data)
+    if len(ready) == 0:
+        return finished
+
+    # An invalid selector is reported on its own SiteData instead of
+    # failing the whole script.
+    selected = driver.execute_script(
+        "return arguments[0].map(function (selector) {"
+        " try { var element = document.querySelector(selector); }"
+        " catch (e) { return {error: String(e)}; }"
+        " return element ? element.innerHTML : null; });",
+        [data.selector for data in ready if len(data.selector) > 0],
+    )
+    for data in ready:
+        if len(data.selector) > 0:
+            html = selected.pop(0)
+        else:
+            html = driver.page_source
+        if isinstance(html, dict):
+            print("Invalid selector for {}".format(data.link), html["error"])
+            _fail(data, "error", "Invalid selector: {}".format(html["error"]))
+            finished.append(data)
+        elif html is not None and not _is_settled(data, tab, html):
+            continue
+        elif html is not None:
+            data.html = html
+            data.fetch_mode = "browser"
+            data.status = "ok"
+            finished.append(data)
+    return finished
+
+
+def _is_ready(data, tab, now):
+    if data.wait_for == "selector" and len(data.selector) > 0:
+        return tab["parsed"] is not None
+    if tab["loaded"] is None:
+        return False
+    if data.wait_for == "delay":
+        return now - tab["loaded"] >= data.wait_delay
+    if data.wait_for == "network_idle":
+        return now - tab["changed"] >= NETWORK_IDLE_TIME
+    return True
+
+
+def _is_settled(data, tab, html):
+    """Returns True if a selector match can be collected.
+
+    Before the page has loaded, scripts may still be filling in the
+    matched element, so its HTML is only collected once it is not
+    empty and is the same on two polls in a row.
+    """
+
+    if data.wait_for != "selector" or tab["loaded"] is not None:
+        return True
+    previous = tab["matches"].get(id(data))
+    tab["matches"][id(data)] = html
+    return len(html.strip()) > 0 and html == previous
@@ -7,18 +7,120 @@ or even a command line utility like cURL. Full API documentation
 can be found on the NetWatch GitHub repository under the `docs`
 folder.
 
+Attributes:
+    SERVER_FIELDS (List[str]): Alert attributes kept up to date by
+        NetWatch itself. They are ignored when a client sends them
+        back in an update.
+
 Todo:
     * Add proper error handling and param checking to API.
 """
 
 import json
 import threading
+import time
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 from urllib.parse import parse_qs, urlparse
 
-from netwatch.common import process_alert
+from croniter import croniter
+
+import netwatch.backend
+import netwatch.content
+import netwatch.scheduler
+import netwatch.scraper
+import netwatch.snapshots
+from netwatch.common import get_update_diff, process_alert, snapshot_options
+from netwatch.metrics import metrics
 from netwatch.store import store
 
+SERVER_FIELDS = [
+    "hash", "hash_version", "fingerprint", "etag", "last_modified",
+    "content_length", "last_checked", "unchanged_checks", "last_error",
+]
+
+
+def _parse_normalize(value):
+    """Parses and validates JSON normalization rules."""
+
+    if value in (None, "", "None"):
+        return None
+    rules = json.loads(value)
+    if not isinstance(rules, dict):
+        raise ValueError("Normalization rules must be a JSON object")
+    netwatch.content.get_normalizer(rules)
+    return rules
+
+
+def _parse_float(value):
+    return float(value) if value not in (None, "", "None") else None
+
+
+def _parse_bool(value):
+    if value in (None, "", "None"):
+        return None
+    if value not in ("True", "False"):
+        raise ValueError("Invalid boolean: {}".format(value))
+    return value == "True"
+
+
+def _parse_optional(value):
+    return value if value not in (None, "", "None") else None
+
+
+def _parse_frequency(value):
+    if not croniter.is_valid(value):
+        raise ValueError("Invalid frequency: {}".format(value))
+    return value
+
+
+def _choice(choices, optional=False):
+    """Returns a parser accepting one of `choices`."""
+
+    def parse(value):
+        if optional and value in (None, "", "None"):
+            return None
+        if value not in choices:
+            raise ValueError("Invalid value: {}".format(value))
+        return value
+
+    return parse
+
+
+_ALERT_PARSERS = {
+    "email": lambda value: _parse_bool(value) is True,
+    "frequency": _parse_frequency,
+    "fetch_mode": _choice(netwatch.scraper.FETCH_MODES),
+    "wait_for": _choice(netwatch.scraper.WAIT_RULES),
+    "wait_delay": float,
+    "timeout": float,
+    "block_profile": _parse_optional,
+    "normalize": _parse_normalize,
+    "similarity_threshold": _parse_float,
+    "adaptive": _parse_bool,
+    "catch_up": _choice(netwatch.scheduler.CATCH_UP_POLICIES, True),
+    "jitter": _parse_float,
+}
+
+
+def _parse_alert_values(queries):
+    """Converts and validates the query of an Alert request.
+
+    Raises:
+        ValueError: A parameter is repeated or has an invalid value.
+
+    Returns:
+        Dict: Alert attributes, without SERVER_FIELDS.
+    """
+
+    values = {}
+    for key, value in queries.items():
+        if key == "id" or key in SERVER_FIELDS:
+            continue
+        if len(value) > 1:
+            raise ValueError("Repeated parameter: {}".format(key))
+        values[key] = _ALERT_PARSERS.get(key, str)(value[0])
+    return values
+
 
 class _MyHandler(SimpleHTTPRequestHandler):
     def process_url(self):
@@ -29,7 +131,7 @@ class _MyHandler(SimpleHTTPRequestHandler):
         split_path = parsed.path.split("/")[1:]
         datatype = split_path[0]
         identifier = None if len(split_path) < 2 else split_path[1]
-        queries = parse_qs(parsed.query)
+        queries = parse_qs(parsed.query, keep_blank_values=True)
         return datatype, identifier, queries
 
     def default_headers(self):
@@ -37,6 +139,13 @@ class _MyHandler(SimpleHTTPRequestHandler):
         self.send_header("Content-type", "json")
         self.end_headers()
 
+    def invalid_request(self, error=None):
+        message = "Invalid Request"
+        if error is not None:
+            message += ": {}".format(" ".join(str(error).split()))
+        self.send_response(400, message)
+        self.end_headers()
+
     def do_GET(self):
         datatype, identifier, queries = self.process_url()
 
@@ -60,6 +169,20 @@ class _MyHandler(SimpleHTTPRequestHandler):
                 )
             )
             return
+        elif datatype == "diffs" and identifier:
+            mode = queries.get("mode", ["html"])[0]
+            if mode in netwatch.content.DIFF_MODES:
+                diff = get_update_diff(identifier, mode)
+                if diff is not None:
+                    self.default_headers()
+                    self.wfile.write(bytes(json.dumps(
+                        {"id": identifier, "mode": mode, "diff": diff}
+                    ), "utf-8"))
+                    return
+        elif datatype == "metrics":
+            self.default_headers()
+            self.wfile.write(bytes(json.dumps(metrics.to_json()), "utf-8"))
+            return
         elif datatype == "config":
             self.default_headers()
             self.wfile.write(bytes(json.dumps(store.get_config()), "utf-8"))
@@ -72,17 +195,15 @@ class _MyHandler(SimpleHTTPRequestHandler):
         datatype, identifier, queries = self.process_url()
 
         if datatype == "alerts":
+            # Everything is validated before the response is started,
+            # so invalid input gets a 400 instead of an empty 200.
+            try:
+                alert = store.update_alert(
+                    identifier, **_parse_alert_values(queries))
+            except Exception as e:
+                self.invalid_request(e)
+                return
             self.default_headers()
-            if "id" in queries:
-                queries.pop("id")
-            alert = store.update_alert(
-                identifier,
-                **{
-                    key: bool(value[0]) if value[0] in [
-                        "False", "True"] else value[0]
-                    for key, value in queries.items()
-                }
-            )
             self.wfile.write(bytes(json.dumps(alert.to_json()), "utf-8"))
             return
         elif datatype == "config":
@@ -100,6 +221,8 @@ class _MyHandler(SimpleHTTPRequestHandler):
         if datatype == "alerts":
             self.default_headers()
             alert = store.delete_alert(identifier)
+            netwatch.snapshots.get_snapshot_store(
+                **snapshot_options()).delete_alert(identifier)
             self.wfile.write(bytes(json.dumps(alert.to_json()), "utf-8"))
             return
 
@@ -118,19 +241,13 @@ class _MyHandler(SimpleHTTPRequestHandler):
             )
             return
         elif datatype == "alerts":
+            try:
+                alert = store.create_alert(
+                    hash=None, **_parse_alert_values(queries))
+            except Exception as e:
+                self.invalid_request(e)
+                return
             self.default_headers()
-            alert = store.create_alert(
-                name=queries["name"][0],
-                description=queries["description"][0],
-                alert=queries["alert"][0],
-                link=queries["link"][0],
-                selector=queries["selector"][0],
-                hash="",
-                email=bool(queries["email"][0]),
-                recipient=queries["recipient"][0],
-                content_type=queries["content_type"][0],
-                frequency=queries["frequency"][0],
-            )
             self.wfile.write(bytes(json.dumps(alert.to_json()), "utf-8"))
             return
 
@@ -167,10 +284,18 @@ class Server:
         self.thread.start()
 
     def stop(self):
-        """Stops the server"""
+        """Stops the server and quits pooled webdrivers and workers
+
+        Like Scheduler.stop, `process` backend workers are given up to
+        the shutdown_timeout configuration (in seconds) to finish their
+        batches before they are terminated.
+        """
 
+        deadline = time.time() + float(store.get_config("shutdown_timeout", 10))
         self.server.shutdown()
         self.thread.join()
+        netwatch.scraper.close_driver_pool()
+        netwatch.backend.shutdown(timeout=max(0, deadline - time.time()))
 
     def _server_handler(self, server):
         try:
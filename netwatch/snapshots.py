@@ -0,0 +1,323 @@
+"""Module for storing snapshots of scraped website content.
+
+Snapshots are kept in a content-addressed store: every distinct piece
+of content is saved once under its hash, no matter how many Alerts or
+checks produced it, and each Alert keeps a history of the hashes it
+has seen. Content is zlib-compressed at rest and can optionally be
+delta-encoded against the Alert's previous snapshot. A retention
+policy bounds the number of snapshots kept per Alert and the total
+size of the store.
+
+The index of the store is written to disk at most every
+SAVE_INTERVAL seconds, and when the process exits, instead of on
+every change.
+
+Attributes:
+    SNAPSHOTS_DIR (Path): Directory of the snapshot store.
+    SAVE_INTERVAL (float): Minimum seconds between writes of the index.
+
+Example:
+    Import usage::
+
+        >>> import snapshots
+        >>> store = snapshots.get_snapshot_store(delta=True, max_count=20)
+        >>> store.put("a1b2", "d41d8cd9", "<html>...</html>")
+        >>> store.get("d41d8cd9")
+        '<html>...</html>'
+"""
+
+import atexit
+import difflib
+import heapq
+import json
+import os
+import threading
+import time
+import zlib
+
+from netwatch.store import PARENT_DIR
+
+SNAPSHOTS_DIR = PARENT_DIR / "data" / "snapshots"
+SAVE_INTERVAL = 5
+
+_FULL = b"F"
+_DELTA = b"D"
+
+_snapshot_store = None
+_snapshot_store_lock = threading.Lock()
+
+
+class SnapshotStore:
+    """Content-addressed, compressed store of website snapshots.
+
+    Attributes:
+        directory (Path): Directory the snapshots are saved in.
+        delta (bool): Whether new snapshots are delta-encoded against
+            the Alert's previous snapshot.
+        max_chain (int): Maximum number of deltas that have to be
+            applied to rebuild a snapshot.
+        max_count (int): Maximum number of snapshots kept per Alert,
+            or None for no limit.
+        max_bytes (int): Maximum size of the store on disk, or None
+            for no limit. The latest snapshot of every Alert is
+            always kept.
+        objects (Dict[str, Dict]): Stored content by hash, with its
+            delta base, chain depth, size on disk and reference count.
+        alerts (Dict[str, List[Dict]]): Snapshot history of each
+            Alert, oldest first.
+        total_bytes (int): Size of the stored snapshots in bytes.
+        lock (threading.Lock): Lock for accessing the store.
+    """
+
+    def __init__(
+        self, directory=SNAPSHOTS_DIR, delta=False, max_chain=10, max_count=None,
+        max_bytes=None
+    ):
+        self.directory = directory
+        self.delta = delta
+        self.max_chain = max_chain
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = 0
+        os.makedirs(directory / "objects", exist_ok=True)
+        try:
+            with open(directory / "index.json", "r") as file:
+                index = json.load(file)
+        except (FileNotFoundError, ValueError):
+            index = {}
+        self.objects = index.get("objects", {})
+        self.alerts = index.get("alerts", {})
+        self.total_bytes = sum(info["size"] for info in self.objects.values())
+
+    def put(self, alert_id, content_hash, content):
+        """Saves a snapshot of an Alert's content.
+
+        Content that is already stored is not written again.
+
+        Args:
+            alert_id (str): Id of the Alert the content belongs to.
+            content_hash (str): Hash of the content.
+            content (str): The content.
+        """
+
+        with self.lock:
+            history = self.alerts.setdefault(alert_id, [])
+            if history and history[-1]["hash"] == content_hash:
+                return
+            if content_hash in self.objects:
+                self.objects[content_hash]["refs"] += 1
+            else:
+                base = history[-1]["hash"] if history else None
+                self._write(content_hash, content, base)
+            history.append({"hash": content_hash, "time": time.time()})
+            self._apply_retention(history)
+            self._dirty = True
+        self._save_index()
+
+    def get(self, content_hash):
+        """Returns stored content.
+
+        Args:
+            content_hash (str): Hash of the content.
+
+        Returns:
+            str: The content, or None if it is not stored.
+        """
+
+        with self.lock:
+            if content_hash not in self.objects:
+                return None
+            return self._read(content_hash)
+
+    def history(self, alert_id):
+        """Returns the snapshot history of an Alert.
+
+        Args:
+            alert_id (str): Id of the Alert.
+
+        Returns:
+            List[Dict]: Hash and time of each snapshot, oldest first.
+        """
+
+        with self.lock:
+            return [dict(entry) for entry in self.alerts.get(alert_id, [])]
+
+    def delete_alert(self, alert_id):
+        """Removes an Alert's snapshots.
+
+        Args:
+            alert_id (str): Id of the Alert.
+        """
+
+        with self.lock:
+            for entry in self.alerts.pop(alert_id, []):
+                self._release(entry["hash"])
+            self._dirty = True
+        self._save_index()
+
+    def size(self):
+        """Returns the size of the stored snapshots in bytes."""
+
+        with self.lock:
+            return self.total_bytes
+
+    def flush(self):
+        """Writes the index to disk if it has unsaved changes."""
+
+        self._save_index(force=True)
+
+    def _path(self, content_hash):
+        return self.directory / "objects" / content_hash[:2] / content_hash
+
+    def _write(self, content_hash, content, base=None):
+        data = content.encode()
+        payload = _FULL + zlib.compress(data)
+        depth = 0
+        if (
+            self.delta
+            and base in self.objects
+            and self.objects[base]["depth"] < self.max_chain
+        ):
+            delta = _DELTA + zlib.compress(json.dumps(
+                [base, _encode_delta(self._read(base), content)]
+            ).encode())
+            if len(delta) < len(payload):
+                payload = delta
+                depth = self.objects[base]["depth"] + 1
+                self.objects[base]["refs"] += 1
+            else:
+                base = None
+        else:
+            base = None
+
+        path = self._path(content_hash)
+        os.makedirs(path.parent, exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(payload)
+        self.objects[content_hash] = {
+            "base": base,
+            "depth": depth,
+            "size": len(payload),
+            "refs": 1,
+        }
+        self.total_bytes += len(payload)
+
+    def _read(self, content_hash):
+        with open(self._path(content_hash), "rb") as file:
+            payload = file.read()
+        data = zlib.decompress(payload[1:]).decode()
+        if payload[:1] == _FULL:
+            return data
+        base, delta = json.loads(data)
+        return _apply_delta(self._read(base), delta)
+
+    def _release(self, content_hash):
+        """Drops a reference to stored content, deleting unused content."""
+
+        info = self.objects[content_hash]
+        info["refs"] -= 1
+        if info["refs"] > 0:
+            return
+        del self.objects[content_hash]
+        self.total_bytes -= info["size"]
+        try:
+            os.remove(self._path(content_hash))
+        except FileNotFoundError:
+            pass
+        if info["base"] is not None:
+            self._release(info["base"])
+
+    def _apply_retention(self, history):
+        """Trims a history that grew and evicts the oldest snapshots."""
+
+        if self.max_count is not None:
+            excess = max(0, len(history) - max(1, self.max_count))
+            for entry in history[:excess]:
+                self._release(entry["hash"])
+            del history[:excess]
+
+        if self.max_bytes is None or self.total_bytes <= self.max_bytes:
+            return
+        oldest = [
+            (entries[0]["time"], alert_id)
+            for alert_id, entries in self.alerts.items() if len(entries) > 1
+        ]
+        heapq.heapify(oldest)
+        while oldest and self.total_bytes > self.max_bytes:
+            _, alert_id = heapq.heappop(oldest)
+            entries = self.alerts[alert_id]
+            self._release(entries.pop(0)["hash"])
+            if len(entries) > 1:
+                heapq.heappush(oldest, (entries[0]["time"], alert_id))
+
+    def _save_index(self, force=False):
+        """Writes the index, at most every SAVE_INTERVAL seconds."""
+
+        with self._save_lock:
+            with self.lock:
+                if not self._dirty or (
+                    not force and time.time() - self._saved_at < SAVE_INTERVAL
+                ):
+                    return
+                data = json.dumps(
+                    {"objects": self.objects, "alerts": self.alerts})
+                self._dirty = False
+                self._saved_at = time.time()
+            path = self.directory / "index.json"
+            with open(str(path) + ".tmp", "w") as file:
+                file.write(data)
+            os.replace(str(path) + ".tmp", path)
+
+
+def get_snapshot_store(delta=False, max_chain=10, max_count=None, max_bytes=None):
+    """Returns the shared SnapshotStore, applying new settings to it.
+
+    Args:
+        delta (bool): Optional; Delta-encode new snapshots.
+        max_chain (int): Optional; Maximum delta chain length.
+        max_count (int): Optional; Maximum snapshots per Alert.
+        max_bytes (int): Optional; Maximum size of the store in bytes.
+
+    Returns:
+        SnapshotStore: The shared store.
+    """
+
+    global _snapshot_store
+    with _snapshot_store_lock:
+        if _snapshot_store is None:
+            _snapshot_store = SnapshotStore()
+            atexit.register(_snapshot_store.flush)
+        with _snapshot_store.lock:
+            _snapshot_store.delta = bool(delta)
+            _snapshot_store.max_chain = int(max_chain)
+            _snapshot_store.max_count = (
+                None if max_count is None else int(max_count))
+            _snapshot_store.max_bytes = (
+                None if max_bytes is None else int(max_bytes))
+        return _snapshot_store
+
+
+def _encode_delta(old, new):
+    """Encodes `new` as line copies from `old` and inserted lines."""
+
+    old_lines = old.splitlines(True)
+    new_lines = new.splitlines(True)
+    delta = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append([i1, i2])
+        elif j2 > j1:
+            delta.append("".join(new_lines[j1:j2]))
+    return delta
+
+
+def _apply_delta(old, delta):
+    old_lines = old.splitlines(True)
+    return "".join(
+        "".join(old_lines[part[0]:part[1]]) if isinstance(part, list) else part
+        for part in delta
+    )
@@ -8,6 +8,10 @@ Attributes:
     UPDATES_FILENAME (Path): File path for NetWatch Updates.
     ALERTS_FILENAME (Path): File path for NetWatch Alerts.
     CONFIG_FILENAME (Path): File path for NetWatch configuration.
+    MAX_UPDATES (int): Number of most recent Updates kept.
+    REBASELINE_FIELDS (List[str]): Alert attributes that change what
+        content an Alert watches. Updating one clears the Alert's
+        validators and hash, so its next check records a new baseline.
     store (Store): Singleton instance of datastore.
 
 Todo:
@@ -27,6 +31,8 @@ PARENT_DIR = Path(__file__).parent
 UPDATES_FILENAME = PARENT_DIR / "data" / "updates.json"
 ALERTS_FILENAME = PARENT_DIR / "data" / "alerts.json"
 CONFIG_FILENAME = PARENT_DIR / "data" / "config.json"
+MAX_UPDATES = 500
+REBASELINE_FIELDS = ["link", "selector", "normalize", "fetch_mode"]
 
 
 class Store:
@@ -41,20 +47,50 @@ class Store:
         config (Dict): Configuration settings for NetWatch.
         lock (threading.Lock): Threading lock for accessing
             NetWatch data.
+        listeners (List[Callable]): Functions called with an event
+            ("create", "update" or "delete") and a copy of the Alert
+            whenever an Alert is created, updated or deleted.
     """
 
     def __init__(self):
         if "data" not in os.listdir(PARENT_DIR):
             os.mkdir(PARENT_DIR / "data")
         self.updates = [
-            Update(i["text"], i["link"]) for i in _read_json(UPDATES_FILENAME, [])
+            Update(**update) for update in _read_json(UPDATES_FILENAME, [])
         ]
+        for update in self.updates:
+            update.id = update.id or token_hex(16)
         self.alerts = {
             alert_id: Alert(**alert)
             for alert_id, alert in _read_json(ALERTS_FILENAME, {}).items()
         }
         self.config = _read_json(CONFIG_FILENAME, {})
         self.lock = Lock()
+        self.listeners = []
+
+    def add_listener(self, listener):
+        """Registers a function called when Alerts change.
+
+        Args:
+            listener (Callable[[str, Alert], None]): Function called
+                with the event ("create", "update" or "delete") and a
+                copy of the changed Alert. It runs on the thread that
+                changed the Alert, after the store's lock is released.
+        """
+
+        with self.lock:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """Unregisters a function registered with add_listener.
+
+        Args:
+            listener (Callable[[str, Alert], None]): The function.
+        """
+
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
 
     def get_alerts(self, alert_ids=None):
         """Retrieves Alerts
@@ -96,6 +132,16 @@ class Store:
         recipient,
         content_type,
         frequency,
+        fetch_mode="auto",
+        wait_for="selector",
+        wait_delay=0,
+        timeout=30,
+        block_profile=None,
+        normalize=None,
+        similarity_threshold=None,
+        adaptive=None,
+        catch_up=None,
+        jitter=None,
     ):
         """Creates an Alert.
 
@@ -112,8 +158,9 @@ class Store:
                 points to.
             selector (str): The HTML selector for the subsection
                 of the website this Alert points to.
-            hash (str): A MD5 hash of the contents of this Alert's
-                website.
+            hash (str): A hash of the contents of this Alert's
+                website, or None to record the contents found by the
+                first check without notifying.
             email (bool): Enables or disables email notifications.
             recipient (str): The recipient of the Alert.
             content_type (str): Optional; The email body content
@@ -122,6 +169,27 @@ class Store:
             frequency (str): Cron formatted frequency representing
                 how often this Alert should be processed by the
                 scheduler.
+            fetch_mode (str): Optional; How the website is retrieved.
+                Valid values are "http", "browser" or "auto".
+            wait_for (str): Optional; When a rendered website is ready
+                to be scraped. Valid values are "selector",
+                "network_idle" or "delay".
+            wait_delay (float): Optional; Seconds to wait for the
+                "delay" wait rule.
+            timeout (float): Optional; Time budget in seconds for
+                checking the website.
+            block_profile (str): Optional; Blocking profile for
+                rendering the website.
+            normalize (Dict): Optional; Normalization rules applied
+                to the website's HTML before it is hashed.
+            similarity_threshold (float): Optional; Minimum similarity
+                of a change that is recorded without notifying.
+            adaptive (bool): Optional; Spread out checks while the
+                website does not change. None uses the configuration.
+            catch_up (str): Optional; Policy for missed scheduled
+                checks: "skip", "once" or "all".
+            jitter (float): Optional; Window in seconds for offsetting
+                checks from their cron boundaries.
 
         Returns:
             Alert: Deep copy of newly created Alert.
@@ -140,14 +208,30 @@ class Store:
             recipient=recipient,
             content_type=content_type,
             frequency=frequency,
+            fetch_mode=fetch_mode,
+            wait_for=wait_for,
+            wait_delay=wait_delay,
+            timeout=timeout,
+            block_profile=block_profile,
+            normalize=normalize,
+            similarity_threshold=similarity_threshold,
+            adaptive=adaptive,
+            catch_up=catch_up,
+            jitter=jitter,
         )
         with self.lock:
             self.alerts[alert_id] = alert
-        return deepcopy(alert)
+        alert = deepcopy(alert)
+        self._notify_listeners("create", alert)
+        return alert
 
     def update_alert(self, id, **kwargs):
         """Updates alert in store list.
 
+        Changing one of REBASELINE_FIELDS clears the Alert's HTTP
+        validators and hash, so the next check fetches the full page
+        and records it as the new baseline without notifying.
+
         Args:
             id (str): Id of Alert to be updated.
             kwargs (Dict): Dict of Alert values to be updated.
@@ -158,6 +242,11 @@ class Store:
 
         alert = None
         with self.lock:
+            rebaseline = any(
+                key in REBASELINE_FIELDS
+                and getattr(self.alerts[id], key, value) != value
+                for key, value in kwargs.items()
+            )
             for (
                 key,
                 value,
@@ -166,7 +255,14 @@ class Store:
                     setattr(self.alerts[id], key, value)
                 else:
                     raise Exception("Invalid Alert attribute")
+            if rebaseline:
+                for key in [
+                    "etag", "last_modified", "content_length", "hash",
+                    "fingerprint",
+                ]:
+                    setattr(self.alerts[id], key, None)
             alert = deepcopy(self.alerts[id])
+        self._notify_listeners("update", alert)
         return alert
 
     def delete_alert(self, alert_id):
@@ -182,6 +278,7 @@ class Store:
         alert = None
         with self.lock:
             alert = self.alerts.pop(alert_id)
+        self._notify_listeners("delete", alert)
         return alert
 
     def get_updates(self):
@@ -189,24 +286,104 @@ class Store:
 
         return self.updates
 
-    def create_update(self, text, link):
+    def get_update(self, update_id):
+        """Returns an Update.
+
+        Args:
+            update_id (str): Id of the Update.
+
+        Returns:
+            Update: Deep copy of the Update, or None if it does not
+                exist.
+        """
+
+        with self.lock:
+            for update in self.updates:
+                if update.id == update_id:
+                    return deepcopy(update)
+        return None
+
+    def create_update(
+        self, text, link, alert_id=None, old_hash=None, new_hash=None
+    ):
         """Creates an Update.
 
         Args:
             text (str): Text to be displayed in the Update.
             link (str): Link to corresponding Alert's website.
+            alert_id (str): Optional; Id of the updated Alert.
+            old_hash (str): Optional; Hash of the Alert's previous
+                content.
+            new_hash (str): Optional; Hash of the Alert's new content.
 
         Returns:
             Update: Newly created Update.
         """
 
-        update = Update(text, link)
+        update = Update(
+            text,
+            link,
+            id=token_hex(16),
+            alert_id=alert_id,
+            old_hash=old_hash,
+            new_hash=new_hash,
+        )
         with self.lock:
             self.updates.insert(0, update)
-            self.updates = self.updates[0:500]
+            self.updates = self.updates[0:MAX_UPDATES]
         return update
 
-    def get_config(self, key=None):
+    def apply_results(self, alert_values, updates):
+        """Applies the results of processing Alerts.
+
+        Updates any number of Alerts and creates any number of Updates
+        while holding the store's lock once. Unlike update_alert, no
+        copies of the Alerts are made. Alerts that were deleted in the
+        meantime are skipped.
+
+        Args:
+            alert_values (Dict[str, Dict]): Alert values to be updated
+                by Alert id.
+            updates (List[Dict]): Keyword arguments of the Updates to
+                be created, oldest first.
+
+        Returns:
+            List[Update]: Newly created Updates.
+        """
+
+        new_updates = [
+            Update(id=token_hex(16), **update) for update in updates
+        ]
+        with self.lock:
+            for alert_id, values in alert_values.items():
+                alert = self.alerts.get(alert_id)
+                if alert is None:
+                    continue
+                for key, value in values.items():
+                    if hasattr(alert, key):
+                        setattr(alert, key, value)
+                    else:
+                        raise Exception("Invalid Alert attribute")
+            if new_updates:
+                self.updates[0:0] = reversed(new_updates)
+                del self.updates[MAX_UPDATES:]
+        return new_updates
+
+    def set_update_diff(self, update_id, mode, diff):
+        """Caches a computed diff on an Update.
+
+        Args:
+            update_id (str): Id of the Update.
+            mode (str): Diff mode the diff was computed with.
+            diff (str): The diff.
+        """
+
+        with self.lock:
+            for update in self.updates:
+                if update.id == update_id:
+                    update.diffs[mode] = diff
+
+    def get_config(self, key=None, default=None):
         """Returns NetWatch configurations.
 
         Returns one or all NetWatch configuration values. If `key` is
@@ -215,6 +392,8 @@ class Store:
         Args:
             key (str): Optional; Key corresponding to config value
                 to be returned.
+            default: Optional; Value returned when `key` has not
+                been configured.
 
         Returns:
             str or List[str]: Specified config value(s).
@@ -223,7 +402,7 @@ class Store:
         value = None
         with self.lock:
             if key:
-                value = deepcopy(self.config[key])
+                value = deepcopy(self.config.get(key, default))
             else:
                 value = deepcopy(self.config)
         return value
@@ -242,6 +421,12 @@ class Store:
                 if key in self.config or new_setting:
                     self.config[key] = value
 
+    def _notify_listeners(self, event, alert):
+        with self.lock:
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(event, alert)
+
     def save(self):
         """Saves store data to file"""
 
@@ -233,7 +233,7 @@ def edit_window(alert):
             if check_invalid(window, values):
                 continue
             for k in alert:
-                if k not in ["hash", "id"]:
+                if k not in ["hash", "id"] and k in values:
                     alert[k] = values[k]
             window.close()
             return alert
@@ -1,3 +1,4 @@
+import json
 import re
 import traceback
 
@@ -115,6 +116,12 @@ def get_alert_id_from_index(alerts, index):
 
 
 def send(method, data, identifier=None, params=None):
+    if params:
+        # Nested values such as normalization rules are sent as JSON.
+        params = {
+            key: json.dumps(value) if isinstance(value, (dict, list)) else value
+            for key, value in params.items()
+        }
     try:
         if identifier:
             r = requests.request(
@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+
+"""Tests for hashing in `netwatch.backend` and `netwatch.common`."""
+
+
+import hashlib
+import os
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+from netwatch import backend, common, content
+from netwatch.models import Alert
+from netwatch.scraper import SiteData
+
+HTML = "<p>Price: 42 USD</p>"
+MD5 = hashlib.md5(HTML.encode()).hexdigest()
+
+
+def make_alert(hash=MD5, **kwargs):
+    return Alert(
+        "a1b2", "Price", "", "changed", "https://example.com", "#price", hash,
+        False, "", "html", "* * * * *", **kwargs)
+
+
+def check(alert, html=HTML, algorithm="blake2b"):
+    """Returns the hashed SiteData of checking an Alert."""
+
+    data = SiteData(
+        alert.id, alert.link, alert.selector, html=html,
+        hash_algorithm=algorithm, previous_hash=alert.hash,
+        previous_hash_algorithm=alert.hash_version)
+    data.status = "ok"
+    return backend._hash(data)
+
+
+class TestHash(unittest.TestCase):
+    """Tests for `backend._hash`."""
+
+    def test_hash(self):
+        data = check(make_alert(hash=None), algorithm="md5")
+
+        self.assertEqual(data.hash, MD5)
+        self.assertEqual(data.fingerprint, content.fingerprint_html(HTML))
+
+    def test_unchanged_content_is_migrated(self):
+        data = check(make_alert())
+
+        self.assertEqual(data.hash, content.hash_html(HTML, "blake2b"))
+        self.assertEqual(data.previous_hash, data.hash)
+        # Unchanged content is not fingerprinted.
+        self.assertIsNone(data.fingerprint)
+
+    def test_changed_content_keeps_previous_hash(self):
+        data = check(make_alert(), html="<p>Price: 41 USD</p>")
+
+        self.assertEqual(data.previous_hash, MD5)
+        self.assertIsNotNone(data.fingerprint)
+
+    def test_normalized_content_is_hashed(self):
+        data = SiteData(
+            "a1b2", "https://example.com", html='<p nonce="x">42</p>',
+            normalize={"strip_attributes": ["nonce"]})
+        data.status = "ok"
+        backend._hash(data)
+
+        self.assertEqual(data.html, "<p>42</p>")
+        self.assertEqual(data.hash, hashlib.md5(b"<p>42</p>").hexdigest())
+
+    def test_unavailable_algorithm_falls_back(self):
+        data = check(make_alert(hash=None), algorithm="sha1024")
+
+        self.assertEqual(
+            data.hash_algorithm, content.DEFAULT_HASH_ALGORITHM)
+        self.assertEqual(
+            data.hash, content.hash_html(HTML, data.hash_algorithm))
+
+    def test_unavailable_previous_algorithm_is_not_compared(self):
+        data = check(make_alert(hash_version="sha1024"))
+
+        self.assertEqual(data.previous_hash, MD5)
+        self.assertIsNotNone(data.fingerprint)
+
+    def test_failed_hash_is_an_error(self):
+        data = SiteData(
+            "a1b2", "https://example.com", html="<p></p>",
+            normalize={"drop_everything": True})
+        data.status = "ok"
+        backend._hash(data)
+
+        self.assertEqual(data.status, "error")
+        self.assertIn("drop_everything", data.error)
+
+    def test_failed_fetch_is_not_hashed(self):
+        data = SiteData("a1b2", "https://example.com")
+        data.status = "error"
+
+        self.assertIsNone(backend._hash(data).hash)
+
+
+class TestEvaluateResult(unittest.TestCase):
+    """Tests for `common.evaluate_result`."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+
+        self.snapshots = mock.Mock()
+
+    def test_migration_of_unchanged_content(self):
+        alert = make_alert()
+        data = check(alert)
+
+        values, update, notify = common.evaluate_result(
+            alert, data, self.snapshots)
+
+        self.assertEqual(values["hash_version"], "blake2b")
+        self.assertEqual(values["hash"], data.hash)
+        self.assertEqual(values["unchanged_checks"], 1)
+        self.assertIsNone(update)
+        self.assertFalse(notify)
+        self.snapshots.put.assert_not_called()
+
+    def test_migration_of_changed_content(self):
+        alert = make_alert()
+        data = check(alert, html="<p>Price: 41 USD</p>")
+
+        values, update, notify = common.evaluate_result(
+            alert, data, self.snapshots)
+
+        self.assertEqual(values["hash_version"], "blake2b")
+        self.assertEqual(values["hash"], data.hash)
+        self.assertEqual(values["unchanged_checks"], 0)
+        self.assertEqual(update["old_hash"], MD5)
+        self.assertEqual(update["new_hash"], data.hash)
+        self.assertTrue(notify)
+        self.snapshots.put.assert_called_once_with(
+            "a1b2", data.hash, data.html)
+
+    def test_unavailable_previous_algorithm_is_rebaselined(self):
+        alert = make_alert(hash_version="xxh3-unavailable")
+        data = check(alert, html="<p>Price: 41 USD</p>")
+
+        values, update, notify = common.evaluate_result(
+            alert, data, self.snapshots)
+
+        self.assertEqual(values["hash_version"], "blake2b")
+        self.assertEqual(values["hash"], data.hash)
+        self.assertIsNone(update)
+        self.assertFalse(notify)
+        self.snapshots.put.assert_called_once_with(
+            "a1b2", data.hash, data.html)
+
+    def test_missing_hash_is_rebaselined(self):
+        for hash in [None, ""]:
+            with self.subTest(hash=hash):
+                self.snapshots.reset_mock()
+                alert = make_alert(hash=hash, unchanged_checks=3)
+                data = check(alert, algorithm="md5")
+
+                values, update, notify = common.evaluate_result(
+                    alert, data, self.snapshots)
+
+                self.assertEqual(values["hash"], MD5)
+                self.assertEqual(values["unchanged_checks"], 0)
+                self.assertIsNone(update)
+                self.assertFalse(notify)
+                self.snapshots.put.assert_called_once_with(
+                    "a1b2", MD5, HTML)
+
+    def test_resolved_fetch_mode_is_rebaselined(self):
+        for fetched in ["http", "browser"]:
+            with self.subTest(fetch_mode=fetched):
+                self.snapshots.reset_mock()
+                alert = make_alert(fetch_mode="auto")
+                data = check(alert, html="<p>Price: 41 USD</p>")
+                data.fetch_mode = fetched
+
+                values, update, notify = common.evaluate_result(
+                    alert, data, self.snapshots)
+
+                self.assertEqual(values["fetch_mode"], fetched)
+                self.assertEqual(values["hash"], data.hash)
+                self.assertIsNone(update)
+                self.assertFalse(notify)
+                self.snapshots.put.assert_called_once_with(
+                    "a1b2", data.hash, data.html)
+
+    def test_unchanged_content(self):
+        alert = make_alert(unchanged_checks=3)
+        data = check(alert, algorithm="md5")
+
+        values, update, notify = common.evaluate_result(
+            alert, data, self.snapshots)
+
+        self.assertNotIn("hash", values)
+        self.assertEqual(values["unchanged_checks"], 4)
+        self.assertIsNone(update)
+
+    def test_minor_change_is_not_notified(self):
+        old = "<p>{}</p>".format(" ".join(
+            "word{}".format(i) for i in range(300)))
+        new = old.replace("word150", "changed")
+        for threshold, minor in [(0.8, True), (None, False), (1.0, False)]:
+            with self.subTest(threshold=threshold):
+                alert = make_alert(
+                    hash=content.hash_html(old),
+                    fingerprint=content.fingerprint_html(old),
+                    similarity_threshold=threshold)
+                data = check(alert, html=new, algorithm="md5")
+
+                values, update, notify = common.evaluate_result(
+                    alert, data, self.snapshots)
+
+                self.assertEqual(values["hash"], data.hash)
+                self.assertEqual(values["fingerprint"], data.fingerprint)
+                self.assertEqual(
+                    update["text"].endswith("(minor change)"), minor)
+                self.assertEqual(notify, not minor)
+
+    def test_failed_check(self):
+        alert = make_alert()
+        data = SiteData(alert.id, alert.link)
+        data.status = "error"
+        data.error = "Timed out"
+
+        values, update, notify = common.evaluate_result(
+            alert, data, self.snapshots)
+
+        self.assertEqual(values["last_error"], "Timed out")
+        self.assertNotIn("hash", values)
+        self.assertIsNone(update)
+
+
+def fetch_price(site_data, session=None, timeout=30):
+    """Fakes fetch_http_html in worker processes."""
+
+    for data in site_data:
+        if "crash" in data.link:
+            os._exit(1)
+        data.html = HTML
+        data.status = "ok"
+
+
+def reserve(host):
+    """Takes a page load token in a worker process."""
+
+    return backend.netwatch.scraper._shared_rate_limiter().reserve(host)
+
+
+def http_data(*links, **kwargs):
+    return [
+        SiteData(str(i), link, "#price", fetch_mode="http", **kwargs)
+        for i, link in enumerate(links)
+    ]
+
+
+class TestProcessBackend(unittest.TestCase):
+    """Tests for the `process` backend.
+
+    Worker processes are forked after fetch_http_html is patched, so
+    they fetch with fetch_price.
+    """
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+
+        patcher = mock.patch.object(
+            backend.netwatch.scraper, "fetch_http_html", fetch_price)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(backend.shutdown)
+
+    def check(self, site_data):
+        return backend.check_sites(
+            site_data, backend="process", workers=2,
+            limiter_options={"rate": None})
+
+    def test_sites_are_checked_in_workers(self):
+        site_data = http_data(
+            "https://a.com/1", "https://b.com/1", "https://a.com/2")
+
+        self.assertIs(self.check(site_data), site_data)
+        self.assertEqual(
+            [(data.id, data.status, data.hash) for data in site_data],
+            [("0", "ok", MD5), ("1", "ok", MD5), ("2", "ok", MD5)])
+        self.assertEqual(site_data[0].html, HTML)
+
+    def test_unchanged_html_is_not_sent_back(self):
+        site_data = http_data(
+            "https://a.com/1", previous_hash=MD5,
+            previous_hash_algorithm="md5")
+
+        self.check(site_data)
+
+        self.assertEqual(site_data[0].hash, MD5)
+        self.assertIsNone(site_data[0].html)
+
+    def test_hosts_stay_together(self):
+        site_data = http_data(
+            "https://a.com/1", "https://b.com/1", "https://a.com/2",
+            "https://c.com/1")
+
+        chunks = backend._chunk(site_data, 2)
+
+        self.assertEqual(
+            sorted(sorted(data.id for data in chunk) for chunk in chunks),
+            [["0", "2"], ["1", "3"]])
+
+    def test_workers_share_the_rate_limiter(self):
+        executor = backend._get_process_pool(2)
+        backend._rate_limiter.configure(rate=1)
+
+        waits = [
+            executor.submit(reserve, "example.com").result(10)
+            for _ in range(2)
+        ]
+
+        self.assertEqual(waits[0], 0)
+        self.assertGreater(waits[1], 0.5)
+        self.assertGreater(backend._rate_limiter.reserve("example.com"), 1.5)
+
+    def test_failed_worker_is_an_error(self):
+        site_data = http_data("https://a.com/crash", "https://b.com/1")
+
+        with mock.patch("builtins.print"):
+            self.check(site_data)
+
+        self.assertEqual(site_data[0].status, "error")
+        self.assertIn("Worker failed", site_data[0].error)
+
+        # The broken pool is replaced on the next check.
+        site_data = http_data("https://a.com/1")
+        self.check(site_data)
+        self.assertEqual(site_data[0].status, "ok")
+
+
+class TestShutdown(unittest.TestCase):
+    """Tests for shutting down the `process` backend's workers."""
+
+    def test_workers_are_terminated_after_timeout(self):
+        executor = ProcessPoolExecutor(1)
+        executor.submit(time.sleep, 30)
+        time.sleep(0.5)
+        processes = list(executor._processes.values())
+
+        started = time.time()
+        backend._shutdown_workers(executor, True, 0.2)
+
+        self.assertLess(time.time() - started, 5)
+        self.assertFalse(any(process.is_alive() for process in processes))
+
+    def test_finished_workers_are_not_terminated(self):
+        executor = ProcessPoolExecutor(1)
+        executor.submit(time.sleep, 0).result(10)
+
+        with mock.patch("builtins.print") as output:
+            backend._shutdown_workers(executor, True, 5)
+
+        output.assert_not_called()
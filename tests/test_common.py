@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+"""Tests for `netwatch.common` module."""
+
+
+import hashlib
+import threading
+import unittest
+from unittest import mock
+
+from netwatch import common
+from netwatch.models import Alert
+from netwatch.scraper import SiteData
+
+OLD_HASH = hashlib.md5(b"<b>42</b>").hexdigest()
+
+
+def make_alert(alert_id):
+    return Alert(
+        alert_id, alert_id, "", "changed", "https://example.com/" + alert_id,
+        "#price", OLD_HASH, False, "", "html", "* * * * *",
+        hash_version="md5")
+
+
+def checked(site_data, html):
+    for data in site_data:
+        data.html = html
+        data.status = "ok"
+        data.hash = hashlib.md5(html.encode()).hexdigest()
+    return site_data
+
+
+class CommonTestCase(unittest.TestCase):
+    """Processes Alerts with a mocked store and fetches."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+
+        self.alerts = {
+            alert_id: make_alert(alert_id) for alert_id in ["a1", "b2", "c3"]}
+        self.store = mock.Mock()
+        self.store.get_alerts.side_effect = lambda alert_ids: [
+            self.alerts[alert_id] for alert_id in alert_ids]
+        self.store.get_config.side_effect = (
+            lambda key=None, default=None: "md5" if key == "hash_algorithm"
+            else default)
+        self.notified = []
+        for patcher in [
+            mock.patch.object(common, "store", self.store),
+            mock.patch.object(common, "metrics"),
+            mock.patch.object(common.netwatch.snapshots, "get_snapshot_store"),
+            mock.patch.object(
+                common, "send_notifications",
+                side_effect=lambda alerts, sender: self.notified.extend(
+                    alert.id for alert in alerts)),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class TestIterProcessAlert(CommonTestCase):
+    """Tests for streaming Alert processing."""
+
+    def test_results_are_stored_once_per_batch(self):
+        def iter_check_sites(site_data, **kwargs):
+            self.assertTrue(kwargs["batch"])
+            yield checked(site_data[:2], "<b>41</b>")
+            yield checked(site_data[2:], "<b>42</b>")
+
+        applied = []
+        self.store.apply_results.side_effect = (
+            lambda values, updates: applied.append((values, updates)))
+        with mock.patch.object(
+                common.netwatch.backend, "iter_check_sites",
+                iter_check_sites):
+            results = common.iter_process_alert(["a1", "b2", "c3"])
+
+            alert, data, notified = next(results)
+            self.assertEqual(len(applied), 1)
+            self.assertEqual(
+                [update["alert_id"] for update in applied[0][1]],
+                ["a1", "b2"])
+            self.assertEqual((alert.id, notified), ("a1", True))
+            self.assertEqual(self.notified, ["a1"])
+
+            rest = list(results)
+
+        self.assertEqual(
+            [(alert.id, notified) for alert, _, notified in rest],
+            [("b2", True), ("c3", False)])
+        self.assertEqual(len(applied), 2)
+        self.assertEqual(applied[1][0]["c3"]["unchanged_checks"], 1)
+        self.assertEqual(applied[1][1], [])
+
+
+class TestCoalescing(CommonTestCase):
+    """Tests for Alerts that are processed by overlapping runs."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+
+        super().setUp()
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.started = threading.Event()
+        self.runs = []
+        self.error = None
+        patcher = mock.patch.object(
+            common, "iter_process_alert", self.iter_process_alert)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def iter_process_alert(self, alert_ids, stop_event=None):
+        self.runs.append(list(alert_ids))
+        self.started.set()
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        for alert_id in alert_ids:
+            yield self.alerts[alert_id], None, alert_id == "a1"
+
+    def start_run(self, alert_ids):
+        results = {}
+
+        def run():
+            try:
+                results["changed"] = common.process_alert(alert_ids)
+            except Exception as e:
+                results["error"] = e
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.assertTrue(self.started.wait(5))
+        self.addCleanup(thread.join, 5)
+        return thread, results
+
+    def test_overlapping_run_attaches(self):
+        thread, results = self.start_run(["a1"])
+        threading.Timer(0.1, self.release.set).start()
+
+        changed = common.process_alert(["a1", "b2"])
+        thread.join(5)
+
+        self.assertEqual(self.runs, [["a1"], ["b2"]])
+        self.assertEqual([alert.id for alert in changed], ["a1"])
+        self.assertEqual([alert.id for alert in results["changed"]], ["a1"])
+        common.metrics.increment.assert_called_once_with("coalesced_runs", 1)
+        self.assertEqual(common._in_flight, {})
+
+    def test_overlapping_run_skips(self):
+        thread, results = self.start_run(["a1"])
+
+        self.assertEqual(common.process_alert(["a1"], wait=False), [])
+        self.release.set()
+        thread.join(5)
+
+        self.assertEqual(self.runs, [["a1"]])
+        common.metrics.increment.assert_called_once_with("skipped_runs", 1)
+
+    def test_failed_run_is_reported_to_attached_runs(self):
+        self.error = RuntimeError("boom")
+        thread, results = self.start_run(["a1"])
+        threading.Timer(0.1, self.release.set).start()
+
+        with self.assertRaises(RuntimeError):
+            common.process_alert(["a1"])
+        thread.join(5)
+
+        self.assertIs(results["error"], self.error)
+        self.assertEqual(common._in_flight, {})
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+"""Tests for `netwatch.content` module."""
+
+
+import hashlib
+import unittest
+from unittest import mock
+
+from netwatch import content
+
+
+class TestNormalizer(unittest.TestCase):
+    """Tests for normalization rules."""
+
+    def test_no_rules(self):
+        html = "<p>a</p><!-- c -->"
+
+        self.assertIs(content.normalize_html(html, {}), html)
+        self.assertIs(content.normalize_html(html, None), html)
+
+    def test_rules(self):
+        html = (
+            '<div data-x="1" class="a"><!-- c --><script>x()</script>'
+            '<p class="ad big">Ad</p>  <p>Updated  10:42</p><br></div>'
+        )
+        rules = {
+            "strip_attributes": ["data-*"],
+            "drop_selectors": ["script", "p.ad"],
+            "drop_comments": True,
+            "regex": [[r"\d+:\d+", ""]],
+            "collapse_whitespace": True,
+        }
+
+        self.assertEqual(
+            content.normalize_html(html, rules),
+            '<div class="a"><p>Updated </p><br></div>')
+
+    def test_drop_selectors(self):
+        html = (
+            '<ul><li id="x">1</li><li data-slot="ad">2</li>'
+            '<li data-slot="main">3</li></ul>'
+        )
+
+        self.assertEqual(
+            content.normalize_html(
+                html, {"drop_selectors": ["#x, li[data-slot=ad]"]}),
+            '<ul><li data-slot="main">3</li></ul>')
+
+    def test_pieces_join_to_normalized_html(self):
+        html = '<p nonce="x1">Updated 10:42</p>'
+        normalizer = content.get_normalizer({"strip_attributes": ["nonce"]})
+
+        self.assertEqual(
+            "".join(normalizer.normalize_pieces(html)),
+            normalizer.normalize(html))
+
+    def test_normalizers_are_cached(self):
+        self.assertIs(
+            content.get_normalizer({"drop_comments": True, "regex": []}),
+            content.get_normalizer({"regex": [], "drop_comments": True}))
+
+    def test_invalid_rule(self):
+        with self.assertRaises(Exception):
+            content.normalize_html("<p></p>", {"drop_everything": True})
+
+
+class TestHashing(unittest.TestCase):
+    """Tests for hashing."""
+
+    def test_chunked_hash_matches_whole_hash(self):
+        html = "<p>{}</p>".format("é" * (content.HASH_CHUNK_SIZE * 2 + 7))
+
+        self.assertEqual(
+            content.hash_html(html), hashlib.md5(html.encode()).hexdigest())
+        self.assertEqual(
+            content.hash_html([html[:10], html[10:]]), content.hash_html(html))
+
+    def test_unavailable_algorithm(self):
+        with self.assertRaises(Exception):
+            content.hash_html("<p></p>", "sha1024")
+
+    def test_fingerprint_without_numpy(self):
+        html = "<p>{}</p>".format(" ".join(
+            "word{}".format(i % 37) for i in range(500)))
+        fingerprint = content.fingerprint_html(html)
+
+        with mock.patch.object(content, "numpy", None):
+            self.assertEqual(content.fingerprint_html(html), fingerprint)
+
+    def test_similarity(self):
+        old = " ".join("word{}".format(i) for i in range(300))
+        new = old.replace("word150", "changed")
+
+        self.assertEqual(content.similarity("ff" * 8, "ff" * 8), 1.0)
+        self.assertEqual(content.similarity("00" * 8, "ff" * 8), 0.0)
+        self.assertGreater(
+            content.similarity(
+                content.fingerprint_html(old), content.fingerprint_html(new)),
+            0.8)
+
+    def test_get_hash_algorithm(self):
+        self.assertEqual(content.get_hash_algorithm("md5"), "md5")
+        for algorithm in [None, "", "sha1024"]:
+            self.assertEqual(
+                content.get_hash_algorithm(algorithm),
+                content.DEFAULT_HASH_ALGORITHM)
+
+
+class TestDiff(unittest.TestCase):
+    """Tests for diffs."""
+
+    def test_html_diff(self):
+        diff = content.diff_html(
+            "<ul><li>1</li><li>2</li></ul>", "<ul><li>1</li><li>3</li></ul>")
+
+        # Every element starts a line.
+        self.assertEqual(
+            [line for line in diff.splitlines()[2:] if line[0] in "+-"],
+            ["-<li>2", "+<li>3"])
+
+    def test_text_diff(self):
+        diff = content.diff_html(
+            '<p class="a">Price</p><p>42</p>',
+            '<p class="b">Price</p><p>41</p>', mode="text")
+
+        self.assertEqual(
+            [line for line in diff.splitlines()[2:] if line[0] in "+-"],
+            ["-42", "+41"])
+
+    def test_invalid_mode(self):
+        with self.assertRaises(Exception):
+            content.diff_html("", "", mode="pdf")
@@ -5,7 +5,7 @@
 
 import unittest
 
-from netwatch import netwatch
+import netwatch  # noqa: F401
 
 
 class TestNetwatch(unittest.TestCase):
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+
+"""Tests for `netwatch.scheduler` module."""
+
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from croniter import croniter
+
+from netwatch import scheduler
+from netwatch.models import Alert
+
+START = 1600000000.0
+
+
+def make_alert(alert_id, frequency="* * * * *", **kwargs):
+    return Alert(
+        alert_id, alert_id, "", "changed", "https://example.com/" + alert_id,
+        "#price", "0" * 32, False, "", "html", frequency, **kwargs)
+
+
+class FakeStore:
+    def __init__(self, alerts, config=None):
+        self.alerts = {alert.id: alert for alert in alerts}
+        self.config = config or {}
+
+    def get_alerts(self, alert_ids=None):
+        if alert_ids is None:
+            return list(self.alerts.values())
+        return self.alerts[alert_ids]
+
+    def get_config(self, key=None, default=None):
+        return self.config.get(key, default)
+
+    def add_listener(self, listener):
+        pass
+
+    def remove_listener(self, listener):
+        pass
+
+
+class TestScheduler(unittest.TestCase):
+    """Tests for the Scheduler's queue."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+
+        self.store = FakeStore([
+            make_alert("minutely"),
+            make_alert("quarterly", "*/15 * * * *"),
+        ], {"misfire_grace": 30})
+        patcher = mock.patch.object(scheduler, "store", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(scheduler, "metrics")
+        self.metrics = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.scheduler = scheduler.Scheduler()
+        self.addCleanup(self.scheduler.executor.shutdown)
+
+    def schedule(self, alert_id, now=START):
+        self.scheduler._schedule(self.store.alerts[alert_id], now)
+        return self.scheduler.fire_times[alert_id]
+
+    def test_schedule_uses_next_cron_boundary(self):
+        minutely = self.schedule("minutely")
+        quarterly = self.schedule("quarterly")
+
+        self.assertEqual(
+            minutely, croniter("* * * * *", START).get_next(float))
+        self.assertEqual(
+            quarterly, croniter("*/15 * * * *", START).get_next(float))
+        self.assertEqual(self.scheduler.next_fire_time(), minutely)
+
+    def test_pop_due_returns_only_due_alerts(self):
+        minutely = self.schedule("minutely")
+        self.schedule("quarterly")
+
+        self.assertEqual(self.scheduler._pop_due(minutely - 1), [])
+        jobs = self.scheduler._pop_due(minutely)
+        self.assertEqual([alert.id for alert in jobs], ["minutely"])
+        self.assertEqual(self.scheduler.fire_times["minutely"], minutely + 60)
+        self.metrics.increment.assert_not_called()
+
+    def test_stale_queue_entries_are_dropped(self):
+        self.schedule("minutely")
+        self.scheduler._unschedule("minutely")
+
+        self.assertIsNone(self.scheduler.next_fire_time())
+        self.assertEqual(self.scheduler._pop_due(START + 3600), [])
+
+    def test_changed_alerts_are_rescheduled(self):
+        alert = self.store.alerts["quarterly"]
+        self.schedule("quarterly")
+
+        alert.frequency = "* * * * *"
+        self.scheduler._alert_changed("update", alert)
+        self.assertLessEqual(
+            self.scheduler.fire_times["quarterly"], time.time() + 60)
+        self.scheduler._alert_changed("delete", alert)
+        self.assertNotIn("quarterly", self.scheduler.fire_times)
+
+    def test_missed_fires_follow_catch_up_policy(self):
+        for policy, runs in [("skip", 0), ("once", 1), ("all", 5)]:
+            with self.subTest(policy=policy):
+                self.store.config["catch_up"] = policy
+                self.metrics.reset_mock()
+                first = self.schedule("minutely")
+
+                # Fires at first + 0, 60, ..., 240 are more than
+                # misfire_grace late at first + 300.
+                jobs = self.scheduler._pop_due(first + 300)
+
+                self.assertEqual(len(jobs), runs)
+                self.metrics.increment.assert_called_once_with(
+                    "missed_fires", 5)
+                self.assertEqual(
+                    self.scheduler.fire_times["minutely"], first + 300)
+
+    def test_alert_catch_up_overrides_configuration(self):
+        self.store.config["catch_up"] = "all"
+        self.store.alerts["minutely"].catch_up = "skip"
+        first = self.schedule("minutely")
+
+        self.assertEqual(self.scheduler._pop_due(first + 300), [])
+
+    def test_late_fire_within_grace_is_not_missed(self):
+        first = self.schedule("minutely")
+
+        self.assertEqual(len(self.scheduler._pop_due(first + 20)), 1)
+        self.metrics.increment.assert_not_called()
+
+    def test_catch_up_is_limited(self):
+        self.store.config["catch_up"] = "all"
+        first = self.schedule("minutely")
+
+        jobs = self.scheduler._pop_due(first + 60 * 1000)
+
+        self.assertEqual(len(jobs), scheduler.MAX_CATCH_UP)
+
+    def test_fires_missed_while_stopped_are_caught_up(self):
+        self.store.config["catch_up"] = "once"
+        self.store.alerts["minutely"].last_checked = time.time() - 3600
+        self.scheduler.thread = mock.Mock()
+        self.scheduler.start()
+
+        jobs = self.scheduler._pop_due(time.time())
+
+        self.assertEqual([alert.id for alert in jobs], ["minutely"])
+        name, count = self.metrics.increment.call_args[0]
+        self.assertEqual(name, "missed_fires")
+        self.assertIn(count, [59, 60])
+
+    def test_jitter_delays_fires_by_alert_offset(self):
+        self.store.alerts["minutely"].jitter = 30
+        fire = self.schedule("minutely")
+        offset = scheduler.jitter_offset("minutely", 30)
+
+        self.assertEqual(self.scheduler.offsets["minutely"], offset)
+        self.assertEqual(fire, croniter(
+            "* * * * *", START - offset).get_next(float) + offset)
+
+    def test_jitter_window_configuration(self):
+        self.store.config["jitter_window"] = 30
+        self.schedule("minutely")
+
+        self.assertEqual(
+            self.scheduler.offsets["minutely"],
+            scheduler.jitter_offset("minutely", 30))
+
+    def test_jitter_is_limited_to_the_cron_period(self):
+        self.store.alerts["minutely"].jitter = 3600
+        self.schedule("minutely")
+
+        self.assertLess(self.scheduler.offsets["minutely"], 60)
+
+    def test_adaptive_polling_skips_fires_until_interval(self):
+        alert = self.store.alerts["minutely"]
+        alert.adaptive = True
+        alert.unchanged_checks = 5  # doubles the 60 second period
+        first = self.schedule("minutely")
+
+        self.scheduler.last_fires["minutely"] = first - 60
+        self.assertEqual(self.scheduler._pop_due(first), [])
+        self.assertEqual(len(self.scheduler._pop_due(first + 60)), 1)
+        self.assertEqual(self.scheduler.last_fires["minutely"], first + 60)
+
+    def test_adaptive_polling_with_string_last_checked(self):
+        alert = self.store.alerts["minutely"]
+        alert.adaptive = True
+        first = self.schedule("minutely")
+        alert.last_checked = str(first - 60)
+
+        self.assertEqual(len(self.scheduler._pop_due(first)), 1)
+
+
+class TestJitterOffset(unittest.TestCase):
+    """Tests for `jitter_offset`."""
+
+    def test_offset_is_deterministic(self):
+        self.assertEqual(
+            scheduler.jitter_offset("a1b2", 60),
+            scheduler.jitter_offset("a1b2", 60))
+
+    def test_offset_is_within_window(self):
+        offsets = [
+            scheduler.jitter_offset("alert{}".format(i), 60)
+            for i in range(200)
+        ]
+
+        self.assertTrue(all(0 <= offset < 60 for offset in offsets))
+        # Offsets are spread over the window.
+        self.assertLess(min(offsets), 10)
+        self.assertGreater(max(offsets), 50)
+
+    def test_empty_window(self):
+        self.assertEqual(scheduler.jitter_offset("a1b2", 0), 0.0)
+        self.assertEqual(scheduler.jitter_offset("a1b2", -5), 0.0)
+
+
+class TestAdaptiveInterval(unittest.TestCase):
+    """Tests for `adaptive_interval`."""
+
+    def test_interval_doubles_every_backoff_checks(self):
+        for unchanged, expected in [(0, 60), (4, 60), (5, 120), (12, 240)]:
+            alert = make_alert("a1b2", unchanged_checks=unchanged)
+            self.assertEqual(
+                scheduler.adaptive_interval(alert, 60, 3600, 5), expected)
+
+    def test_interval_is_capped(self):
+        alert = make_alert("a1b2", unchanged_checks=1000)
+
+        self.assertEqual(scheduler.adaptive_interval(alert, 60, 3600, 5), 3600)
+
+    def test_max_interval_below_cron_interval(self):
+        alert = make_alert("a1b2", unchanged_checks=50)
+
+        self.assertEqual(scheduler.adaptive_interval(alert, 600, 60, 5), 600)
+
+
+class TestSharding(unittest.TestCase):
+    """Tests for splitting due Alerts into work units."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+
+        self.alerts = [
+            make_alert("a1"), make_alert("b2"),
+            make_alert("c3"), make_alert("a1"),
+        ]
+        self.alerts[2].link = "https://Other.com/c3"
+
+    def test_host_sharding(self):
+        self.assertEqual(
+            scheduler.shard_jobs(self.alerts, "host"),
+            [["a1", "b2", "a1"], ["c3"]])
+
+    def test_alert_sharding(self):
+        self.assertEqual(
+            scheduler.shard_jobs(self.alerts, "alert"),
+            [["a1", "a1"], ["b2"], ["c3"]])
+
+    def test_repeated_alerts_run_once_per_fire(self):
+        with mock.patch.object(scheduler, "process_alert") as process_alert:
+            scheduler._process_jobs(["a1", "b2", "a1"])
+
+        self.assertEqual(process_alert.call_args_list, [
+            mock.call(["a1", "b2"], False, None),
+            mock.call(["a1"], False, None),
+        ])
+
+    def test_stopped_jobs_are_not_processed(self):
+        stop_event = threading.Event()
+        stop_event.set()
+
+        with mock.patch.object(scheduler, "process_alert") as process_alert:
+            scheduler._process_jobs(["a1"], stop_event)
+
+        process_alert.assert_not_called()
+
+
+class TestStop(unittest.TestCase):
+    """Tests for stopping the Scheduler."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+
+        self.store = FakeStore([], {"shutdown_timeout": 0.3})
+        for patcher in [
+            mock.patch.object(scheduler, "store", self.store),
+            mock.patch.object(scheduler.netwatch.backend, "shutdown"),
+            mock.patch.object(scheduler.netwatch.scraper, "close_driver_pool"),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_stuck_jobs_do_not_delay_shutdown(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self.scheduler = scheduler.Scheduler()
+        self.scheduler.start()
+        self.scheduler.jobs.add(self.scheduler.executor.submit(release.wait))
+
+        started = time.time()
+        self.scheduler.stop()
+
+        self.assertLess(time.time() - started, 1)
+        scheduler.netwatch.scraper.close_driver_pool.assert_called_once_with(
+            kill=True)
+        timeout = scheduler.netwatch.backend.shutdown.call_args[1]["timeout"]
+        self.assertGreaterEqual(timeout, 0)
+        self.assertLess(timeout, 0.3)
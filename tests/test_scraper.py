@@ -0,0 +1,801 @@
+#!/usr/bin/env python
+
+"""Tests for `netwatch.scraper` module."""
+
+
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+from netwatch import scraper
+
+
+class FakePage:
+    """A page served by FakeDriver.
+
+    The document is parsed after `parse` seconds and loaded after
+    `load` seconds. Element values are HTML or a function of the
+    seconds since the page was navigated to.
+    """
+
+    def __init__(self, load=0, elements=None, parse=0, source="<html/>"):
+        self.load = load
+        self.elements = elements or {}
+        self.parse = parse
+        self.source = source
+
+
+class FakeDriver:
+    """A webdriver stub that answers the scripts the scraper runs."""
+
+    pages = {}
+
+    def __init__(self):
+        self.tabs = {"tab0": ["about:blank", 0]}
+        self.tab = "tab0"
+        self.calls = []
+        self.quit_called = False
+        self.dead = False
+        self.hang = False
+        self.service = mock.Mock()
+        self.service.process.kill.side_effect = self.kill
+        driver = self
+
+        class SwitchTo:
+            def window(self, handle):
+                driver.tab = handle
+
+        self.switch_to = SwitchTo()
+
+    def kill(self):
+        self.dead = True
+
+    @property
+    def current_url(self):
+        if self.dead:
+            raise scraper.WebDriverException("driver is dead")
+        return self.tabs[self.tab][0]
+
+    @property
+    def window_handles(self):
+        return list(self.tabs)
+
+    @property
+    def page_source(self):
+        return self.page().source
+
+    def page(self):
+        return self.pages.get(self.tabs[self.tab][0], FakePage())
+
+    def quit(self):
+        self.quit_called = True
+
+    def execute_cdp_cmd(self, command, args):
+        self.calls.append((command, args))
+        return {}
+
+    def execute_script(self, script, *args):
+        while self.hang and not self.dead:
+            time.sleep(0.01)
+        if self.dead:
+            raise scraper.WebDriverException("driver is dead")
+        tab = self.tabs[self.tab]
+        elapsed = time.time() - tab[1]
+        if "window.open" in script:
+            self.tabs["tab{}".format(len(self.tabs))] = ["about:blank", 0]
+        elif "location.href = arguments[0]" in script:
+            self.calls.append(("navigate", args[0]))
+            tab[:] = [args[0], time.time()]
+        elif "about:blank" in script:
+            tab[0] = "about:blank"
+        elif "performance" in script:
+            page = self.page()
+            state = (
+                "loading" if elapsed < page.parse
+                else "interactive" if elapsed < page.load else "complete")
+            return [tab[0] == "about:blank", state, 3]
+        elif "arguments[0].map" in script:
+            results = []
+            for selector in args[0]:
+                value = self.page().elements.get(selector)
+                if selector.startswith("!!"):
+                    value = {"error": "SyntaxError"}
+                elif callable(value):
+                    value = value(elapsed)
+                results.append(value)
+            return results
+
+
+def browser_data(link, timeout=10, **kwargs):
+    return scraper.SiteData(
+        link, link, "#price", fetch_mode="browser", timeout=timeout, **kwargs)
+
+
+class BrowserTestCase(unittest.TestCase):
+    """Renders pages with FakeDrivers instead of Chrome."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+
+        FakeDriver.pages = {}
+        self.drivers = []
+
+        def initialize_driver(chromedriver_path, driver_options):
+            self.drivers.append(FakeDriver())
+            return self.drivers[-1]
+
+        patcher = mock.patch.object(
+            scraper, "initialize_driver", initialize_driver)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_pool(self, **kwargs):
+        pool = scraper.DriverPool("chromedriver", **kwargs)
+        self.addCleanup(pool.close, True)
+        return pool
+
+
+class TestDriverPool(BrowserTestCase):
+    """Tests for leasing drivers from a DriverPool."""
+
+    def test_drivers_are_reused(self):
+        pool = self.make_pool()
+        with pool.lease() as lease:
+            first = lease.driver
+        with pool.lease() as lease:
+            self.assertIs(lease.driver, first)
+
+        self.assertEqual(len(self.drivers), 1)
+
+    def test_leases_wait_for_a_driver(self):
+        pool = self.make_pool(size=1)
+        leased = threading.Event()
+
+        def lease():
+            with pool.lease():
+                leased.set()
+
+        with pool.lease():
+            thread = threading.Thread(target=lease)
+            thread.start()
+            self.assertFalse(leased.wait(0.1))
+        thread.join(5)
+
+        self.assertTrue(leased.is_set())
+        self.assertEqual(len(self.drivers), 1)
+
+    def test_drivers_are_recycled_after_max_pages(self):
+        pool = self.make_pool(max_pages=2)
+        with pool.lease() as lease:
+            lease.pages += 2
+        with pool.lease():
+            pass
+
+        self.assertEqual(len(self.drivers), 2)
+        self.assertTrue(self.drivers[0].quit_called)
+
+    def test_failed_lease_discards_driver(self):
+        pool = self.make_pool()
+        with self.assertRaises(RuntimeError):
+            with pool.lease():
+                raise RuntimeError("boom")
+        with pool.lease():
+            pass
+
+        self.assertEqual(len(self.drivers), 2)
+        self.assertTrue(self.drivers[0].quit_called)
+
+    def test_close(self):
+        pool = self.make_pool()
+        with pool.lease():
+            pass
+        pool.close()
+
+        self.assertTrue(self.drivers[0].quit_called)
+        with self.assertRaises(Exception):
+            with pool.lease():
+                pass
+
+    def test_shared_pool(self):
+        pool = scraper.get_driver_pool("chromedriver", size=1)
+        self.addCleanup(scraper.close_driver_pool)
+
+        self.assertIs(scraper.get_driver_pool("chromedriver", size=3), pool)
+        self.assertEqual(pool.size, 3)
+        self.assertIsNot(scraper.get_driver_pool("other", size=3), pool)
+        self.assertTrue(pool.closed)
+
+
+class TestSupervisor(BrowserTestCase):
+    """Tests for recovering from broken drivers."""
+
+    def test_unhealthy_driver_is_replaced(self):
+        pool = self.make_pool()
+        with pool.lease():
+            pass
+        self.drivers[0].dead = True
+
+        with pool.lease() as lease:
+            self.assertIs(lease.driver, self.drivers[1])
+        self.assertTrue(self.drivers[0].quit_called)
+
+    def test_hung_driver_is_killed(self):
+        pool = self.make_pool(heartbeat_timeout=0.1)
+        started = time.time()
+
+        with self.assertRaises(scraper.WebDriverException):
+            with pool.lease() as lease:
+                lease.driver.hang = True
+                lease.driver.execute_script("return 1;")
+
+        self.assertTrue(self.drivers[0].dead)
+        self.assertLess(time.time() - started, 5)
+        with pool.lease() as lease:
+            self.assertIs(lease.driver, self.drivers[1])
+
+    def test_restarts_back_off(self):
+        pool = self.make_pool()
+        failing = mock.Mock(side_effect=scraper.WebDriverException("no"))
+
+        with mock.patch.object(scraper, "initialize_driver", failing):
+            for _ in range(2):
+                with self.assertRaises(Exception):
+                    with pool.lease():
+                        pass
+
+        failing.assert_called_once()
+        self.assertEqual(pool._alive, 0)
+        pool._retry_at = 0
+        with pool.lease():
+            pass
+        self.assertEqual(len(self.drivers), 1)
+
+    def test_invalid_selector_fails_alone(self):
+        FakeDriver.pages["https://example.com/"] = FakePage(
+            elements={"#price": "<b>42</b>"})
+        site_data = [
+            browser_data("https://example.com/"),
+            scraper.SiteData(
+                "bad", "https://example.com/", "!!price",
+                fetch_mode="browser"),
+        ]
+
+        scraper.fetch_site_html(site_data, pool=self.make_pool())
+
+        self.assertEqual(
+            [data.status for data in site_data], ["ok", "error"])
+        self.assertIn("SyntaxError", site_data[1].error)
+
+    def test_failed_driver_start_is_an_error(self):
+        failing = mock.Mock(side_effect=scraper.WebDriverException("no"))
+        site_data = [browser_data("https://example.com/")]
+
+        with mock.patch.object(scraper, "initialize_driver", failing):
+            scraper.fetch_site_html(site_data, pool=self.make_pool())
+
+        self.assertEqual(site_data[0].status, "error")
+
+
+def static_fetch(seconds=0):
+    """Returns a fake fetch_http_html that waits and matches every page."""
+
+    def fetch(site_data, session=None, timeout=30):
+        time.sleep(seconds)
+        for data in site_data:
+            data.html = "<b>42</b>"
+            data.status = "ok"
+
+    return fetch
+
+
+def http_data(count, host="example.com"):
+    return [
+        scraper.SiteData(
+            str(i), "https://{}/{}".format(host, i), "#price",
+            fetch_mode="http")
+        for i in range(count)
+    ]
+
+
+def response(status_code=200, content=b"", headers=None):
+    fake = mock.Mock(
+        status_code=status_code, content=content, headers=headers or {})
+    if status_code >= 400:
+        fake.raise_for_status.side_effect = scraper.requests.HTTPError(
+            str(status_code))
+    return fake
+
+
+PAGE = b'<html><body><p id="price"><b>42</b></p><p id="slot"></p></body></html>'
+
+
+class TestBlocking(BrowserTestCase):
+    """Tests for blocking requests of rendered pages."""
+
+    def test_profiles(self):
+        self.assertEqual(scraper.blocked_urls(None), [])
+        self.assertEqual(scraper.blocked_urls("none"), [])
+        self.assertEqual(
+            scraper.blocked_urls("trackers"),
+            scraper.BLOCKED_RESOURCES["tracker"])
+        self.assertEqual(
+            scraper.blocked_urls("font, *ads.example.com*"),
+            [url for pattern in scraper.BLOCKED_RESOURCES["font"]
+             for url in [pattern, pattern + "?*"]]
+            + ["*ads.example.com*"])
+
+    def test_extensions_match_query_strings(self):
+        urls = scraper.blocked_urls(["*.png", "*.js?v=*", "*.css*"])
+
+        self.assertEqual(urls, ["*.png", "*.png?*", "*.js?v=*", "*.css*"])
+
+    def blocked(self, pool_profile=None, **kwargs):
+        data = browser_data("https://example.com/", **kwargs)
+        FakeDriver.pages["https://example.com/"] = FakePage(
+            elements={"#price": "<b>42</b>"})
+
+        scraper.fetch_browser_html(
+            [data], self.make_pool(block_profile=pool_profile))
+
+        self.assertEqual(data.status, "ok")
+        return [
+            args["urls"] for command, args in self.drivers[0].calls
+            if command == "Network.setBlockedURLs"
+        ]
+
+    def test_page_profile_is_sent(self):
+        self.assertEqual(
+            self.blocked("all", block_profile="trackers"),
+            [scraper.blocked_urls("trackers")])
+
+    def test_pool_profile_is_the_default(self):
+        self.assertEqual(
+            self.blocked("media"), [scraper.blocked_urls("media")])
+
+
+class TestGroupSiteData(unittest.TestCase):
+    """Tests for group_site_data."""
+
+    def test_groups(self):
+        site_data = [
+            scraper.SiteData("1", "https://Example.com/a", fetch_mode="auto"),
+            scraper.SiteData("2", "https://example.com/a", fetch_mode="http"),
+            scraper.SiteData("3", "https://example.com/a"),
+            scraper.SiteData("4", "https://example.com/a#y"),
+            scraper.SiteData(
+                "5", "https://example.com/a", block_profile=["*.png"]),
+            scraper.SiteData("6", "https://example.com/b", fetch_mode="http"),
+        ]
+
+        self.assertEqual(
+            [[data.id for data in page]
+             for page in scraper.group_site_data(site_data)],
+            [["1", "2"], ["3", "4"], ["5"], ["6"]])
+
+
+class TestFetchHttpHtml(unittest.TestCase):
+    """Tests for fetch_http_html."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+
+        self.session = mock.Mock()
+        self.session.get.return_value = response(
+            content=PAGE, headers={"ETag": '"v2"'})
+
+    def data(self, selector="#price", **kwargs):
+        return scraper.SiteData(
+            "a1b2", "https://example.com/", selector, fetch_mode="http",
+            **kwargs)
+
+    def test_selectors_share_one_request(self):
+        site_data = [self.data(), self.data("#missing"), self.data("p[")]
+
+        scraper.fetch_http_html(site_data, session=self.session)
+
+        self.session.get.assert_called_once()
+        self.assertEqual(
+            [(data.status, data.html) for data in site_data],
+            [("ok", "<b>42</b>"), (None, None), ("error", None)])
+        self.assertIn("Invalid selector", site_data[2].error)
+        self.assertEqual(site_data[0].etag, '"v2"')
+        self.assertEqual(site_data[0].content_length, len(PAGE))
+
+    def test_conditional_request(self):
+        self.session.get.return_value = response(304)
+        data = self.data(etag='"v1"', last_modified="Mon, 1 Jan 2024")
+
+        scraper.fetch_http_html(data, session=self.session)
+
+        headers = self.session.get.call_args[1]["headers"]
+        self.assertEqual(headers["If-None-Match"], '"v1"')
+        self.assertEqual(headers["If-Modified-Since"], "Mon, 1 Jan 2024")
+        self.assertEqual(data.status, "not_modified")
+        self.assertIsNone(data.html)
+
+    def test_different_validators_are_not_sent(self):
+        site_data = [self.data(etag='"v1"'), self.data(etag='"v0"')]
+
+        scraper.fetch_http_html(site_data, session=self.session)
+
+        self.assertNotIn(
+            "If-None-Match", self.session.get.call_args[1]["headers"])
+
+    def test_empty_match_is_a_placeholder_in_auto_mode(self):
+        site_data = [self.data("#slot"), self.data("#slot")]
+        site_data[1].fetch_mode = "auto"
+
+        scraper.fetch_http_html(site_data, session=self.session)
+
+        self.assertEqual(
+            [data.status for data in site_data], ["ok", None])
+
+
+class TestFetchModes(BrowserTestCase):
+    """Tests for fetching pages in http and auto modes."""
+
+    def fetch(self, site_data, page=PAGE, status_code=200):
+        FakeDriver.pages["https://example.com/"] = FakePage(
+            elements={"#slot": "<b>rendered</b>"})
+        get = mock.Mock(return_value=response(status_code, page))
+        with mock.patch.object(scraper.requests.Session, "get", get):
+            scraper.fetch_site_html(site_data, pool=self.make_pool(size=1))
+        return get
+
+    def data(self, selector, fetch_mode):
+        return scraper.SiteData(
+            selector, "https://example.com/", selector, fetch_mode=fetch_mode)
+
+    def test_auto_uses_http_when_the_selector_matches(self):
+        data = self.data("#price", "auto")
+
+        self.fetch([data])
+
+        self.assertEqual(
+            (data.status, data.html, data.fetch_mode),
+            ("ok", "<b>42</b>", "http"))
+        self.assertEqual(self.drivers, [])
+
+    def test_auto_falls_back_to_the_browser(self):
+        site_data = [self.data("#slot", "auto"), self.data("#slot", "http")]
+
+        get = self.fetch(site_data)
+
+        get.assert_called_once()
+        self.assertEqual(
+            (site_data[0].status, site_data[0].html, site_data[0].fetch_mode),
+            ("ok", "<b>rendered</b>", "browser"))
+        self.assertEqual(site_data[1].status, "ok")
+
+    def test_fallback_keeps_blocking_profiles(self):
+        site_data = [self.data("#slot", "auto"), self.data("#slot", "auto")]
+        site_data[1].block_profile = ["*.png"]
+
+        with mock.patch.object(
+                scraper, "_render_sites",
+                side_effect=scraper._render_sites) as render_sites:
+            get = self.fetch(site_data)
+
+        get.assert_called_once()
+        rendered = [
+            page for call in render_sites.call_args_list
+            for page in call[0][0]]
+        self.assertEqual(
+            sorted(len(page) for page in rendered), [1, 1])
+        self.assertEqual(
+            [data.html for data in site_data], ["<b>rendered</b>"] * 2)
+
+    def test_http_mode_does_not_fall_back(self):
+        data = self.data("#missing", "http")
+
+        self.fetch([data])
+
+        self.assertEqual(
+            (data.status, data.error),
+            ("error", "Selector did not match the page"))
+        self.assertEqual(self.drivers, [])
+
+    def test_failed_request_falls_back_in_auto_mode(self):
+        site_data = [self.data("#slot", "auto"), self.data("#slot", "http")]
+
+        self.fetch(site_data, status_code=503)
+
+        self.assertEqual(site_data[0].html, "<b>rendered</b>")
+        self.assertEqual(
+            (site_data[1].status, site_data[1].error), ("error", "503"))
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Tests for RateLimiter."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+
+        patcher = mock.patch.object(scraper.time, "monotonic")
+        self.clock = patcher.start()
+        self.clock.return_value = 100.0
+        self.addCleanup(patcher.stop)
+
+    def test_no_limit(self):
+        limiter = scraper.RateLimiter()
+
+        self.assertEqual(
+            [limiter.reserve("example.com") for _ in range(3)], [0, 0, 0])
+
+    def test_loads_are_spaced_by_rate(self):
+        limiter = scraper.RateLimiter(rate=2)
+
+        self.assertEqual(
+            [limiter.reserve("example.com") for _ in range(3)], [0, 0.5, 1.0])
+
+    def test_bucket_refills(self):
+        limiter = scraper.RateLimiter(rate=2)
+        limiter.reserve("example.com")
+        self.clock.return_value = 100.5
+
+        self.assertEqual(limiter.reserve("example.com"), 0)
+        self.assertEqual(limiter.reserve("example.com"), 0.5)
+
+    def test_burst(self):
+        limiter = scraper.RateLimiter(rate=1, burst=2)
+
+        self.assertEqual(
+            [limiter.reserve("example.com") for _ in range(3)], [0, 0, 1.0])
+
+    def test_hosts_have_own_buckets(self):
+        limiter = scraper.RateLimiter(rate=1, host_rates={
+            "Fast.example.com": 4, "free.example.com": None})
+
+        self.assertEqual(limiter.reserve("example.com"), 0)
+        self.assertEqual(limiter.reserve("example.com"), 1.0)
+        self.assertEqual(limiter.reserve("fast.example.com"), 0)
+        self.assertEqual(limiter.reserve("FAST.example.com"), 0.25)
+        self.assertEqual(limiter.reserve("free.example.com"), 0)
+        self.assertEqual(limiter.reserve("free.example.com"), 0)
+
+    def test_configure(self):
+        limiter = scraper.RateLimiter(rate=1)
+        limiter.configure(rate=None, host_rates={"Example.com": 2})
+
+        self.assertEqual(limiter.reserve("other.com"), 0)
+        self.assertEqual(limiter.reserve("other.com"), 0)
+        self.assertEqual(limiter.reserve("example.com"), 0)
+        self.assertEqual(limiter.reserve("example.com"), 0.5)
+
+
+class TestFetchLimiter(unittest.TestCase):
+    """Tests for FetchLimiter."""
+
+    def test_limits_are_shared_across_event_loops(self):
+        limiter = scraper.FetchLimiter(concurrency=2, per_host=1)
+        peak = []
+
+        async def hold():
+            async with limiter.slot():
+                peak.append(limiter.active)
+                await asyncio.sleep(0.05)
+
+        async def hold_all():
+            await asyncio.gather(hold(), hold(), hold())
+
+        def run():
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(hold_all())
+            loop.close()
+
+        threads = [threading.Thread(target=run) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(peak), 6)
+        self.assertEqual(max(peak), 2)
+        self.assertEqual(limiter.active, 0)
+
+    def test_host_slots(self):
+        limiter = scraper.FetchLimiter(concurrency=10, per_host=1)
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        loop.run_until_complete(limiter.acquire("example.com"))
+        loop.run_until_complete(limiter.acquire("other.com"))
+
+        waiter = asyncio.ensure_future(
+            limiter.acquire("example.com"), loop=loop)
+        loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertFalse(waiter.done())
+        limiter.release("example.com")
+        loop.run_until_complete(asyncio.wait_for(waiter, 1))
+        self.assertEqual(limiter.hosts, {"example.com": 1, "other.com": 1})
+
+    def test_shared_limiter_is_reconfigured(self):
+        limiter = scraper.get_fetch_limiter(3, 1)
+
+        self.assertIs(scraper.get_fetch_limiter(5, 2), limiter)
+        self.assertEqual((limiter.concurrency, limiter.per_host), (5, 2))
+
+
+class TestFetchSiteHtml(unittest.TestCase):
+    """Tests for fetching with the shared limits and thread pool."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+
+        self.pool = mock.Mock(size=1, tabs=1)
+
+    def test_shared_executor_grows(self):
+        executor = scraper._shared_fetch_executor(2)
+
+        self.assertIs(scraper._shared_fetch_executor(1), executor)
+        self.assertIs(scraper._shared_fetch_executor(50), executor)
+        self.assertGreaterEqual(executor._max_workers, 50)
+
+    def test_concurrent_calls_with_different_sizes(self):
+        results = {}
+
+        def run(concurrency):
+            site_data = http_data(6, "host{}.com".format(concurrency))
+            scraper.fetch_site_html(
+                site_data, pool=self.pool, concurrency=concurrency,
+                per_host=6)
+            results[concurrency] = [data.status for data in site_data]
+
+        with mock.patch.object(
+                scraper, "fetch_http_html", static_fetch(0.05)):
+            threads = [
+                threading.Thread(target=run, args=(concurrency,))
+                for concurrency in [10, 5, 20]
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+
+        self.assertEqual(results, {
+            concurrency: ["ok"] * 6 for concurrency in [10, 5, 20]})
+        self.assertEqual(scraper.get_fetch_limiter().active, 0)
+
+    def test_concurrency_is_shared_across_calls(self):
+        active = []
+        lock = threading.Lock()
+
+        def fetch(site_data, session=None, timeout=30):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.pop()
+            static_fetch()(site_data)
+
+        peak = []
+        with mock.patch.object(scraper, "fetch_http_html", fetch):
+            threads = [
+                threading.Thread(target=scraper.fetch_site_html, args=(
+                    http_data(4, "host{}.com".format(i)),),
+                    kwargs={"pool": self.pool, "concurrency": 2})
+                for i in range(3)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+
+        self.assertEqual(len(peak), 12)
+        self.assertEqual(max(peak), 2)
+
+    def test_failed_fetch_is_reported(self):
+        site_data = http_data(3)
+
+        with mock.patch.object(
+                scraper, "_fetch_static", side_effect=RuntimeError("boom")):
+            scraper.fetch_site_html(site_data, pool=self.pool)
+
+        self.assertEqual(
+            [(data.status, data.error) for data in site_data],
+            [("error", "boom")] * 3)
+        self.assertEqual(scraper.get_fetch_limiter().active, 0)
+
+
+class TestIterSiteHtml(unittest.TestCase):
+    """Tests for streaming fetched SiteData."""
+
+    def fetch(self, site_data, session=None, timeout=30):
+        time.sleep(0.5 if "slow" in site_data[0].link else 0)
+        static_fetch()(site_data)
+
+    def test_sites_are_yielded_as_they_finish(self):
+        site_data = http_data(1, "slow.com") + http_data(2, "fast.com")
+        started = time.time()
+        results = []
+
+        with mock.patch.object(scraper, "fetch_http_html", self.fetch):
+            for data in scraper.iter_site_html(
+                    site_data, pool=mock.Mock(size=1, tabs=1)):
+                results.append((data.link, time.time() - started))
+
+        self.assertEqual(
+            sorted(link for link, _ in results[:2]),
+            ["https://fast.com/0", "https://fast.com/1"])
+        self.assertEqual(results[2][0], "https://slow.com/0")
+        self.assertLess(results[1][1], 0.4)
+
+    def test_batches(self):
+        site_data = http_data(1, "slow.com") + http_data(2, "fast.com")
+
+        with mock.patch.object(scraper, "fetch_http_html", self.fetch):
+            batches = list(scraper.iter_site_html(
+                site_data, pool=mock.Mock(size=1, tabs=1), batch=True))
+
+        self.assertEqual(
+            sorted(data.link for batch in batches for data in batch),
+            sorted(data.link for data in site_data))
+        self.assertEqual([data.link for data in batches[-1]], [
+            "https://slow.com/0"])
+
+
+class TestReadiness(BrowserTestCase):
+    """Tests for when a rendered page is scraped."""
+
+    def render(self, page, **kwargs):
+        FakeDriver.pages["https://example.com/"] = page
+        data = browser_data("https://example.com/", **kwargs)
+        started = time.time()
+        scraper.fetch_browser_html([data], self.make_pool())
+        return data, time.time() - started
+
+    def test_selector_waits_for_parsed_document(self):
+        data, elapsed = self.render(
+            FakePage(load=5, parse=0.3, elements={"#price": "<b>42</b>"}))
+
+        self.assertEqual((data.status, data.html), ("ok", "<b>42</b>"))
+        self.assertGreaterEqual(elapsed, 0.3)
+        self.assertLess(elapsed, 2)
+
+    def test_placeholder_is_not_collected_before_load(self):
+        data, elapsed = self.render(FakePage(load=5, elements={
+            "#price": lambda t: "" if t < 0.35 else "<b>42</b>"}))
+
+        self.assertEqual(data.html, "<b>42</b>")
+        self.assertLess(elapsed, 2)
+
+    def test_changing_match_is_collected_after_load(self):
+        data, elapsed = self.render(FakePage(load=0.6, elements={
+            "#price": lambda t: "{:.3f}".format(t)}))
+
+        self.assertEqual(data.status, "ok")
+        self.assertGreaterEqual(float(data.html), 0.6)
+
+    def test_network_idle(self):
+        data, elapsed = self.render(
+            FakePage(load=0.2, elements={"#price": "<b>42</b>"}),
+            wait_for="network_idle")
+
+        self.assertEqual(data.status, "ok")
+        self.assertGreaterEqual(elapsed, 0.2 + scraper.NETWORK_IDLE_TIME)
+
+    def test_time_budget(self):
+        data, elapsed = self.render(FakePage(load=5), timeout=0.5)
+
+        self.assertEqual(data.status, "timeout")
+        self.assertLess(elapsed, 1.5)
+
+    def test_budget_starts_when_tab_is_navigated(self):
+        FakeDriver.pages["https://slow.com/"] = FakePage(
+            load=0.8, elements={"#price": lambda t: None if t < 0.8 else "1"})
+        FakeDriver.pages["https://fast.com/"] = FakePage(
+            load=0.4, elements={"#price": lambda t: None if t < 0.4 else "2"})
+        site_data = [
+            browser_data("https://slow.com/", timeout=1),
+            browser_data("https://fast.com/", timeout=1),
+        ]
+
+        # The fast page waits for the only driver longer than its
+        # budget, but still has its whole budget to load.
+        scraper.fetch_site_html(site_data, pool=self.make_pool(size=1))
+
+        self.assertEqual([data.html for data in site_data], ["1", "2"])
+        self.assertGreater(
+            site_data[1].timings["fetch"], site_data[1].timeout)
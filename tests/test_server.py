@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+"""Tests for `netwatch.server` module."""
+
+
+import json
+import threading
+import unittest
+from http.server import HTTPServer
+from unittest import mock
+
+import requests
+
+from netwatch import common, server
+from netwatch.models import Alert, Update
+
+
+def make_alert(**kwargs):
+    return Alert(
+        "a1b2", "Price", "", "changed", "https://example.com", "#price",
+        "0" * 32, False, "", "text/plain", "* * * * *", **kwargs)
+
+
+class ServerTestCase(unittest.TestCase):
+    """Serves the API on a free port with a mocked store."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+
+        self.store = mock.Mock()
+        self.store.update_alert.side_effect = (
+            lambda alert_id, **values: make_alert())
+        patcher = mock.patch.object(server, "store", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        httpd = HTTPServer(("localhost", 0), server._MyHandler)
+        thread = threading.Thread(target=httpd.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+        self.url = "http://localhost:{}".format(httpd.server_address[1])
+
+    def request(self, method, path, params=None):
+        return requests.request(
+            method, self.url + path, params=params, timeout=5)
+
+
+class TestUpdateAlert(ServerTestCase):
+    """Tests for PUT /alerts."""
+
+    def test_round_tripped_alert_keeps_types(self):
+        alert = make_alert(
+            last_checked=1600000000.5, unchanged_checks=3, jitter=30,
+            adaptive=True, content_length=1024, etag='"abc"').to_json()
+
+        response = self.request("PUT", "/alerts/a1b2", alert)
+
+        self.assertEqual(response.status_code, 200)
+        alert_id, values = (
+            self.store.update_alert.call_args[0][0],
+            self.store.update_alert.call_args[1])
+        self.assertEqual(alert_id, "a1b2")
+        self.assertEqual(values["timeout"], 30.0)
+        self.assertEqual(values["wait_delay"], 0.0)
+        self.assertEqual(values["jitter"], 30.0)
+        self.assertIs(values["adaptive"], True)
+        self.assertIs(values["email"], False)
+        self.assertEqual(values["selector"], "#price")
+        for key in server.SERVER_FIELDS + ["id"]:
+            self.assertNotIn(key, values)
+
+    def test_optional_values_can_be_cleared(self):
+        self.request("PUT", "/alerts/a1b2", {
+            "jitter": "None", "similarity_threshold": "", "adaptive": "None"})
+
+        self.assertEqual(self.store.update_alert.call_args[1], {
+            "jitter": None, "similarity_threshold": None, "adaptive": None})
+
+    def test_normalize_is_parsed(self):
+        rules = {"strip_attributes": ["nonce"], "drop_comments": True}
+
+        response = self.request(
+            "PUT", "/alerts/a1b2", {"normalize": json.dumps(rules)})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.store.update_alert.call_args[1], {"normalize": rules})
+
+    def test_invalid_values_are_rejected(self):
+        for params in [
+            {"normalize": ["strip_attributes", "drop_comments"]},
+            {"normalize": "{not json"},
+            {"normalize": json.dumps({"drop_everything": True})},
+            {"normalize": json.dumps(["drop_comments"])},
+            {"timeout": "soon"},
+            {"adaptive": "yes"},
+            {"fetch_mode": "telnet"},
+            {"frequency": "every minute"},
+        ]:
+            with self.subTest(params=params):
+                response = self.request("PUT", "/alerts/a1b2", params)
+
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.content, b"")
+        self.store.update_alert.assert_not_called()
+
+    def test_unknown_alert(self):
+        self.store.update_alert.side_effect = KeyError("c3d4")
+
+        response = self.request("PUT", "/alerts/c3d4", {"name": "Price"})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class TestCreateAlert(ServerTestCase):
+    """Tests for POST /alerts."""
+
+    def test_create(self):
+        self.store.create_alert.return_value = make_alert()
+        alert = make_alert().to_json()
+        alert["normalize"] = json.dumps({"drop_comments": True})
+        alert["timeout"] = "12"
+
+        response = self.request("POST", "/alerts", alert)
+
+        self.assertEqual(response.status_code, 200)
+        values = self.store.create_alert.call_args[1]
+        self.assertEqual(values["normalize"], {"drop_comments": True})
+        self.assertEqual(values["timeout"], 12.0)
+        self.assertIsNone(values["hash"])
+        self.assertNotIn("id", values)
+
+    def test_invalid_alert_is_rejected(self):
+        self.store.create_alert.side_effect = TypeError("missing link")
+
+        response = self.request("POST", "/alerts", {"name": "Price"})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class TestDiffs(ServerTestCase):
+    """Tests for GET /diffs."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+
+        super().setUp()
+        self.update = Update(
+            "Price changed", "https://example.com", id="u1",
+            alert_id="a1b2", old_hash="old", new_hash="new")
+        self.store.get_update.side_effect = lambda update_id: (
+            self.update if update_id == "u1" else None)
+        self.snapshots = {"old": "<p>42</p>", "new": "<p>41</p>"}
+        snapshot_store = mock.Mock()
+        snapshot_store.get.side_effect = self.snapshots.get
+        for patcher in [
+            mock.patch.object(common, "store", self.store),
+            mock.patch.object(
+                common.netwatch.snapshots, "get_snapshot_store",
+                return_value=snapshot_store),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_diff_is_computed_and_cached(self):
+        response = self.request("GET", "/diffs/u1", {"mode": "text"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["mode"], "text")
+        self.assertIn("+41", response.json()["diff"])
+        self.store.set_update_diff.assert_called_once_with(
+            "u1", "text", response.json()["diff"])
+
+    def test_cached_diff(self):
+        self.update.diffs["html"] = "cached"
+
+        response = self.request("GET", "/diffs/u1")
+
+        self.assertEqual(response.json()["diff"], "cached")
+        self.store.set_update_diff.assert_not_called()
+
+    def test_missing_diffs(self):
+        del self.snapshots["old"]
+
+        for path, params in [
+            ("/diffs/u1", None), ("/diffs/u2", None),
+            ("/diffs/u1", {"mode": "pdf"}),
+        ]:
+            with self.subTest(path=path, params=params):
+                self.assertEqual(
+                    self.request("GET", path, params).status_code, 400)
+
+
+class TestGuiRoundTrip(ServerTestCase):
+    """Tests for Alerts edited in the GUI."""
+
+    def test_edited_alert_is_sent_back(self):
+        from netwatch.ui import util
+
+        send_request = requests.request
+
+        def request(method, url, params=None):
+            return send_request(
+                method, url.replace("http://localhost:9494", self.url),
+                params=params, timeout=5)
+
+        alert = make_alert(
+            normalize={"drop_comments": True}, last_checked=1600000000.5
+        ).to_json()
+        with mock.patch.object(util.requests, "request", request):
+            result = util.send(
+                "PUT", "alerts", identifier=alert["id"], params=alert)
+
+        self.assertEqual(result["id"], "a1b2")
+        values = self.store.update_alert.call_args[1]
+        self.assertEqual(values["normalize"], {"drop_comments": True})
+        self.assertNotIn("last_checked", values)
+
+
+class TestStop(unittest.TestCase):
+    """Tests for stopping the Server."""
+
+    def test_workers_get_the_shutdown_deadline(self):
+        store = mock.Mock()
+        store.get_config.return_value = 0.5
+        with mock.patch.object(server, "store", store), \
+                mock.patch.object(server.netwatch.scraper, "close_driver_pool"), \
+                mock.patch.object(server.netwatch.backend, "shutdown") as shutdown:
+            instance = server.Server(port_number=0)
+            instance.start()
+            instance.stop()
+
+        store.get_config.assert_called_once_with("shutdown_timeout", 10)
+        timeout = shutdown.call_args[1]["timeout"]
+        self.assertGreaterEqual(timeout, 0)
+        self.assertLessEqual(timeout, 0.5)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+"""Tests for `netwatch.snapshots` module."""
+
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from netwatch import snapshots
+
+
+def page(version, lines=200):
+    return "".join(
+        "<p>line {} v{}</p>\n".format(i, version if i == 100 else 0)
+        for i in range(lines))
+
+
+class TestSnapshotStore(unittest.TestCase):
+    """Tests for SnapshotStore."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def test_delta_round_trip(self):
+        store = snapshots.SnapshotStore(self.directory, delta=True)
+        for version in range(4):
+            store.put("a1b2", "hash{}".format(version), page(version))
+
+        for version in range(4):
+            self.assertEqual(
+                store.get("hash{}".format(version)), page(version))
+        self.assertEqual(store.objects["hash3"]["base"], "hash2")
+        self.assertEqual(store.objects["hash3"]["depth"], 3)
+        self.assertLess(store.objects["hash3"]["size"], store.objects[
+            "hash0"]["size"])
+
+    def test_delta_chain_is_limited(self):
+        store = snapshots.SnapshotStore(
+            self.directory, delta=True, max_chain=1)
+        for version in range(3):
+            store.put("a1b2", "hash{}".format(version), page(version))
+
+        self.assertEqual(store.objects["hash1"]["depth"], 1)
+        self.assertEqual(store.objects["hash2"]["depth"], 0)
+        self.assertEqual(store.get("hash2"), page(2))
+
+    def test_shared_content_is_stored_once(self):
+        store = snapshots.SnapshotStore(self.directory)
+        store.put("a1b2", "hash0", page(0))
+        size = store.size()
+        store.put("c3d4", "hash0", page(0))
+        store.put("a1b2", "hash0", page(0))
+
+        self.assertEqual(store.size(), size)
+        self.assertEqual(store.objects["hash0"]["refs"], 2)
+        self.assertEqual(len(store.history("a1b2")), 1)
+
+    def test_max_count(self):
+        store = snapshots.SnapshotStore(self.directory, max_count=2)
+        for version in range(4):
+            store.put("a1b2", "hash{}".format(version), page(version))
+
+        self.assertEqual(
+            [entry["hash"] for entry in store.history("a1b2")],
+            ["hash2", "hash3"])
+        self.assertIsNone(store.get("hash0"))
+        self.assertEqual(sorted(store.objects), ["hash2", "hash3"])
+        self.assertEqual(store.size(), sum(
+            info["size"] for info in store.objects.values()))
+
+    def test_max_count_keeps_delta_bases(self):
+        store = snapshots.SnapshotStore(
+            self.directory, delta=True, max_count=1)
+        for version in range(3):
+            store.put("a1b2", "hash{}".format(version), page(version))
+
+        self.assertEqual(
+            [entry["hash"] for entry in store.history("a1b2")], ["hash2"])
+        self.assertEqual(store.get("hash2"), page(2))
+        self.assertEqual(store.objects["hash0"]["refs"], 1)
+
+    def test_max_bytes_keeps_latest_snapshots(self):
+        store = snapshots.SnapshotStore(self.directory, max_bytes=1)
+        for version in range(3):
+            store.put("a1b2", "a{}".format(version), page(version))
+            store.put("c3d4", "c{}".format(version), page(version + 10))
+
+        self.assertEqual(
+            [entry["hash"] for entry in store.history("a1b2")], ["a2"])
+        self.assertEqual(
+            [entry["hash"] for entry in store.history("c3d4")], ["c2"])
+        self.assertEqual(sorted(store.objects), ["a2", "c2"])
+        self.assertEqual(store.size(), sum(
+            info["size"] for info in store.objects.values()))
+
+    def test_delete_alert(self):
+        store = snapshots.SnapshotStore(self.directory, delta=True)
+        store.put("a1b2", "hash0", page(0))
+        store.put("a1b2", "hash1", page(1))
+        store.delete_alert("a1b2")
+
+        self.assertEqual(store.objects, {})
+        self.assertEqual(store.size(), 0)
+        self.assertEqual(store.history("a1b2"), [])
+
+    def test_flush_and_reload(self):
+        store = snapshots.SnapshotStore(self.directory, delta=True)
+        store.put("a1b2", "hash0", page(0))
+        store.put("a1b2", "hash1", page(1))
+        store.flush()
+
+        reloaded = snapshots.SnapshotStore(self.directory)
+        self.assertEqual(reloaded.history("a1b2"), store.history("a1b2"))
+        self.assertEqual(reloaded.size(), store.size())
+        self.assertEqual(reloaded.get("hash1"), page(1))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+"""Tests for `netwatch.store` module."""
+
+
+import unittest
+
+from netwatch import store
+from netwatch.models import Alert, Update
+
+
+def make_alert(alert_id):
+    return Alert(
+        alert_id, alert_id, "", "changed", "https://example.com/" + alert_id,
+        "#price", "0" * 32, False, "", "html", "* * * * *")
+
+
+def make_update(alert_id, text="changed"):
+    return {
+        "text": text, "link": "https://example.com/" + alert_id,
+        "alert_id": alert_id, "old_hash": "0" * 32, "new_hash": "1" * 32,
+    }
+
+
+class TestApplyResults(unittest.TestCase):
+    """Tests for Store.apply_results."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+
+        self.store = store.Store()
+        self.store.alerts = {
+            alert_id: make_alert(alert_id) for alert_id in ["a1", "b2"]}
+        self.store.updates = [Update("old", "https://example.com/a1")]
+
+    def test_results_are_applied(self):
+        alert = self.store.alerts["a1"]
+
+        updates = self.store.apply_results(
+            {"a1": {"hash": "1" * 32, "unchanged_checks": 0},
+             "b2": {"unchanged_checks": 4}},
+            [make_update("a1", "first"), make_update("b2", "second")])
+
+        self.assertIs(self.store.alerts["a1"], alert)
+        self.assertEqual(alert.hash, "1" * 32)
+        self.assertEqual(self.store.alerts["b2"].unchanged_checks, 4)
+        self.assertEqual(
+            [update.text for update in updates], ["first", "second"])
+        self.assertTrue(all(update.id for update in updates))
+        # Updates are kept newest first.
+        self.assertEqual(
+            [update.text for update in self.store.updates],
+            ["second", "first", "old"])
+
+    def test_deleted_alerts_are_skipped(self):
+        self.store.apply_results(
+            {"c3": {"unchanged_checks": 1}, "a1": {"unchanged_checks": 2}},
+            [])
+
+        self.assertNotIn("c3", self.store.alerts)
+        self.assertEqual(self.store.alerts["a1"].unchanged_checks, 2)
+
+    def test_updates_are_limited(self):
+        self.store.apply_results(
+            {}, [make_update("a1") for _ in range(store.MAX_UPDATES + 5)])
+
+        self.assertEqual(len(self.store.updates), store.MAX_UPDATES)
+
+    def test_invalid_attribute(self):
+        with self.assertRaises(Exception):
+            self.store.apply_results({"a1": {"colour": "red"}}, [])